@@ -0,0 +1,402 @@
+'''
+Vectorized computation of the news diversity indices of analyse.R in Python.
+
+The export is loaded into categorical coded NumPy arrays (one integer code per
+value and column). Topic counts per group are computed with bincount group-bys,
+so the indices for millions of rows are computed in seconds.
+The engine keeps its count tables and updates them incrementally when new
+collection rows are appended, the whole export does not have to be regrouped.
+
+The indices correspond to the function get_diversity in analyse.R (vegan):
+    shannon: Shannon index normalized by the log of the number of topics
+    shannonRaw: Shannon index -sum(p * log(p))
+    simpson: Simpson index 1 - sum(p^2)
+    richness: number of topics with at least one article
+
+Usage:
+    python diversity.py export.csv --by website --level oberthema --out diversity.csv
+'''
+import argparse
+import csv
+from datetime import date
+
+import numpy as np
+
+
+# columns of export.csv that are coded as categories
+exportColumns = ["sourceType", "sourceCounter", "profil", "sourceDatetime",
+                 "articleCounter", "form", "place", "paywall", "oberthema", "unterthema"]
+
+class categoricalColumn:
+    '''
+    Class that represents a column as integer codes and a list of levels.
+    Levels are assigned in order of first appearance like factor levels after unique() in R.
+    '''
+
+    def __init__(self):
+        '''
+        Method to create an empty categorical column.
+        '''
+        self.levels = []
+        self.index = {}
+        self.codes = np.empty(0, dtype=np.int64)
+
+    def encode(self, values):
+        '''
+        Method to translate values into codes. Unknown values are added as new levels.
+        Only the unique values are looked up in Python, the coding itself runs at C speed.
+
+        Parameters:
+            values:
+                list of strings
+
+        Returns:
+            array of codes
+        '''
+        index = self.index
+        for value in dict.fromkeys(values):
+            if value not in index:
+                index[value] = len(self.levels)
+                self.levels.append(value)
+        return np.fromiter(map(index.__getitem__, values), dtype=np.int64, count=len(values))
+
+    def append(self, values):
+        '''
+        Method to append values to the column.
+
+        Parameters:
+            values:
+                list or array of strings
+
+        Returns:
+            array of codes of the appended values
+        '''
+        codes = self.encode(values)
+        self.codes = np.concatenate([self.codes, codes])
+        return codes
+
+    def __len__(self):
+        return len(self.codes)
+
+
+class countTable:
+    '''
+    Class that represents the topic counts of all groups of one grouping.
+    counts[g, t] is the number of articles of group g with topic t.
+    '''
+
+    def __init__(self, by, level, exclude):
+        '''
+        Parameters:
+            by:
+                tuple of the columns to group by
+            level:
+                topic column, oberthema or unterthema
+            exclude:
+                tuple of topics that are filtered before counting
+        '''
+        self.by = by
+        self.level = level
+        self.exclude = exclude
+        # group key: tuple of the codes of the columns in self.by
+        self.groupIndex = {}
+        self.groupKeys = []
+        self.counts = np.zeros((0, 0), dtype=np.int64)
+
+    def update(self, groupCodes, topicCodes, nTopics):
+        '''
+        Method to add a chunk of coded rows to the table.
+        The groups of the chunk are determined vectorized, only new groups are
+        looked up in Python. The counts are added with a single bincount.
+
+        Parameters:
+            groupCodes:
+                list of code arrays, one per column in self.by
+            topicCodes:
+                array of topic codes
+            nTopics:
+                current number of topic levels
+        '''
+        # the codes of a row are combined as a row of a matrix instead of packing them
+        # into one integer, so neither the number of columns nor of levels is limited
+        uniqueKeys, inverse = np.unique(np.stack(groupCodes, axis=1), axis=0, return_inverse=True)
+        rows = np.empty(len(uniqueKeys), dtype=np.int64)
+        for i, key in enumerate(map(tuple, uniqueKeys.tolist())):
+            row = self.groupIndex.get(key)
+            if row is None:
+                row = len(self.groupKeys)
+                self.groupIndex[key] = row
+                self.groupKeys.append(key)
+            rows[i] = row
+
+        # enlarge the table for new groups and new topics
+        nGroups = len(self.groupKeys)
+        if self.counts.shape != (nGroups, nTopics):
+            counts = np.zeros((nGroups, nTopics), dtype=np.int64)
+            counts[:self.counts.shape[0], :self.counts.shape[1]] = self.counts
+            self.counts = counts
+
+        flat = rows[inverse.reshape(-1)] * nTopics + topicCodes
+        self.counts += np.bincount(flat, minlength=nGroups *
+                                   nTopics).reshape(nGroups, nTopics)
+
+    def decodeKeys(self):
+        '''
+        Returns the codes of each group column for all groups.
+        Returns:
+            list of code arrays, one per column in self.by
+        '''
+        keys = np.asarray(self.groupKeys, dtype=np.int64).reshape(-1, len(self.by))
+        return [keys[:, i] for i in range(len(self.by))]
+
+
+class diversityEngine:
+    '''
+    Class that holds the coded export and computes the diversity indices.
+    '''
+
+    def __init__(self):
+        '''
+        Method to create an empty engine. Rows are added with append().
+        '''
+        self.columns = {name: categoricalColumn()
+                        for name in exportColumns + ["website"]}
+        # day is coded as date ordinal, it is numbered from the first day of the data on output
+        self.dayCodes = np.empty(0, dtype=np.int64)
+        self.tables = {}
+
+    @classmethod
+    def fromCsv(cls, path, chunkSize=1000000):
+        '''
+        Method to create an engine from an export file.
+
+        Parameters:
+            path:
+                path to export.csv
+            (chunkSize):
+                number of rows that are coded at once
+
+        Returns:
+            diversityEngine
+        '''
+        engine = cls()
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            chunk = []
+            for row in reader:
+                chunk.append(row)
+                if len(chunk) == chunkSize:
+                    engine.appendRows(header, chunk)
+                    chunk = []
+            if chunk:
+                engine.appendRows(header, chunk)
+        return engine
+
+    def append(self, rows):
+        '''
+        Method to add new collection rows, e.g. newly coded articles.
+        All existing count tables are updated with the new rows only.
+
+        Parameters:
+            rows:
+                list of dicts with the columns of export.csv
+        '''
+        if rows:
+            self.appendRows(exportColumns, [[row.get(name, "") for name in exportColumns]
+                                            for row in rows])
+
+    def appendRows(self, header, rows):
+        '''
+        Method to add rows given as lists in the order of header.
+
+        Parameters:
+            header:
+                list of column names
+            rows:
+                list of lists of values
+        '''
+        if not rows:
+            return
+        values = list(zip(*rows))
+        position = {name: i for i, name in enumerate(header)}
+
+        newCodes = {}
+        for name in exportColumns:
+            newCodes[name] = self.columns[name].append(values[position[name]])
+
+        # website as in analyse.R: unite(website, sourceType, sourceCounter)
+        # only the distinct pairs of codes are translated into labels
+        pairs = (newCodes["sourceType"] << 32) | newCodes["sourceCounter"]
+        uniquePairs, first, inverse = np.unique(
+            pairs, return_index=True, return_inverse=True)
+        order = np.argsort(first, kind="stable")
+        sourceTypes = self.columns["sourceType"].levels
+        sourceCounters = self.columns["sourceCounter"].levels
+        labels = [sourceTypes[pair >> 32] + "_" + sourceCounters[pair & 0xffffffff]
+                  for pair in uniquePairs[order].tolist()]
+        mapping = np.empty(len(uniquePairs), dtype=np.int64)
+        mapping[order] = self.columns["website"].encode(labels)
+        newCodes["website"] = mapping[inverse.reshape(-1)]
+        self.columns["website"].codes = np.concatenate(
+            [self.columns["website"].codes, newCodes["website"]])
+
+        newCodes["day"] = self.__days()[newCodes["sourceDatetime"]]
+        self.dayCodes = np.concatenate([self.dayCodes, newCodes["day"]])
+
+        for table in self.tables.values():
+            self.__updateTable(table, newCodes)
+
+    def __days(self):
+        '''
+        Translates the levels of sourceDatetime into date ordinals.
+        The ordinals do not depend on the rows that were appended first, so rows of
+        earlier days can be appended later.
+
+        Returns:
+            array of ordinals, indexed by the code of sourceDatetime
+        '''
+        return np.array([date.fromisoformat(level[:10]).toordinal()
+                         for level in self.columns["sourceDatetime"].levels], dtype=np.int64)
+
+    def __codes(self, name):
+        '''
+        Returns the codes of a column including the derived column day.
+        '''
+        if name == "day":
+            return self.dayCodes
+        return self.columns[name].codes
+
+    def __labels(self, name, codes):
+        '''
+        Translates codes of a column back into labels.
+        The first day of the data is day 1, as the column day in analyse.R.
+        '''
+        if name == "day":
+            return codes - (self.dayCodes.min() - 1)
+        return np.asarray(self.columns[name].levels, dtype=object)[codes]
+
+    def __updateTable(self, table, codes):
+        '''
+        Adds coded rows to a count table. Excluded topics are filtered first.
+        '''
+        topicCodes = codes[table.level]
+        mask = np.ones(len(topicCodes), dtype=bool)
+        for topic in table.exclude:
+            code = self.columns[table.level].index.get(topic)
+            if code is not None:
+                mask &= topicCodes != code
+        table.update([codes[name][mask] for name in table.by],
+                     topicCodes[mask], len(self.columns[table.level].levels))
+
+    def countTable(self, by=("website",), level="oberthema", exclude=()):
+        '''
+        Returns the count table of a grouping. The table is created at the first call
+        and afterwards kept up to date by append().
+
+        Parameters:
+            by:
+                columns to group by, e.g. ("website",) or ("profil", "day")
+            level:
+                topic column, oberthema or unterthema
+            exclude:
+                topics which are filtered, e.g. ("Corona",)
+
+        Returns:
+            countTable
+        '''
+        by = tuple([by] if isinstance(by, str) else by)
+        exclude = tuple(exclude)
+        key = (by, level, exclude)
+        if key not in self.tables:
+            for name in by + (level,):
+                if name != "day" and name not in self.columns:
+                    raise ValueError("unknown column: " + name)
+            table = countTable(by, level, exclude)
+            self.__updateTable(table, {name: self.__codes(name)
+                                       for name in set(by + (level,))})
+            self.tables[key] = table
+        return self.tables[key]
+
+    def diversity(self, by=("website",), level="oberthema", exclude=()):
+        '''
+        Method to calculate Shannon, Simpson and richness for each group.
+        Shannon is normalized by the log of the number of topics that occur in the
+        (filtered) data, as in get_diversity of analyse.R.
+
+        Parameters:
+            by:
+                columns to group by, e.g. ("website",) or ("profil", "day")
+            level:
+                topic column, oberthema or unterthema
+            exclude:
+                topics which are filtered, e.g. ("Corona",)
+
+        Returns:
+            dict of arrays with the group columns and
+            n, richness, shannonRaw, shannon, simpson
+        '''
+        table = self.countTable(by, level, exclude)
+        counts = table.counts.astype(np.float64)
+        n = counts.sum(axis=1)
+        p = counts / np.where(n > 0, n, 1)[:, None]
+        logP = np.log(np.where(p > 0, p, 1))
+        shannonRaw = -(p * logP).sum(axis=1)
+        nTopics = int((table.counts.sum(axis=0) > 0).sum())
+
+        result = {}
+        for name, codes in zip(table.by, table.decodeKeys()):
+            result[name] = self.__labels(name, codes)
+        result["n"] = n.astype(np.int64)
+        result["richness"] = (table.counts > 0).sum(axis=1)
+        result["shannonRaw"] = shannonRaw
+        result["shannon"] = shannonRaw / \
+            np.log(nTopics) if nTopics > 1 else np.zeros_like(shannonRaw)
+        result["simpson"] = 1 - (p ** 2).sum(axis=1)
+        return result
+
+
+def writeCsv(result, path):
+    '''
+    Writes the result of diversityEngine.diversity() to a csv file.
+
+    Parameters:
+        result:
+            dict of arrays
+        path:
+            path of the csv file
+    '''
+    names = list(result)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        for row in zip(*(result[name] for name in names)):
+            writer.writerow(row)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("export", nargs="?", default="export.csv")
+    parser.add_argument("--by", default="website",
+                        help="comma separated group columns, e.g. profil,day")
+    parser.add_argument("--level", default="oberthema")
+    parser.add_argument("--exclude", default="",
+                        help="comma separated topics to filter, e.g. Corona")
+    parser.add_argument("--out")
+    args = parser.parse_args()
+
+    engine = diversityEngine.fromCsv(args.export)
+    exclude = [topic for topic in args.exclude.split(",") if topic]
+    result = engine.diversity(args.by.split(","), args.level, exclude)
+
+    if args.out:
+        writeCsv(result, args.out)
+    else:
+        names = list(result)
+        print("\t".join(names))
+        for row in zip(*(result[name] for name in names)):
+            print("\t".join(str(value) for value in row))
+
+
+if __name__ == "__main__":
+    main()
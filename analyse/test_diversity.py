@@ -0,0 +1,56 @@
+'''
+Regression tests of the group keys of diversity.py.
+
+Usage:
+    python -m pytest test_diversity.py
+'''
+import os
+
+import numpy as np
+
+from diversity import diversityEngine
+
+
+exportPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "export.csv")
+
+
+def row(profil, sourceDatetime, oberthema, unterthema):
+    return {"sourceType": "wn", "sourceCounter": "1", "profil": profil,
+            "sourceDatetime": sourceDatetime, "articleCounter": "1", "form": "",
+            "place": "", "paywall": "False", "oberthema": oberthema, "unterthema": unterthema}
+
+
+def test_fourColumnGrouping():
+    engine = diversityEngine.fromCsv(exportPath)
+    by = ("website", "profil", "day", "oberthema")
+    result = engine.diversity(by, "unterthema")
+
+    assert result["n"].sum() == len(engine.dayCodes)
+    groups = set(zip(*(result[name].tolist() for name in by)))
+    assert len(groups) == len(result["n"])
+    # oberthema is a column of the group and the labels are the original values
+    assert set(result["oberthema"].tolist()) <= set(engine.columns["oberthema"].levels)
+    assert result["day"].min() == 1
+
+
+def test_appendEarlierDay():
+    engine = diversityEngine()
+    engine.append([row("a", "2021-03-29 10:00:00", "Corona", "Lage"),
+                   row("b", "2021-03-29 11:00:00", "Sport", "Fussball")])
+    table = engine.countTable(("profil", "day"), "oberthema")
+    engine.append([row("a", "2021-03-27 10:00:00", "Sport", "Fussball"),
+                   row("b", "2021-03-30 11:00:00", "Corona", "Lage")])
+
+    result = engine.diversity(("profil", "day"), "oberthema")
+    days = dict(zip(zip(result["profil"].tolist(), result["day"].tolist()), result["n"].tolist()))
+    assert days == {("a", 3): 1, ("b", 3): 1, ("a", 1): 1, ("b", 4): 1}
+    assert engine.countTable(("profil", "day"), "oberthema") is table
+    # the incrementally updated table equals a table built from all rows
+    rebuilt = diversityEngine()
+    rebuilt.append([row("a", "2021-03-29 10:00:00", "Corona", "Lage"),
+                    row("b", "2021-03-29 11:00:00", "Sport", "Fussball"),
+                    row("a", "2021-03-27 10:00:00", "Sport", "Fussball"),
+                    row("b", "2021-03-30 11:00:00", "Corona", "Lage")])
+    expected = rebuilt.diversity(("profil", "day"), "oberthema")
+    assert np.array_equal(np.sort(expected["n"]), np.sort(result["n"]))
+    assert sorted(zip(expected["profil"].tolist(), expected["day"].tolist())) == sorted(days)
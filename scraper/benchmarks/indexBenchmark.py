@@ -0,0 +1,117 @@
+'''
+Benchmark of the typical read queries of the analysis with and without indexes.
+Each query is executed once with the query planner (using the indexes created
+by databaseInterface.createIndexes) and once forced to a collection scan.
+The winning plan and the execution statistics of explain are printed.
+
+The benchmark uses the database configured in config.py.
+It must be called from the folder of main.py:
+    python -m benchmarks.indexBenchmark
+'''
+import time
+
+from scraper.storageInterfaces import databaseInterface
+
+from config.config import config
+
+
+def planStages(plan):
+    '''
+    Returns all stages of a query plan from top to bottom, e.g. FETCH, IXSCAN
+    '''
+    stages = [plan["stage"]]
+    for child in plan.get("inputStages", []) + [plan.get("inputStage")]:
+        if child:
+            stages += planStages(child)
+    return stages
+
+
+def explainQuery(collection, query, sort, hint=None):
+    '''
+    Executes explain for a query and returns the relevant statistics.
+
+    Parameters:
+        collection:
+            pymongo collection
+        query:
+            MongoDB filter
+        sort:
+            sort of the query
+        (hint):
+            index hint, {"$natural": 1} forces a collection scan
+
+    Returns:
+        dict with stages, docsExamined, keysExamined, returned, millis
+    '''
+    cursor = collection.find(query).sort(sort)
+    if hint:
+        cursor = cursor.hint(hint)
+    explanation = cursor.explain()
+    stats = explanation["executionStats"]
+    return {"stages": "->".join(planStages(explanation["queryPlanner"]["winningPlan"])),
+            "docsExamined": stats["totalDocsExamined"],
+            "keysExamined": stats["totalKeysExamined"],
+            "returned": stats["nReturned"],
+            "millis": stats["executionTimeMillis"]}
+
+
+def benchmarkQueries(databaseInterfaceInstance):
+    '''
+    Returns the queries of the benchmark as (name, collection, query, sort).
+    The filter values are taken from the newest documents in the database.
+    '''
+    client = databaseInterfaceInstance.client
+    queries = []
+
+    for database in ["googleNews", "flipBoard"]:
+        newest = client[database].source.find_one(
+            {}, {"profil": 1, "sessionNr": 1, "time": 1}, sort=[("time", -1)])
+        if newest is None:
+            continue
+        queries.append((database + " pages of profile and session", client[database].source,
+                        {"profil": newest.get("profil"), "sessionNr": newest.get("sessionNr")},
+                        [("time", -1)]))
+        queries.append((database + " pages since time", client[database].source,
+                        {"time": {"$gte": newest["time"]}}, [("time", -1)]))
+
+        if database == "googleNews":
+            tile = client.googleNews.tiles.find_one({"sourceId": newest["_id"]})
+            queries.append(("googleNews tiles of page", client.googleNews.tiles,
+                            {"sourceId": newest["_id"]}, [("tileNr", 1)]))
+            if tile:
+                queries.append(("googleNews articles of tile", client.googleNews.articles,
+                                {"tileId": tile["_id"]}, [("articleNr", 1)]))
+        else:
+            queries.append(("flipBoard articles of page", client.flipBoard.articles,
+                            {"sourceID": newest["_id"]}, [("articleNr", 1)]))
+
+    for database in ["spiegel", "westfaelischeNachrichten"]:
+        newest = client[database].source.find_one({}, {"time": 1}, sort=[("time", -1)])
+        if newest is None:
+            continue
+        queries.append((database + " articles of feed", client[database].articles,
+                        {"sourceID": newest["_id"]}, [("articleNr", 1)]))
+
+    return queries
+
+
+def main():
+    databaseInterfaceInstance = databaseInterface.databaseInterface(
+        config["dbAdress"], config["dbPort"], config["profileName"])
+
+    start = time.time()
+    databaseInterfaceInstance.createIndexes()
+    print("indexes created in %.2f s" % (time.time() - start))
+
+    row = "%-45s %-10s %-22s %12s %12s %10s %8s"
+    print(row % ("query", "mode", "plan", "docsExamined",
+                 "keysExamined", "returned", "ms"))
+    for name, collection, query, sort in benchmarkQueries(databaseInterfaceInstance):
+        for mode, hint in [("index", None), ("collscan", {"$natural": 1})]:
+            result = explainQuery(collection, query, sort, hint)
+            print(row % (name, mode, result["stages"], result["docsExamined"],
+                         result["keysExamined"], result["returned"], result["millis"]))
+
+
+if __name__ == "__main__":
+    main()
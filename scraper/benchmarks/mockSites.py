@@ -0,0 +1,129 @@
+'''
+Local mock versions of the websites used by the personalizer.
+The pages contain the elements the personalizer waits for (search fields and result
+lists with the same XPaths), so a session can be executed without the real websites.
+
+Start a server for manual tests from the folder of main.py:
+    python -m benchmarks.mockSites --port 8765
+'''
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from html import escape
+import threading
+import argparse
+
+
+# number of result elements of the search result pages
+resultCount = 10
+
+
+def page(title, body):
+    return ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>%s</title></head>'
+            '<body>%s</body></html>' % (escape(title), body))
+
+
+def searchForm(action, inputHtml):
+    return '<form action="%s" method="get">%s</form>' % (action, inputHtml)
+
+
+def results(template, path, query):
+    return "".join(template % {"href": "%s?item=%s&q=%s" % (path, i, escape(query)), "nr": i}
+                   for i in range(resultCount))
+
+
+def renderPage(path, query):
+    '''
+    Returns the html of a mock page or None if the path is unknown.
+
+    Parameters:
+        path:
+            path of the request
+        query:
+            search term of the request
+    '''
+    if path == "/youtube/":
+        return page("YouTube", searchForm("/youtube/results", '<input id="search" name="search_query">'))
+    if path == "/youtube/results":
+        return page("YouTube", results(
+            '<ytd-video-renderer><a href="%(href)s">Video %(nr)s</a></ytd-video-renderer>', "/youtube/watch", query))
+    if path == "/youtube/watch":
+        return page("Video", '<button aria-label="Wiedergabe">Play</button><video></video>')
+
+    if path == "/amazon/":
+        return page("Amazon", searchForm("/amazon/s", '<input id="twotabsearchtextbox" name="k">'))
+    if path == "/amazon/s":
+        return page("Amazon", results(
+            '<div data-component-type="s-search-result"><a href="%(href)s">Product %(nr)s</a></div>', "/amazon/dp", query))
+
+    if path == "/google/":
+        return page("Google", searchForm("/google/search", '<input name="q">'))
+    if path == "/google/search":
+        return page("Google", results('<div class="g"><a href="%(href)s">Result %(nr)s</a></div>', "/google/result", query))
+
+    if path == "/ebay/":
+        return page("eBay", searchForm("/ebay/sch", '<input class="gh-tb ui-autocomplete-input" name="_nkw">'))
+    if path == "/ebay/sch":
+        return page("eBay", "<ul>%s</ul>" % results(
+            '<li class="s-item"><a href="%(href)s">Item %(nr)s</a></li>', "/ebay/itm", query))
+
+    if path in ("/news/", "/flipboard/", "/ads/"):
+        return page("News", "".join('<p style="height:300px">Article %s</p>' % i for i in range(20)))
+
+    if path.startswith(("/amazon/dp", "/google/result", "/ebay/itm", "/website/")):
+        return page("Result", "<h1>%s</h1><p>%s</p>" % (escape(path), escape(query)))
+    return None
+
+
+class mockSiteHandler(BaseHTTPRequestHandler):
+    '''
+    Answers the requests of the browser with the mock pages
+    '''
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parameters = parse_qs(url.query)
+        query = next(iter(parameters.values()), [""])[0]
+        html = renderPage(url.path, query)
+        body = (html or page("Not found", "")).encode()
+        self.send_response(200 if html else 404)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def siteUrls(port):
+    '''
+    Returns the siteUrls of the personalizer for a mock server on localhost
+    '''
+    base = "http://127.0.0.1:%s" % port
+    return {"youtube": base + "/youtube/", "amazon": base + "/amazon/", "google": base + "/google/",
+            "ebay": base + "/ebay/", "googleNews": base + "/news/", "flipboard": base + "/flipboard/",
+            "adsSettings": base + "/ads/", "location": base + "/website/location"}
+
+
+def startServer(port=0):
+    '''
+    Starts a mock server in a background thread.
+
+    Parameters:
+        (port):
+            port of the server, 0 for a free port
+
+    Returns:
+        ThreadingHTTPServer, its port is server.server_address[1]
+    '''
+    server = ThreadingHTTPServer(("127.0.0.1", port), mockSiteHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="mock sites of the personalizer")
+    parser.add_argument("--port", type=int, default=8765)
+    port = parser.parse_args().port
+    print("serving mock sites, siteUrls:", siteUrls(port))
+    ThreadingHTTPServer(("127.0.0.1", port), mockSiteHandler).serve_forever()
@@ -0,0 +1,127 @@
+'''
+Benchmark of the overlap computation of all profile pairs.
+Synthetic snapshots (ranked article URLs of a page per profile and window) are compared
+    strings: Python sets and lists of canonical URL strings, pair by pair
+    engine: interned IDs, bitsets and rank matrices of the overlapEngine, all pairs at once
+The canonicalization of the URLs is needed by both and is not measured, the interning is
+printed separately. The results of both are compared.
+
+The benchmark needs no database or network.
+It must be called from the folder of main.py:
+    python -m benchmarks.overlapBenchmark --profiles 12 --windows 200
+'''
+import argparse
+import random
+import time
+
+import numpy as np
+
+from scraper.analysis import overlapEngine
+
+
+def syntheticSnapshots(profiles, windows, articles, seed=1):
+    '''
+    Returns windows x profiles ranked URL lists. The profiles of a window share most articles
+    in a slightly different order, every window has new articles.
+    '''
+    generator = random.Random(seed)
+    snapshots = []
+    for window in range(windows):
+        pool = ["https://www.publisher%s.de/politik/artikel-%s-%s.html?utm_source=google" %
+                (i % 40, window, i) for i in range(articles * 2)]
+        snapshots.append([sorted(generator.sample(pool, articles),
+                                 key=lambda url: pool.index(url) + generator.random() * 10)
+                          for _ in range(profiles)])
+    return snapshots
+
+
+def stringRbo(first, second, persistence):
+    '''
+    Extrapolated rank-biased overlap of two ranked lists at the depth of the shorter list
+    '''
+    depth = min(len(first), len(second))
+    if depth == 0:
+        return np.nan
+    seenFirst, seenSecond = set(), set()
+    overlap = 0
+    total = 0.0
+    for d in range(1, depth + 1):
+        a, b = first[d - 1], second[d - 1]
+        if a == b:
+            overlap += 1
+        else:
+            overlap += (a in seenSecond) + (b in seenFirst)
+        seenFirst.add(a)
+        seenSecond.add(b)
+        total += overlap / d * persistence ** d
+    return overlap / depth * persistence ** depth + (1 - persistence) / persistence * total
+
+
+def compareStrings(window, persistence):
+    '''
+    Returns the Jaccard and RBO matrices of a window of canonical URL lists computed with strings
+    '''
+    sets = [set(urls) for urls in window]
+    jaccard = [[len(a & b) / len(a | b) if a | b else np.nan for b in sets] for a in sets]
+    rbo = [[stringRbo(a, b, persistence) for b in window] for a in window]
+    return np.array(jaccard), np.array(rbo)
+
+
+def compareEngine(window, persistence):
+    '''
+    Returns the Jaccard and RBO matrices of a window of ranked ID arrays computed with the
+    overlapEngine functions
+    '''
+    ranks, lengths = overlapEngine.rankMatrix(window)
+    return (overlapEngine.jaccardMatrix(overlapEngine.bitsets(ranks, lengths)),
+            overlapEngine.rboMatrix(ranks, lengths, persistence))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="overlap of all profile pairs")
+    parser.add_argument("--profiles", type=int, default=12)
+    parser.add_argument("--windows", type=int, default=200)
+    parser.add_argument("--articles", type=int, default=80,
+                        help="articles per page")
+    parser.add_argument("--persistence", type=float, default=0.9)
+    args = parser.parse_args()
+
+    snapshots = syntheticSnapshots(args.profiles, args.windows, args.articles)
+    # the canonical URLs are needed by both and are not measured
+    canonical = []
+    for window in snapshots:
+        lists = []
+        for ranked in window:
+            urls = []
+            for url in map(overlapEngine.canonicalUrl, ranked):
+                if url not in urls:
+                    urls.append(url)
+            lists.append(urls)
+        canonical.append(lists)
+
+    start = time.perf_counter()
+    expected = [compareStrings(window, args.persistence) for window in canonical]
+    stringSeconds = time.perf_counter() - start
+
+    urls = overlapEngine.urlIndex()
+    start = time.perf_counter()
+    interned = [[urls.ranked(ranked) for ranked in window] for window in canonical]
+    internSeconds = time.perf_counter() - start
+    start = time.perf_counter()
+    computed = [compareEngine(window, args.persistence) for window in interned]
+    engineSeconds = time.perf_counter() - start
+
+    difference = max(max(np.nanmax(np.abs(e[0] - c[0])), np.nanmax(np.abs(e[1] - c[1])))
+                     for e, c in zip(expected, computed))
+    pairs = args.windows * args.profiles * args.profiles
+    print("%s windows, %s profiles, %s articles per page, %s pairs" %
+          (args.windows, args.profiles, args.articles, pairs))
+    print("strings %8.3f s" % stringSeconds)
+    print("engine  %8.3f s (+ %.3f s interning)" % (engineSeconds, internSeconds))
+    print("speedup %.1fx, with interning %.1fx, maximum difference %.2e, %s interned URLs" % (
+        stringSeconds / engineSeconds, stringSeconds / (engineSeconds + internSeconds),
+        difference, len(urls)))
+
+
+if __name__ == "__main__":
+    main()
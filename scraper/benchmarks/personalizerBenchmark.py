@@ -0,0 +1,100 @@
+'''
+Offline end-to-end benchmark of the personalizer.
+A headless Firefox executes sessions against the local mock sites (benchmarks/mockSites.py).
+All waiting times are shortened by the compression factor of the sleepPolicy, so a session
+with nominal dwell times of many minutes runs in seconds.
+
+Printed are the driver overhead (createDriver, closeDriver) and the duration of every
+session element type, real and nominal.
+
+Firefox and the geckodriver are required, no database or network.
+It must be called from the folder of main.py:
+    python -m benchmarks.personalizerBenchmark --compression 200 --sessions 2
+'''
+import statistics
+import argparse
+import tempfile
+import time
+import os
+
+from scraper.personalizer import personalizer, sleepPolicy
+from benchmarks import mockSites
+
+
+def benchmarkSession(port):
+    '''
+    Returns a session with every element type on the mock sites
+    '''
+    return [{"type": "website", "link": "http://127.0.0.1:%s/website/page" % port},
+            {"type": "youtubeSearch", "searchTerm": "nachrichten"},
+            {"type": "googleSearch", "searchTerm": "wetter münster"},
+            {"type": "amazonSearch", "searchTerm": "kaffeemaschine"},
+            {"type": "ebaySearch", "searchTerm": "fahrrad"}]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="offline personalizer benchmark")
+    parser.add_argument("--compression", type=float, default=200,
+                        help="factor by which all waiting times are shortened")
+    parser.add_argument("--sessions", type=int, default=2)
+    parser.add_argument("--window", action="store_true",
+                        help="show the browser window")
+    args = parser.parse_args()
+
+    server = mockSites.startServer()
+    port = server.server_address[1]
+    policy = sleepPolicy.sleepPolicy(args.compression, seed=1)
+
+    # profile and profile copy of closeDriver are written to a temporary folder
+    workingDirectory = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workingDirectory, "profiles", "benchmark"))
+    os.chdir(workingDirectory)
+
+    start = time.time()
+    personalizerInstance = personalizer.personalizer(
+        workingDirectory + "/profiles/", "Mozilla/5.0 (X11; Linux x86_64; rv:88.0) Gecko/20100101 Firefox/88.0",
+        "benchmark", sleepPolicyInstance=policy, siteUrls=mockSites.siteUrls(port),
+        headless=not args.window)
+    createSeconds = time.time() - start
+
+    durations = {}
+    errors = 0
+    sessionStart = time.time()
+    for _ in range(args.sessions):
+        for entry in benchmarkSession(port):
+            elementStart = time.time()
+            nominalStart = policy.nominal
+            output = personalizerInstance.performSession([entry], False)[0]
+            durations.setdefault(entry["type"], []).append(
+                (time.time() - elementStart, policy.nominal - nominalStart))
+            if "error" in output:
+                errors += 1
+                print("%s failed: %s" % (entry["type"], output["error"]))
+    sessionSeconds = time.time() - sessionStart
+
+    newsStart = time.time()
+    personalizerInstance.accessGoogleNews()
+    newsSeconds = time.time() - newsStart
+
+    start = time.time()
+    personalizerInstance.closeDriver()
+    closeSeconds = time.time() - start
+    server.shutdown()
+
+    elements = sum(len(d) for d in durations.values())
+    print("compression %.0f" % args.compression)
+    print("createDriver  %6.2f s (real)" % createSeconds)
+    print("closeDriver   %6.2f s (real)" % closeSeconds)
+    print("accessGoogleNews %6.2f s (real)" % newsSeconds)
+    print("%-14s %10s %12s" % ("element", "real s", "nominal s"))
+    for elementType, values in durations.items():
+        print("%-14s %10.2f %12.0f" % (elementType,
+                                       statistics.mean(v[0] for v in values),
+                                       statistics.mean(v[1] for v in values)))
+    print("%s elements in %.1f s, %.2f elements per second, %s errors" % (
+        elements, sessionSeconds, elements / sessionSeconds, errors))
+    print("slept %.1f s for %.0f nominal seconds" % (policy.slept, policy.nominal))
+
+
+if __name__ == "__main__":
+    main()
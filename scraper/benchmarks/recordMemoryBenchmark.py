@@ -0,0 +1,134 @@
+'''
+Benchmark of the memory retained per collected Google News page.
+A synthetic Google News page is collected with GoogleNewsPage, the downloads of the
+articles are answered from memory. The memory held after the collection is measured
+with tracemalloc for
+    records: the tileRecords and article records of GoogleNewsPage, parse trees released
+    dicts: the former representation, dicts per tile and article while the page and every
+        article element keep their BeautifulSoup tree and article html
+
+The benchmark needs no database or network.
+It must be called from the folder of main.py:
+    python -m benchmarks.recordMemoryBenchmark
+'''
+from bs4 import BeautifulSoup
+import urllib.request
+import http.client
+import tracemalloc
+import argparse
+import io
+
+from scraper.newsPages import googleNewsPage
+from scraper.records import pageRecords
+
+
+def syntheticPage(tiles, articlesPerTile):
+    '''
+    Returns the html of a Google News page with the given number of tiles and a panorama area.
+    '''
+    def article(i):
+        return ('<article><a href="./articles/a%s">Headline %s</a>'
+                '<time datetime="2020-05-01T10:00:00Z">vor 1 Stunde</time>'
+                '<div class="source">Publisher %s</div></article>' % (i, i, i))
+
+    parts = ['<html><body><div class="lBwEZb BL5WZb xP6mwf">']
+    nr = 0
+    for _ in range(tiles):
+        parts.append('<div class="NiLAwe">')
+        for _ in range(articlesPerTile):
+            parts.append(article(nr))
+            nr += 1
+        parts.append('</div>')
+    parts.append('</div><div class="ndSf3d eDrqsc eVhOjb XWHGK j7vNaf Pz9Pcd a8arzf">')
+    for _ in range(6):
+        parts.append(article(nr))
+        nr += 1
+    parts.append('</div></body></html>')
+    return "".join(parts)
+
+
+class fakeResponse(io.BytesIO):
+    '''
+    Response of the patched urlopen
+    '''
+
+    def __init__(self, data, url):
+        super().__init__(data)
+        self.url = url
+        self.headers = http.client.HTTPMessage()
+        self.headers["Content-Type"] = "text/html; charset=utf-8"
+
+
+def fakeUrlopen(articleSize):
+    '''
+    Returns a replacement of urllib.request.urlopen which answers the referrer pages
+    with a link to the article and the articles with articleSize bytes of html.
+    '''
+    body = ("<p>" + "Lorem ipsum dolor sit amet. " * (articleSize // 28) + "</p>")
+
+    def urlopen(request, timeout=None):
+        url = request.full_url if hasattr(request, "full_url") else request
+        if "news.google" in url:
+            html = '<html><a jsname="tljFtd" href="https://example.org/%s">x</a></html>' % abs(
+                hash(url))
+        else:
+            html = "<html><body><h1>%s</h1>%s</body></html>" % (url, body)
+        return fakeResponse(html.encode(), url)
+    return urlopen
+
+
+def collectRecords(html):
+    '''
+    Collects the page with the current classes and returns everything held until the page is saved.
+    '''
+    page = googleNewsPage.GoogleNewsPage(html)
+    return page, page.getAllArticles()
+
+
+def collectDicts(html):
+    '''
+    Collects the page and keeps the former representation: dicts per tile and article,
+    the parse tree of the page and a parse tree and the html of every article element.
+    '''
+    page, tiles = collectRecords(html)
+    page.soup = BeautifulSoup(html, 'html.parser')
+    elements = [str(element) for element in page.soup.find_all("article")]
+    keptElements = [(element, BeautifulSoup(element, 'html.parser')) for element in elements]
+    return page, [pageRecords.toDocument(tile) for tile in tiles], keptElements
+
+
+def measure(function, html):
+    '''
+    Returns the memory in bytes retained by the result of function(html)
+    '''
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = function(html)
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+    return retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description="memory per collected Google News page")
+    parser.add_argument("--tiles", type=int, default=30)
+    parser.add_argument("--articles", type=int, default=3,
+                        help="articles per tile")
+    parser.add_argument("--articleSize", type=int, default=20000,
+                        help="bytes of html per article")
+    args = parser.parse_args()
+
+    urllib.request.urlopen = fakeUrlopen(args.articleSize)
+    googleNewsPage.time.sleep = lambda seconds: None
+    html = syntheticPage(args.tiles, args.articles)
+
+    results = {"dicts": measure(collectDicts, html),
+               "records": measure(collectRecords, html)}
+    for name, retained in results.items():
+        print("%-8s %8.1f KiB per page" % (name, retained / 1024))
+    print("reduction %.1f%%" % (100 * (1 - results["records"] / results["dicts"])))
+
+
+if __name__ == "__main__":
+    main()
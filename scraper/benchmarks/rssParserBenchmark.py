@@ -0,0 +1,127 @@
+'''
+Benchmark of the RSS parsers: feedParser.parseFast against feedparser.
+Both parsers read the same recorded feeds, the parse time per feed is printed and
+the link and published date of every entry are compared.
+
+By default the last recorded feeds of the default feeds (rssCollector.defaultFeeds) are
+loaded from the database configured in config.py. Alternatively feeds are read from files
+or generated (no database needed).
+It must be called from the folder of main.py:
+    python -m benchmarks.rssParserBenchmark --recorded 20
+    python -m benchmarks.rssParserBenchmark --files spiegel.rss wn.rss
+    python -m benchmarks.rssParserBenchmark --synthetic
+'''
+from datetime import datetime, timedelta
+from html import escape
+import statistics
+import argparse
+import time
+
+import feedparser
+
+from scraper.rssFeeds import feedParser, rssCollector
+from scraper.fetching import rawPage
+
+
+def syntheticFeed(name, entries):
+    '''
+    Returns the bytes of an RSS 2.0 feed like the recorded feeds, with descriptions and enclosures
+    '''
+    published = datetime(2020, 5, 1, 10)
+    items = []
+    for i in range(entries):
+        date = (published - timedelta(minutes=7 * i)).strftime("%a, %d %b %Y %H:%M:%S +0200")
+        items.append(
+            '<item><title>%s Schlagzeile %s &amp; mehr</title>'
+            '<link>https://www.example.org/%s/artikel-%s.html</link>'
+            '<guid isPermaLink="false">%s-%s</guid><pubDate>%s</pubDate>'
+            '<description><![CDATA[<p>%s</p>]]></description>'
+            '<enclosure type="image/jpeg" url="https://www.example.org/%s/bild-%s.jpg"/>'
+            '<content:encoded><![CDATA[<p>%s</p>]]></content:encoded></item>' % (
+                name, i, name, i, name, i, date, escape("Anreißer Text " * 20), name, i,
+                escape("Artikeltext " * 100)))
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<rss version="2.0" xmlns:content="http://purl.org/rss/1.0/modules/content/">'
+            '<channel><title>%s</title><link>https://www.example.org/</link>%s</channel></rss>'
+            % (name, "".join(items))).encode("utf-8")
+
+
+def recordedFeeds(count):
+    '''
+    Returns the last count recorded feeds of every default feed from the database as (name, bytes)
+    '''
+    from scraper.storageInterfaces import databaseInterface
+    from config.config import config
+
+    databaseInterfaceInstance = databaseInterface.databaseInterface(
+        config["dbAdress"], config["dbPort"], config["profileName"])
+    feeds = []
+    for feed in rssCollector.defaultFeeds:
+        sources = databaseInterfaceInstance.client[feed["database"]]["source"].find(
+            {}, {"rss": 1}).sort("time", -1).limit(count)
+        for source in sources:
+            rss = source["rss"]
+            feeds.append((feed["name"], rss if isinstance(rss, bytes) else rawPage.decode(rss)))
+    return feeds
+
+
+def measure(parse, body, repetitions):
+    '''
+    Returns the median seconds of parse(body) and the parsed feed
+    '''
+    durations = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        feed = parse(body)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations), feed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RSS parsers: parseFast against feedparser")
+    parser.add_argument("--recorded", type=int, default=10,
+                        help="number of recorded feeds per default feed loaded from the database")
+    parser.add_argument("--files", nargs="+", help="files of recorded feeds")
+    parser.add_argument("--synthetic", action="store_true",
+                        help="generated feeds like the recorded ones instead of the database")
+    parser.add_argument("--repetitions", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.files:
+        feeds = []
+        for path in args.files:
+            with open(path, "rb") as file:
+                feeds.append((path, file.read()))
+    elif args.synthetic:
+        feeds = [(feed["name"], syntheticFeed(feed["name"], 60))
+                 for feed in rssCollector.defaultFeeds]
+    else:
+        feeds = recordedFeeds(args.recorded)
+
+    totals = {"fast": 0.0, "feedparser": 0.0}
+    mismatches = 0
+    print("%-20s %8s %8s %12s %12s %8s" %
+          ("feed", "KiB", "entries", "fast ms", "feedparser ms", "speedup"))
+    for name, body in feeds:
+        fastSeconds, fastFeed = measure(feedParser.parse, body, args.repetitions)
+        slowSeconds, slowFeed = measure(feedparser.parse, body, args.repetitions)
+        totals["fast"] += fastSeconds
+        totals["feedparser"] += slowSeconds
+        expected = [(e.get("link"), e.get("published")) for e in slowFeed["entries"]]
+        parsed = [(e.get("link"), e.get("published")) for e in fastFeed["entries"]]
+        if parsed != expected:
+            mismatches += 1
+            print("%s: entries differ from feedparser" % name)
+        print("%-20s %8.1f %8s %12.2f %12.2f %7.1fx%s" % (
+            name[-20:], len(body) / 1024, len(fastFeed["entries"]), fastSeconds * 1000,
+            slowSeconds * 1000, slowSeconds / fastSeconds,
+            "" if fastFeed["parser"] == "fast" else " (fallback)"))
+
+    if feeds:
+        print("total: fast %.1f ms, feedparser %.1f ms, speedup %.1fx, %s feeds differ" % (
+            totals["fast"] * 1000, totals["feedparser"] * 1000,
+            totals["feedparser"] / totals["fast"], mismatches))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+'''
+Benchmark of the topic classifier.
+Synthetic articles are generated from the topics of export.csv: every topic has its own
+words, mixed with words shared by all topics. The classifier is trained on the coded
+part and the throughput of vectorizing and predicting is measured on one core.
+
+The benchmark needs no database or network.
+It must be called from the folder of main.py:
+    python -m benchmarks.topicClassifierBenchmark --articles 20000
+'''
+import argparse
+import random
+import time
+import zlib
+import csv
+
+from scraper.analysis import topicClassifier
+
+
+def codedRows(exportPath):
+    '''
+    Returns the coded rows of export.csv
+    '''
+    with open(exportPath, newline="", encoding="utf-8") as file:
+        return list(csv.DictReader(file))
+
+
+def syntheticText(row, generator, words):
+    '''
+    Returns an article text of about words words for a coded row
+    '''
+    sharedWords = ["die", "der", "und", "in", "mit", "nach", "heute", "stadt", "land", "menschen",
+                   "jahr", "woche", "sagte", "neue", "gibt", "mehr", "zwei", "rund", "seit", "immer"]
+    topicWords = {target: ["w%x%s" % (zlib.crc32(row[target].encode()), i) for i in range(30)]
+                  for target in topicClassifier.targets if row.get(target)}
+    tokens = []
+    for _ in range(words):
+        target = generator.choice(list(topicWords) + [None] * (2 * len(topicWords) + 1))
+        tokens.append(generator.choice(topicWords[target]) if target else generator.choice(sharedWords))
+    return " ".join(tokens)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="throughput of the topic classifier")
+    parser.add_argument("--export", default="../analyse/export.csv")
+    parser.add_argument("--articles", type=int, default=20000,
+                        help="number of classified articles")
+    parser.add_argument("--words", type=int, default=400,
+                        help="words per article")
+    parser.add_argument("--batchSize", type=int, default=2000)
+    args = parser.parse_args()
+
+    generator = random.Random(1)
+    rows = codedRows(args.export)
+    texts = [syntheticText(row, generator, args.words) for row in rows]
+
+    start = time.perf_counter()
+    classifier = topicClassifier.topicClassifier()
+    classifier.fit(texts, rows)
+    trainSeconds = time.perf_counter() - start
+
+    newRows = [generator.choice(rows) for _ in range(args.articles)]
+    newTexts = [syntheticText(row, generator, args.words) for row in newRows]
+    start = time.perf_counter()
+    predictions = []
+    for first in range(0, len(newTexts), args.batchSize):
+        predictions += classifier.predict(newTexts[first:first + args.batchSize])
+    seconds = time.perf_counter() - start
+
+    print("trained on %s coded rows in %.1f s" % (len(rows), trainSeconds))
+    print("%s articles of %s words in %.2f s: %.0f articles per second" %
+          (len(newTexts), args.words, seconds, len(newTexts) / seconds))
+    for target in classifier.models:
+        correct = sum(p[target]["label"] == row[target] for p, row in zip(predictions, newRows))
+        print("%-10s accuracy %.3f" % (target, correct / len(newRows)))
+    lowConfidence = sum(p["confidence"] < 0.5 for p in predictions)
+    print("%s articles with confidence < 0.5" % lowConfidence)
+
+
+if __name__ == "__main__":
+    main()
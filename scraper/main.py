@@ -1,18 +1,29 @@
 import logging
 import argparse
-from datetime import datetime
+import os
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import pymongo
 
 
 from scraper.newsPages import googleNewsPage, flipboardPage
-from scraper.rssFeeds import spiegelRss, wnRss
+from scraper.rssFeeds import spiegelRss, wnRss, rssCollector
 from scraper.storageInterfaces import databaseInterface
 from scraper.personalizer import personalizer
+from scraper.extraction import articleExtractor
+from scraper.clustering import storyClusterer
+from scraper.daemon import workerDaemon, jobQueue
+from scraper.screenshots import screenshotStore
+from scraper.analysis import overlapEngine, topicClassifier, adInterests
+from scraper.runs import runDeadline, resourceSampler, runLogging, runCheckpoint
 
 from config.config import config
 from config.websiteList import sessions
 
 
-def googleNews(personalizerInstance,  databaseInterfaceInstance, sessionNr):
+def googleNews(personalizerInstance,  databaseInterfaceInstance, sessionNr, extractionPoolInstance=None,
+               deadlineInstance=None, checkpointInstance=None):
     '''
     Method to retrieve and store all articles on Google News.
     It calls Google News, translates the page into structured information
@@ -34,16 +45,137 @@ def googleNews(personalizerInstance,  databaseInterfaceInstance, sessionNr):
         sessionNr:
             Number of one of the session that was executed directly before calling Google News.
 
+        (extractionPoolInstance):
+            extractionPool to extract text and metadata of the articles during the download.
+
+        (deadlineInstance):
+            runDeadline of the run for the stages capture, downloads and save.
+
+        (checkpointInstance):
+            runCheckpoint of the run. A page saved by an earlier attempt of the run is skipped.
+
     '''
+    deadlineInstance = deadlineInstance or runDeadline.runDeadline()
+    googleNewsCheckpoint = pageCheckpoint(checkpointInstance, "googleNews")
+    if pageSaved(googleNewsCheckpoint):
+        return
+
+    # mit scrollHarvest werden die Kacheln schrittweise beim Scrollen ausgelesen
+    googleNewsSource = capture(deadlineInstance, "Google News", personalizerInstance.accessGoogleNews,
+                               googleNewsCheckpoint, harvest=config.get("scrollHarvest"))
+    saveGoogleNews(googleNewsSource, databaseInterfaceInstance,
+                   sessionNr, extractionPoolInstance, deadlineInstance, googleNewsCheckpoint)
 
-    googleNewsSource = personalizerInstance.accessGoogleNews()
-    googleNewsInstance = googleNewsPage.GoogleNewsPage(
-        googleNewsSource["html"])
-    databaseInterfaceInstance.saveGoogleNewsPage(
-        googleNewsInstance.getAllArticles(), googleNewsSource, sessionNr)
 
+def capture(deadlineInstance, name, access, checkpointInstance=None, **parameters):
+    '''
+    Method to capture a page with the browser in the stage capture of the deadline.
+    With checkpoints, the captured source is stored and a page captured by an earlier attempt
+    of the run is not captured again.
 
-def flipBoard(personalizerInstance,  databaseInterfaceInstance, sessionNr):
+    Parameters:
+        deadlineInstance:
+            runDeadline of the run
+        name:
+            name of the page for the log
+        access:
+            method of the personalizer which opens the page, e.g. accessGoogleNews
+        (checkpointInstance):
+            runCheckpoint.pageCheckpoint of the page
+        (parameters):
+            parameters of access
+
+    Returns:
+        source dict of access
+
+    Raises:
+        runDeadline.deadlineExceeded if the run reached a deadline before or during the capture
+    '''
+    if checkpointInstance is not None:
+        source = checkpointInstance.captured()
+        if source is not None:
+            logging.info(name + " restored from checkpoint")
+            return source
+    deadlineInstance.check("capture of " + name)
+    with deadlineInstance.stage("capture"):
+        source = access(**parameters)
+    if source is None:
+        # der Browser wurde bei Erreichen der Deadline geschlossen
+        deadlineInstance.check("capture of " + name)
+    if checkpointInstance is not None:
+        checkpointInstance.saveCapture(source)
+    return source
+
+
+def pageCheckpoint(checkpointInstance, page):
+    '''
+    Returns the runCheckpoint.pageCheckpoint of a page, None for a run without checkpoints
+
+    Parameters:
+        checkpointInstance:
+            runCheckpoint of the run or None
+        page:
+            name of the page, one of runCheckpoint.pageDatabases
+    '''
+    return checkpointInstance.page(page) if checkpointInstance is not None else None
+
+
+def pageSaved(pageCheckpointInstance):
+    '''
+    Returns True if a page was saved by an earlier attempt of the run, so it is skipped
+
+    Parameters:
+        pageCheckpointInstance:
+            runCheckpoint.pageCheckpoint of the page or None
+    '''
+    if pageCheckpointInstance is None or not pageCheckpointInstance.saved():
+        return False
+    logging.info("%s already saved in run %s" % (pageCheckpointInstance.name, pageCheckpointInstance.run.runId))
+    return True
+
+
+def saveGoogleNews(googleNewsSource, databaseInterfaceInstance, sessionNr, extractionPoolInstance=None,
+                   deadlineInstance=None, checkpointInstance=None):
+    '''
+    Method to translate a captured Google News page into structured information and store it.
+    The articles are downloaded over HTTP, the browser is not needed, so this can run
+    in a background thread while the browser continues.
+    If the downloads reach their deadline, the articles downloaded so far are stored and the
+    page is marked as incomplete.
+
+    Parameters:
+        googleNewsSource:
+            source dict of personalizer.accessGoogleNews
+        databaseInterfaceInstance:
+            The instance of the databaseinterface class to be used for storing the data.
+        sessionNr:
+            Number of one of the session that was executed directly before calling Google News.
+        (extractionPoolInstance):
+            extractionPool to extract text and metadata of the articles during the download.
+        (deadlineInstance):
+            runDeadline of the run for the stages downloads and save.
+        (checkpointInstance):
+            runCheckpoint.pageCheckpoint of the page, the downloaded articles are stored in it
+    '''
+    deadlineInstance = deadlineInstance or runDeadline.runDeadline()
+    with deadlineInstance.stage("downloads") as downloads:
+        googleNewsInstance = googleNewsPage.GoogleNewsPage(
+            googleNewsSource["html"], extractionPoolInstance, googleNewsSource.pop("items", None), downloads,
+            config.get("decodeGoogleLinks", True), checkpointInstance)
+        tiles = googleNewsInstance.getAllArticles()
+    if googleNewsInstance.incomplete:
+        googleNewsSource["incomplete"] = True
+    if googleNewsInstance.decodeLinks:
+        googleNewsSource["linkDecoding"] = googleNewsInstance.linkStats.report()
+    with deadlineInstance.stage("save"):
+        sourceId = databaseInterfaceInstance.saveGoogleNewsPage(
+            tiles, googleNewsSource, sessionNr)
+    if checkpointInstance is not None:
+        checkpointInstance.markSaved(sourceId)
+
+
+def flipBoard(personalizerInstance,  databaseInterfaceInstance, sessionNr, extractionPoolInstance=None,
+              deadlineInstance=None, checkpointInstance=None):
     '''
     Method to call and save all articles on Flipboard.
     It calls Flipboard, translates the page into structured information
@@ -64,17 +196,70 @@ def flipBoard(personalizerInstance,  databaseInterfaceInstance, sessionNr):
         sessionNr:
             Number of one of the session that was running right before Flipboard was called.
 
+        (extractionPoolInstance):
+            extractionPool to extract text and metadata of the articles during the download.
+
+        (deadlineInstance):
+            runDeadline of the run for the stages capture, downloads and save.
+
+        (checkpointInstance):
+            runCheckpoint of the run. A page saved by an earlier attempt of the run is skipped.
+
     '''
+    deadlineInstance = deadlineInstance or runDeadline.runDeadline()
+    flipboardCheckpoint = pageCheckpoint(checkpointInstance, "flipBoard")
+    if pageSaved(flipboardCheckpoint):
+        return
 
-    flipboardSource = personalizerInstance.accessFlipboard()
-    flipboardInstance = flipboardPage.flipboard_page(flipboardSource["html"])
-    databaseInterfaceInstance.saveFlipboardPage(
-        flipboardInstance.getAllArticles(), flipboardSource, sessionNr)
+    flipboardSource = capture(deadlineInstance, "Flipboard", personalizerInstance.accessFlipboard,
+                              flipboardCheckpoint, harvest=config.get("scrollHarvest"))
+    saveFlipboard(flipboardSource, databaseInterfaceInstance,
+                  sessionNr, extractionPoolInstance, deadlineInstance, flipboardCheckpoint)
 
 
-def googleNewsAndFlipboard(personalizerInstance,  databaseInterfaceInstance, sessionNr):
+def saveFlipboard(flipboardSource, databaseInterfaceInstance, sessionNr, extractionPoolInstance=None,
+                  deadlineInstance=None, checkpointInstance=None):
+    '''
+    Method to translate a captured Flipboard page into structured information and store it.
+    The articles are downloaded over HTTP, the browser is not needed.
+    If the downloads reach their deadline, the articles downloaded so far are stored and the
+    page is marked as incomplete.
+
+    Parameters:
+        flipboardSource:
+            source dict of personalizer.accessFlipboard
+        databaseInterfaceInstance:
+            The instance of the databaseinterface class to be used for storing the data.
+        sessionNr:
+            Number of one of the session that was running right before Flipboard was called.
+        (extractionPoolInstance):
+            extractionPool to extract text and metadata of the articles during the download.
+        (deadlineInstance):
+            runDeadline of the run for the stages downloads and save.
+        (checkpointInstance):
+            runCheckpoint.pageCheckpoint of the page, the downloaded articles are stored in it
+    '''
+    deadlineInstance = deadlineInstance or runDeadline.runDeadline()
+    with deadlineInstance.stage("downloads") as downloads:
+        flipboardInstance = flipboardPage.flipboard_page(
+            flipboardSource["html"], extractionPoolInstance, flipboardSource.pop("items", None), downloads,
+            checkpointInstance)
+        articles = flipboardInstance.getAllArticles()
+    if flipboardInstance.incomplete:
+        flipboardSource["incomplete"] = True
+    with deadlineInstance.stage("save"):
+        sourceId = databaseInterfaceInstance.saveFlipboardPage(
+            articles, flipboardSource, sessionNr)
+    if checkpointInstance is not None:
+        checkpointInstance.markSaved(sourceId)
+
+
+def googleNewsAndFlipboard(personalizerInstance,  databaseInterfaceInstance, sessionNr, extractionPoolInstance=None,
+                           deadlineInstance=None, checkpointInstance=None):
     '''
     Method to access Google News and Flipboard one by one.
+    With pipelineDownloads from config.py the articles of Google News are downloaded and
+    saved in the background while the browser accesses Flipboard.
     Parameters:
         personalizerInstance :
             The instance of the personalizer class to use for personalization.
@@ -87,13 +272,55 @@ def googleNewsAndFlipboard(personalizerInstance,  databaseInterfaceInstance, ses
 
         sessionNr:
             Number of one of the sessions that was executed directly before calling GoogleNews.
-    '''
 
-    googleNews(personalizerInstance,  databaseInterfaceInstance, sessionNr)
-    flipBoard(personalizerInstance,  databaseInterfaceInstance, sessionNr)
+        (extractionPoolInstance):
+            extractionPool to extract text and metadata of the articles during the download.
 
+        (deadlineInstance):
+            runDeadline of the run for the stages capture, downloads and save.
 
-def wn(databaseInterfaceInstance):
+        (checkpointInstance):
+            runCheckpoint of the run. Pages saved by an earlier attempt of the run are skipped.
+    '''
+    deadlineInstance = deadlineInstance or runDeadline.runDeadline()
+
+    if not config.get("pipelineDownloads"):
+        googleNews(personalizerInstance,  databaseInterfaceInstance,
+                   sessionNr, extractionPoolInstance, deadlineInstance, checkpointInstance)
+        flipBoard(personalizerInstance,  databaseInterfaceInstance,
+                  sessionNr, extractionPoolInstance, deadlineInstance, checkpointInstance)
+        return
+
+    # die Downloads von Google News laufen im Hintergrund, während der Browser Flipboard aufruft
+    harvest = config.get("scrollHarvest")
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="download")
+    futures = []
+    googleNewsCheckpoint = pageCheckpoint(checkpointInstance, "googleNews")
+    flipboardCheckpoint = pageCheckpoint(checkpointInstance, "flipBoard")
+    try:
+        if not pageSaved(googleNewsCheckpoint):
+            googleNewsSource = capture(deadlineInstance, "Google News", personalizerInstance.accessGoogleNews,
+                                       googleNewsCheckpoint, harvest=harvest)
+            futures.append(executor.submit(saveGoogleNews, googleNewsSource, databaseInterfaceInstance,
+                                           sessionNr, extractionPoolInstance, deadlineInstance,
+                                           googleNewsCheckpoint))
+        if not pageSaved(flipboardCheckpoint):
+            flipboardSource = capture(deadlineInstance, "Flipboard", personalizerInstance.accessFlipboard,
+                                      flipboardCheckpoint, harvest=harvest)
+            futures.append(executor.submit(saveFlipboard, flipboardSource, databaseInterfaceInstance,
+                                           sessionNr, extractionPoolInstance, deadlineInstance,
+                                           flipboardCheckpoint))
+    finally:
+        # bereits erfasste Seiten werden auch bei einem Fehler des Browsers gespeichert
+        executor.shutdown(wait=True)
+        for future in futures:
+            if future.exception():
+                logging.error("page could not be saved: " + repr(future.exception()))
+    for future in futures:
+        future.result()
+
+
+def wn(databaseInterfaceInstance, extractionPoolInstance=None, deadlineInstance=None):
     '''
     Method for collecting the RSS feed of the Westfälische Nachrichten. 
     The RSS feed is downloaded and stored in the database. 
@@ -106,14 +333,23 @@ def wn(databaseInterfaceInstance):
 
         sessionNr:
             Number of one of the sessions that was executed directly before calling GoogleNews.
+
+        (extractionPoolInstance):
+            extractionPool to extract text and metadata of the articles during the download.
+
+        (deadlineInstance):
+            runDeadline of the run for the stages downloads and save.
     '''
 
-    rssInstance = wnRss.wnRss()
-    databaseInterfaceInstance.saveWNRss(
-        rssInstance.getAllArticles(), rssInstance.getRssData())
+    deadlineInstance = deadlineInstance or runDeadline.runDeadline()
+    rssInstance = wnRss.wnRss(extractionPoolInstance)
+    with deadlineInstance.stage("downloads") as downloads:
+        articles = rssInstance.getAllArticles(downloads)
+    with deadlineInstance.stage("save"):
+        databaseInterfaceInstance.saveWNRss(articles, rssInstance.getRssData())
 
 
-def spiegel(databaseInterfaceInstance):
+def spiegel(databaseInterfaceInstance, extractionPoolInstance=None, deadlineInstance=None):
     '''
     Method for collecting the RSS feed from Spiegel Online. 
     The RSS feed is downloaded and stored in the database. 
@@ -126,18 +362,54 @@ def spiegel(databaseInterfaceInstance):
 
         sessionNr:
             Number of one of the sessions that was executed directly before calling GoogleNews.
+
+        (extractionPoolInstance):
+            extractionPool to extract text and metadata of the articles during the download.
+
+        (deadlineInstance):
+            runDeadline of the run for the stages downloads and save.
+    '''
+
+    deadlineInstance = deadlineInstance or runDeadline.runDeadline()
+    rssInstance = spiegelRss.spiegelRss(extractionPoolInstance)
+    with deadlineInstance.stage("downloads") as downloads:
+        articles = rssInstance.getAllArticles(downloads)
+    with deadlineInstance.stage("save"):
+        databaseInterfaceInstance.saveSpiegelRss(articles, rssInstance.getRssData())
+
+
+def rss(databaseInterfaceInstance, extractionPoolInstance=None, deadlineInstance=None):
+    '''
+    Method for collecting all RSS feeds configured in config.py under rssFeeds.
+    The feeds are collected at the same time, each feed is stored in its own database.
+    A report of the run over all feeds is stored in the database.
+
+    Parameters:
+        databaseInterfaceInstance:
+            The instance of the databaseinterface class to be used for storing the data.
+
+        (extractionPoolInstance):
+            extractionPool to extract text and metadata of the articles during the download.
+
+        (deadlineInstance):
+            runDeadline of the run for the stages downloads and save of every feed.
     '''
 
-    rssInstance = spiegelRss.spiegelRss()
-    databaseInterfaceInstance.saveSpiegelRss(
-        rssInstance.getAllArticles(), rssInstance.getRssData())
+    feeds = config.get("rssFeeds", rssCollector.defaultFeeds)
+    collectorInstance = rssCollector.rssCollector(
+        feeds, databaseInterfaceInstance, extractionPoolInstance, config.get("rssParallelism", 4),
+        deadlineInstance)
+    databaseInterfaceInstance.saveRssReport(collectorInstance.collect())
 
 
-def testPersonalization(personalizerInstance,  databaseInterfaceInstance, sessionNr):
+def testPersonalization(personalizerInstance,  databaseInterfaceInstance, sessionNr, deadlineInstance=None,
+                        checkpointInstance=None):
     '''
     Method for collecting the interests in the Google News account settings. 
     The account settings of the Google profile are accessed and the source code of the profile is
     stored in the database.
+    The interests are parsed from the page and stored as change against the previous snapshot
+    of the profile (see databaseInterface.saveInterests).
 
     Parameters:
         databaseInterfaceInstance:
@@ -146,88 +418,566 @@ def testPersonalization(personalizerInstance,  databaseInterfaceInstance, sessio
 
         sessionNr:
             Number of one of the sessions that was executed directly before calling GoogleNews.
-    '''
 
-    adProfileHtml = personalizerInstance.getGoogleAdProfile()
-    databaseInterfaceInstance.savePersonalizationProfile(
+        (deadlineInstance):
+            runDeadline of the run for the stage capture.
+
+        (checkpointInstance):
+            runCheckpoint of the run. A profile saved by an earlier attempt of the run is skipped.
+    '''
+    adProfileCheckpoint = pageCheckpoint(checkpointInstance, "adProfile")
+    if pageSaved(adProfileCheckpoint):
+        return
+
+    adProfileHtml = capture(deadlineInstance or runDeadline.runDeadline(), "Google ad profile",
+                            personalizerInstance.getGoogleAdProfile, adProfileCheckpoint)
+    # Auslesen der Interessen vor dem Speichern der Seite
+    interests = adInterests.parseInterests(adProfileHtml["html"], config.get("adInterestSelectors"))
+    profileId = databaseInterfaceInstance.savePersonalizationProfile(
         adProfileHtml, sessionNr)
+    if interests is None:
+        logging.error("no interests found in the Google ad profile")
+    else:
+        databaseInterfaceInstance.saveInterests(interests, adProfileHtml["time"], sessionNr, profileId)
+    if adProfileCheckpoint is not None:
+        adProfileCheckpoint.markSaved(profileId)
 
 
-def main():
+def overlap(databaseInterfaceInstance):
     '''
-    Here the main process of the program is defined. 
-    The commands from the command line are translated.
-    Subsequently, a database connection is established.
-    If specified the Westfälische Nachrichten or Spiegel Online rss feeds are colleted.
-    If personalization steps are specified, a Personalizer instance is created.
+    Method to compute the overlap of the articles of all profiles in every collection window
+    of the last overlapDays days (config.py) and store the matrices in analysis.overlap.
+
+    Parameters:
+        databaseInterfaceInstance:
+            The instance of the databaseinterface class to be used for reading and storing the data.
+    '''
+    end = datetime.utcnow()
+    start = end - timedelta(days=config.get("overlapDays", 1))
+    overlapEngineInstance = overlapEngine.overlapEngine(
+        databaseInterfaceInstance, config.get("overlapWindowMinutes", 60))
+    databaseInterfaceInstance.saveOverlap(overlapEngineInstance.compute(start, end))
+
+
+def resourceSummary(databaseInterfaceInstance):
+    '''
+    Method to print the peak memory and CPU seconds of the sampled runs per type of execution
+    and how many runs of a type fit on this machine at the same time.
+
+    Parameters:
+        databaseInterfaceInstance:
+            The instance of the databaseinterface class to be used for reading the runs.
+    '''
+    memory = resourceSampler.hostMemory()
+    cores = os.cpu_count()
+    summary = databaseInterfaceInstance.getResourceSummary()
+    print("%-24s %6s %12s %12s %12s %10s %10s" % (
+        "type", "runs", "peak MB", "browser MB", "CPU s", "seconds", "concurrent"))
+    for row in summary:
+        fit = resourceSampler.capacity(row, memory, cores)
+        print("%-24s %6s %12.0f %12.0f %12.1f %10.0f %10s" % (
+            row["type"], row["runs"], (row["peakRss"] or 0) / 2 ** 20, (row["peakBrowserRss"] or 0) / 2 ** 20,
+            row["cpuSeconds"] or 0, row["seconds"] or 0, fit["concurrent"]))
+        logging.info("resources of %s: %s, fits %s" % (row["type"], row, fit))
+
+
+def run(execType, session, databaseInterfaceInstance, extractionPoolInstance=None, personalizerInstance=None,
+        screenshotStoreInstance=None, runId=None, resume=False, deadlineInstance=None):
+    '''
+    Method to execute the collection step given on the command line with the deadlines of
+    config.py (see runSteps).
+    When a deadline is reached, the remaining work is skipped, the partial results are stored
+    and marked as incomplete.
+    With resourceSampling the resource usage of the scraper and its browser is sampled.
+    The durations, deadline hits and resource usage of the run are stored in runs.report
+    if deadlines or resourceSampling are configured.
+    With checkpoints the progress of a run with browser is stored per stage and per article,
+    so a run which did not complete can be resumed with its run ID (see runCheckpoint).
+
+    Parameters:
+        execType:
+            type of execution from the command line
+        session:
+            number of the session from the command line or None
+        databaseInterfaceInstance:
+            The instance of the databaseinterface class to be used for storing the data.
+        (extractionPoolInstance):
+            extractionPool to extract text and metadata of the articles during the download.
+        (personalizerInstance):
+            open personalizer of the daemon. It is not closed, only its profile is saved.
+        (screenshotStoreInstance):
+            screenshotStore of the personalizer created for this run
+        (runId):
+            ID of the run, a new one is created if None
+        (resume):
+            if True, the run runId is resumed from its checkpoints
+        (deadlineInstance):
+            runDeadline of the run, e.g. to abort it from another thread. Created from the
+            deadlines of config.py if None.
+    '''
+    deadlineInstance = deadlineInstance or runDeadline.runDeadline(config.get("deadlines"))
+    profileName = None if execType in workerDaemon.browserlessTypes else databaseInterfaceInstance.profileName
+    runId = runId or runCheckpoint.newRunId()
+    # Felder des Laufs in jeder Log Zeile
+    runLogging.setContext(run=runId, type=execType, session=int(session) if session else None,
+                          profile=profileName)
+
+    # Speichern des Fortschritts für die Fortsetzung eines abgebrochenen Laufs
+    checkpointInstance = None
+    if profileName is not None and (resume or config.get("checkpoints")):
+        checkpointInstance = runCheckpoint.runCheckpoint(
+            databaseInterfaceInstance.client, runId, execType, session, profileName, resume)
+        logging.info("run %s with checkpoints" % runId)
+
+    # Messung von Speicher und CPU des Scrapers und des Browsers falls konfiguriert
+    samplerInstance = None
+    if config.get("resourceSampling"):
+        samplerInstance = resourceSampler.resourceSampler(
+            config["resourceSampling"], deadlineInstance.currentStages, profileName)
+        if personalizerInstance is not None:
+            samplerInstance.setBrowser(personalizerInstance.driverProcessId())
+        samplerInstance.startSampling()
+
+    completed = False
+    try:
+        runSteps(execType, session, databaseInterfaceInstance, extractionPoolInstance,
+                 personalizerInstance, screenshotStoreInstance, deadlineInstance, samplerInstance,
+                 checkpointInstance)
+        completed = not deadlineInstance.expired()
+    except Exception as e:
+        # nach Erreichen einer Deadline sind abgebrochene Aufrufe des Browsers erwartet
+        if not deadlineInstance.expired():
+            raise
+        logging.error("run %s stopped by deadline: %s" % (execType, str(e)))
+    finally:
+        runLogging.clearContext()
+        deadlineInstance.close()
+        if checkpointInstance:
+            checkpointInstance.finish(completed)
+        if samplerInstance:
+            samplerInstance.stop()
+        if deadlineInstance.limits or samplerInstance or deadlineInstance.aborted:
+            report = deadlineInstance.report()
+            report.update({"runId": runId, "type": execType, "sessionNr": int(session) if session else None,
+                           "profile": profileName})
+            if samplerInstance:
+                report["resources"] = samplerInstance.report()
+            databaseInterfaceInstance.saveRunReport(report)
+
+
+def runSteps(execType, session, databaseInterfaceInstance, extractionPoolInstance=None, personalizerInstance=None,
+             screenshotStoreInstance=None, deadlineInstance=None, samplerInstance=None, checkpointInstance=None):
+    '''
+    Method to execute the collection step given on the command line.
+    If specified the Westfälische Nachrichten, Spiegel Online or all configured rss feeds are colleted.
+    If personalization steps are specified, a Personalizer instance is created with the profile
+    of the databaseInterface.
     Then a session is executed and saved.
     Subsequently, if specified, Google News, Flipboard or Google News and Flipboard are collected 
     and the personalization profile is saved.
-    The browser is then closed
+    The browser is then closed, a created browser also if a step fails
+
+    Parameters:
+        execType:
+            type of execution from the command line
+        session:
+            number of the session from the command line or None
+        databaseInterfaceInstance:
+            The instance of the databaseinterface class to be used for storing the data.
+        (extractionPoolInstance):
+            extractionPool to extract text and metadata of the articles during the download.
+        (personalizerInstance):
+            open personalizer of the daemon. It is not closed, only its profile is saved.
+        (screenshotStoreInstance):
+            screenshotStore of the personalizer created for this run
+        (deadlineInstance):
+            runDeadline of the run
+        (samplerInstance):
+            resourceSampler of the run, it is given the driver of a created personalizer
+        (checkpointInstance):
+            runCheckpoint of the run. The session and pages saved by an earlier attempt of
+            the run are skipped.
+    '''
+    deadlineInstance = deadlineInstance or runDeadline.runDeadline()
+
+    # Anlegen der Indizes
+    if execType == "createIndexes":
+        databaseInterfaceInstance.createIndexes(
+            [feed["database"] for feed in config.get("rssFeeds", rssCollector.defaultFeeds)])
+
+    # Neuberechnung der Rollups aus den gespeicherten Seiten
+    elif execType == "rebuildRollups":
+        databaseInterfaceInstance.rebuildRollups(
+            [feed["database"] for feed in config.get("rssFeeds", rssCollector.defaultFeeds)])
+
+    # Neuberechnung der Interessen aus den gespeicherten Werbeprofilen
+    elif execType == "rebuildInterests":
+        adInterests.rebuild(databaseInterfaceInstance, config.get("adInterestSelectors"))
+
+    # Berechnung der Überschneidungen zwischen den Profilen
+    elif execType == "overlap":
+        overlap(databaseInterfaceInstance)
+
+    # Training der Themenklassifikation mit den kodierten Artikeln
+    elif execType == "trainTopics":
+        topicClassifier.train(databaseInterfaceInstance, config.get("topicExportPath", "../analyse/export.csv"),
+                              config.get("topicModelPath", "topicModel.npz"))
+
+    # Vorkodierung der neu erhobenen Artikel
+    elif execType == "classifyTopics":
+        topicClassifier.classify(databaseInterfaceInstance, config.get("topicModelPath", "topicModel.npz"),
+                                 ["googleNews", "flipBoard"] +
+                                 [feed["database"] for feed in config.get("rssFeeds", rssCollector.defaultFeeds)],
+                                 config.get("topicBatchSize", 2000))
+
+    # Zusammenfassung des Ressourcenverbrauchs je Erhebungsart
+    elif execType == "resourceSummary":
+        resourceSummary(databaseInterfaceInstance)
+
+    # Nachladen der lokal gespeicherten Dokumente
+    elif execType == "replaySpool":
+        databaseInterfaceInstance.replaySpool()
+
+    # Erhebung Westfälische Nachrichten
+    elif execType == "wn":
+        wn(databaseInterfaceInstance, extractionPoolInstance, deadlineInstance)
+
+    # Erhebung Spiegel Online
+    elif execType == "spiegel":
+        spiegel(databaseInterfaceInstance, extractionPoolInstance, deadlineInstance)
+
+    # Erhebung aller konfigurierten RSS Feeds
+    elif execType == "rss":
+        rss(databaseInterfaceInstance, extractionPoolInstance, deadlineInstance)
+
+    else:
+        # ein abgebrochener Lauf startet keinen Browser mehr
+        deadlineInstance.check("start of the browser")
+        # Erstellen der Personalisierungsinstanz, falls keine offene übergeben wurde.
+        # Der Browser nutzt das Profil, unter dem gespeichert wird (bei Jobs der Warteschlange
+        # das Profil des Jobs, sonst profileName aus config.py)
+        keepBrowser = personalizerInstance is not None
+        if not keepBrowser:
+            personalizerInstance = personalizer.personalizer(
+                config["profilePath"], config["userAgent"], databaseInterfaceInstance.profileName,
+                screenshotStoreInstance)
+        # bei Erreichen einer Deadline wird der Browser hart geschlossen, das Profil bleibt erhalten
+        deadlineInstance.onExpiry = personalizerInstance.forceClose
+        if samplerInstance and not keepBrowser:
+            samplerInstance.setBrowser(personalizerInstance.driverProcessId())
+
+        try:
+            # Ausführen der Session falls spezifiziert
+            if session:
+                logging.info("sessionNr:"+str(session))
+                sessionNr = int(session)
+                if checkpointInstance is not None and checkpointInstance.sessionDone():
+                    # die Session wurde in einem früheren Versuch des Laufs ausgeführt
+                    logging.info("session %s already performed in run %s" % (sessionNr, checkpointInstance.runId))
+                else:
+                    session = list(sessions[sessionNr])
+                    sessionStart = datetime.utcnow()
+                    with deadlineInstance.stage("personalization") as personalization:
+                        performedSession = personalizerInstance.performSession(
+                            session, deadlineInstance=personalization)
+                    with deadlineInstance.stage("save"):
+                        sessionId = databaseInterfaceInstance.saveSession(
+                            performedSession, sessionStart,  sessionNr, personalization.expired())
+                    if checkpointInstance is not None and not personalization.expired():
+                        checkpointInstance.markSession(sessionId)
+            else:
+                sessionNr = None
+
+            # Ausführen eines Erhebungsschritts falls spezifiziert
+            try:
+                if execType == "googleNews":
+                    googleNews(personalizerInstance, databaseInterfaceInstance,
+                               sessionNr, extractionPoolInstance, deadlineInstance, checkpointInstance)
+                elif execType == "flipBoard":
+                    flipBoard(personalizerInstance, databaseInterfaceInstance,
+                              sessionNr, extractionPoolInstance, deadlineInstance, checkpointInstance)
+                elif execType == "googleNewsAndFlipboard":
+                    googleNewsAndFlipboard(personalizerInstance, databaseInterfaceInstance,
+                                           sessionNr, extractionPoolInstance, deadlineInstance, checkpointInstance)
+
+                elif execType == "testPersonalization":
+                    testPersonalization(personalizerInstance,
+                                        databaseInterfaceInstance, sessionNr, deadlineInstance, checkpointInstance)
+            except runDeadline.deadlineExceeded as e:
+                # der Lauf wird beendet, bereits erhobene Seiten sind gespeichert
+                logging.error(str(e))
+
+            # ein hart geschlossener Browser hat sein Profil bereits gespeichert
+            if keepBrowser and not personalizerInstance.closed:
+                personalizerInstance.saveProfile()
+        finally:
+            # ein selbst erstellter Browser wird auch nach einem Fehler geschlossen
+            if not keepBrowser:
+                closeBrowser(personalizerInstance)
+
+
+def closeBrowser(personalizerInstance):
+    '''
+    Method to close the browser of a run. If the driver does not respond, Firefox and
+    geckodriver are killed with forceClose, so no browser is left running.
+
+    Parameters:
+        personalizerInstance:
+            personalizer created for the run
+    '''
+    try:
+        personalizerInstance.closeDriver()
+    except Exception as e:
+        logging.error("driver could not be closed: %s" % str(e))
+        personalizerInstance.forceClose()
+
+
+def daemon(databaseInterfaceInstance, extractionPoolInstance=None, screenshotStoreInstance=None):
+    '''
+    Method to run the collection as a long running process.
+    Jobs are received on the socket daemonSocket from config.py. The browser of every profile
+    and the database connection are kept open between the jobs.
+
+    Parameters:
+        databaseInterfaceInstance:
+            The instance of the databaseinterface class to be used for storing the data.
+        (extractionPoolInstance):
+            extractionPool to extract text and metadata of the articles during the download.
+        (screenshotStoreInstance):
+            screenshotStore shared by the personalizers of all profiles
+    '''
+
+    def execute(job, personalizerInstance):
+        run(job["type"], job.get("session"),
+            databaseInterfaceInstance.forProfile(
+                job.get("profile") or config["profileName"]),
+            extractionPoolInstance, personalizerInstance)
+
+    def createPersonalizer(profileName):
+        return personalizer.personalizer(config["profilePath"], config["userAgent"], profileName,
+                                         screenshotStoreInstance)
+
+    workerDaemon.workerDaemon(config.get("daemonSocket", "daemon.sock"),
+                              execute, createPersonalizer).serve()
+
+
+def submit(execType, session, profileName, at):
+    '''
+    Method to send a job to the running daemon instead of executing it.
+
+    Parameters:
+        execType:
+            type of execution from the command line
+        session:
+            number of the session from the command line or None
+        profileName:
+            profile of the job
+        at:
+            ISO time at which the job is executed or None for immediately
+    '''
+    job = {"type": execType, "session": session,
+           "profile": profileName, "time": at}
+    response = workerDaemon.send(
+        config.get("daemonSocket", "daemon.sock"), job)
+    logging.info("job submitted: " + str(response))
+    print(response)
+
+
+def queueWorker(databaseInterfaceInstance, extractionPoolInstance=None, screenshotStoreInstance=None):
+    '''
+    Method to run a worker of the job queue in MongoDB (jobs.queue).
+    Due jobs are claimed with a lease and executed one after another with run(), the browser
+    is closed after every job, so its profile can be used by a worker on another node.
+    If the lease of a job is lost, the run is aborted and its browser is force-closed.
+    More collection capacity is added by starting more workers.
+
+    Parameters:
+        databaseInterfaceInstance:
+            The instance of the databaseinterface class to be used for storing the data.
+        (extractionPoolInstance):
+            extractionPool to extract text and metadata of the articles during the download.
+        (screenshotStoreInstance):
+            screenshotStore shared by the personalizers of all jobs
+    '''
+
+    def execute(job, lease):
+        session = str(job["session"]) if job.get("session") is not None else None
+        # bei Verlust des Leases wird der Lauf abgebrochen und der Browser hart geschlossen,
+        # da der Job und das Profil von einem anderen Worker übernommen werden
+        deadlineInstance = runDeadline.runDeadline(config.get("deadlines"))
+        lease.onLost(lambda: deadlineInstance.abort("lease of job %s lost" % job["_id"]))
+        run(job["type"], session,
+            databaseInterfaceInstance.forProfile(job.get("profile") or config["profileName"]),
+            extractionPoolInstance, screenshotStoreInstance=screenshotStoreInstance,
+            deadlineInstance=deadlineInstance)
+
+    queueInstance = jobQueue.jobQueue(databaseInterfaceInstance.client,
+                                      leaseSeconds=config.get("queueLeaseSeconds", 300),
+                                      retrySeconds=config.get("queueRetrySeconds", 600))
+    jobQueue.queueWorker(queueInstance, execute, config.get("queuePollSeconds", 10)).serve()
+
+
+def enqueue(execType, session, profileName, at):
+    '''
+    Method to add a job to the job queue in MongoDB instead of executing it.
+
+    Parameters:
+        execType:
+            type of execution from the command line
+        session:
+            number of the session from the command line or None
+        profileName:
+            profile of the job
+        at:
+            ISO time after which the job is executed or None for immediately
+    '''
+    client = pymongo.MongoClient(config["dbAdress"], config["dbPort"],
+                                 serverSelectionTimeoutMS=config.get("dbTimeout", 5000))
+    try:
+        jobId = jobQueue.enqueue(client, execType, session, profileName, at,
+                                 config.get("queueMaxAttempts", 3))
+    finally:
+        client.close()
+    logging.info("job queued: " + str(jobId))
+    print(jobId)
+
+
+def resume(runId, databaseInterfaceInstance, extractionPoolInstance=None, screenshotStoreInstance=None):
+    '''
+    Method to resume a run which did not complete, e.g. because the browser or the scraper was killed.
+    Type, session and profile are read from the checkpoints of the run. The saved session and
+    pages are skipped, captured pages are parsed from their stored source and only the
+    articles which were not downloaded yet are downloaded.
+
+    Parameters:
+        runId:
+            ID of the run from the log or runs.checkpoints
+        databaseInterfaceInstance:
+            The instance of the databaseinterface class to be used for storing the data.
+        (extractionPoolInstance):
+            extractionPool to extract text and metadata of the articles during the download.
+        (screenshotStoreInstance):
+            screenshotStore of the personalizer created for this run
+    '''
+    try:
+        resumedRun = runCheckpoint.loadRun(databaseInterfaceInstance.client, runId)
+    except ValueError as e:
+        logging.error(str(e))
+        print(e)
+        return
+    if resumedRun["state"] == runCheckpoint.done:
+        logging.info("run %s is already done" % runId)
+        print("run %s is already done" % runId)
+        return
+    # der Browser wird mit dem Profil aus config.py gestartet
+    if resumedRun["profile"] != config["profileName"]:
+        logging.error("run %s belongs to profile %s, not to %s" % (runId, resumedRun["profile"], config["profileName"]))
+        print("run %s belongs to profile %s" % (runId, resumedRun["profile"]))
+        return
+    logging.info("resuming run %s: %s session %s" % (runId, resumedRun["type"], resumedRun["session"]))
+    session = str(resumedRun["session"]) if resumedRun["session"] is not None else None
+    run(resumedRun["type"], session, databaseInterfaceInstance, extractionPoolInstance,
+        screenshotStoreInstance=screenshotStoreInstance, runId=runId, resume=True)
+
+
+def main():
+    '''
+    Here the main process of the program is defined. 
+    The commands from the command line are translated.
+    Subsequently, a database connection is established and the
+    collection step is executed with run().
+    Finally all queued documents are written to the database.
     '''
 
     # Übersetzung der Commandline Argumente
     parser = argparse.ArgumentParser()
     parser.add_argument('--type')
     parser.add_argument('--session')
-    session = vars(parser.parse_args())["session"]
-    execType = vars(parser.parse_args())["type"]
+    parser.add_argument('--submit', action='store_true')
+    parser.add_argument('--enqueue', action='store_true')
+    parser.add_argument('--profile')
+    parser.add_argument('--at')
+    parser.add_argument('--resume')
+    args = vars(parser.parse_args())
+    session = args["session"]
+    execType = args["type"]
+
+    # Übergabe des Jobs an den laufenden Daemon
+    if args["submit"]:
+        submit(execType, session, args["profile"] or config["profileName"], args["at"])
+        return
+
+    # Eintragen des Jobs in die Warteschlange in MongoDB
+    if args["enqueue"]:
+        profileName = None if execType in workerDaemon.browserlessTypes else \
+            args["profile"] or config["profileName"]
+        enqueue(execType, session, profileName, args["at"])
+        return
+
+    # Laden des Story Index falls konfiguriert
+    storyClustererInstance = None
+    if config.get("clusterStories"):
+        storyClustererInstance = storyClusterer.storyClusterer(
+            config["storyIndexPath"])
 
     # Erstellen des Datenbankinterface
     databaseInterfaceInstance = databaseInterface.databaseInterface(
-        config["dbAdress"], config["dbPort"], config["profileName"])
-
-    # Erhebung Westfälische Nachrichten
-    if execType == "wn":
-        wn(databaseInterfaceInstance)
-
-    # Erhebung Spiegel Online
-    elif execType == "spiegel":
-        spiegel(databaseInterfaceInstance)
+        config["dbAdress"], config["dbPort"], config["profileName"], storyClustererInstance,
+        config.get("writerThreads", 0), config.get("writeQueueSize", 1000),
+        config.get("spoolPath"), config.get("dbTimeout", 5000), config.get("rollups", True))
+
+    # Starten der Extraktion von Text und Metadaten falls konfiguriert
+    extractionPoolInstance = None
+    if config.get("extractArticles"):
+        extractionPoolInstance = articleExtractor.extractionPool(
+            config.get("extractionWorkers", 2))
+
+    # Speichern der Screenshots in GridFS falls konfiguriert
+    screenshotStoreInstance = None
+    if config.get("screenshotPolicy"):
+        screenshotStoreInstance = screenshotStore.screenshotStore(
+            databaseInterfaceInstance.client, policy=config["screenshotPolicy"],
+            sampleRate=config.get("screenshotSampleRate", 0.1),
+            keepFull=config.get("screenshotKeepFull", False),
+            thumbnailWidth=config.get("screenshotThumbnailWidth", 640))
 
-    else:
-        # Erstellen der Personalisierungsinstanz
-        personalizerInstance = personalizer.personalizer(
-            config["profilePath"], config["userAgent"], config["profileName"])
-
-        # Ausführen der Session falls spezifiziert
-        if session:
-            logging.info("sessionNr:"+str(session))
-            sessionNr = int(session)
-            session = sessions[sessionNr]
-            sessionStart = datetime.utcnow()
-            performedSession = personalizerInstance.performSession(session)
-            databaseInterfaceInstance.saveSession(
-                performedSession, sessionStart,  sessionNr)
+    try:
+        if execType == "daemon":
+            daemon(databaseInterfaceInstance,
+                   extractionPoolInstance, screenshotStoreInstance)
+        elif execType == "queueWorker":
+            queueWorker(databaseInterfaceInstance,
+                        extractionPoolInstance, screenshotStoreInstance)
+        elif args["resume"]:
+            resume(args["resume"], databaseInterfaceInstance,
+                   extractionPoolInstance, screenshotStoreInstance)
         else:
-            sessionNr = None
-
-        # Ausführen eines Erhebungsschritts falls spezifiziert
-        if execType == "googleNews":
-            googleNews(personalizerInstance,
-                       databaseInterfaceInstance, sessionNr)
-        elif execType == "flipBoard":
-            flipBoard(personalizerInstance,
-                      databaseInterfaceInstance, sessionNr)
-        elif execType == "googleNewsAndFlipboard":
-            googleNewsAndFlipboard(personalizerInstance,
-                                   databaseInterfaceInstance, sessionNr)
-
-        elif execType == "testPersonalization":
-            testPersonalization(personalizerInstance,
-                                databaseInterfaceInstance, sessionNr)
+            run(execType, session, databaseInterfaceInstance,
+                extractionPoolInstance, screenshotStoreInstance=screenshotStoreInstance)
+    finally:
+        if extractionPoolInstance:
+            extractionPoolInstance.close()
 
-        personalizerInstance.closeDriver()
+        # Schreiben der noch nicht gespeicherten Screenshots
+        if screenshotStoreInstance:
+            screenshotStoreInstance.close()
+
+        # Schreiben der noch nicht gespeicherten Dokumente
+        failedDocuments = databaseInterfaceInstance.close()
+        if failedDocuments:
+            logging.error("%s documents could not be saved" %
+                          len(failedDocuments))
 
 
 if __name__ == "__main__":
     '''
     Logging is started at this point. 
+    The log records are written to the log file by a background thread.
     If an exception is sent at any point in the code, it is stored in the log.
     The main function is then executed. 
     '''
-    logging.basicConfig(format='%(module)s %(levelname)s %(asctime)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p',
-                        filename=config["logFile"], level="INFO")
+    logWriterInstance = runLogging.logWriter(config["logFile"], config.get("logFormat") == "json",
+                                             config.get("logSampling"), config.get("logLevel", "INFO"))
 
     logging.info("scraper started\n \n \n")
 
@@ -235,3 +985,5 @@ if __name__ == "__main__":
         main()
     except Exception as e:
         logging.exception("Fatal error in main Loop!!" + str(e))
+    finally:
+        logWriterInstance.close()
@@ -0,0 +1,114 @@
+from datetime import datetime
+from bs4 import BeautifulSoup
+import logging
+import re
+
+
+# CSS selectors of the interests on the page of the ad settings, tried in this order.
+# The first selector which finds elements is used, so the interests of other elements
+# of the page are not mixed in. Overridden with adInterestSelectors in config.py.
+defaultSelectors = [".c7O9k", "[role='listitem'] [role='heading']", "[role='listitem']"]
+
+whitespacePattern = re.compile(r"\s+")
+
+
+def parseInterests(html, selectors=None):
+    '''
+    Function to read the interest labels from the HTML of the ad settings (getGoogleAdProfile).
+
+    Parameters:
+        html:
+            HTML of the page
+        (selectors):
+            CSS selectors of the interest elements, default defaultSelectors
+
+    Returns:
+        sorted list of the distinct labels, None if no selector finds an element, e.g. because
+        the page changed or personalized advertising is turned off
+    '''
+    if not html:
+        return None
+    soup = BeautifulSoup(html, 'html.parser')
+    for selector in selectors or defaultSelectors:
+        labels = {whitespacePattern.sub(" ", element.get_text(" ")).strip() for element in soup.select(selector)}
+        labels.discard("")
+        if labels:
+            return sorted(labels)
+    return None
+
+
+def applyDiff(interests, change):
+    '''
+    Returns the sorted labels after a change of interestChanges was applied to the labels before it
+    '''
+    return sorted((set(interests) - set(change["removed"])) | set(change["added"]))
+
+
+def trajectory(changes):
+    '''
+    Function to replay the changes of a profile.
+
+    Parameters:
+        changes:
+            documents of googleProfile.interestChanges of one profile sorted by time
+
+    Yields:
+        time, added, removed and interests (all labels after the change) of every snapshot
+    '''
+    interests = []
+    for change in changes:
+        interests = applyDiff(interests, change)
+        yield {"time": change["time"], "added": change["added"],
+               "removed": change["removed"], "interests": interests}
+
+
+def profileTrajectory(databaseInterfaceInstance, profileName=None, start=None, end=None):
+    '''
+    Function to read how the interests of a profile changed, without parsing the stored pages.
+
+    Parameters:
+        databaseInterfaceInstance:
+            databaseInterface to read the changes
+        (profileName):
+            profile name, default is the profile of the databaseInterface
+        (start), (end):
+            time range of the snapshots, the interests before start are replayed too
+
+    Returns:
+        list of time, added, removed and interests of every snapshot sorted by time
+    '''
+    changes = databaseInterfaceInstance.getInterestChanges(profileName, end)
+    return [snapshot for snapshot in trajectory(changes)
+            if start is None or snapshot["time"] >= start]
+
+
+def rebuild(databaseInterfaceInstance, selectors=None):
+    '''
+    Function to parse all stored ad settings pages again and regenerate the changes and the
+    current interests of all profiles, e.g. after the selectors were changed.
+    The pages are parsed per profile in the order of their time.
+
+    Parameters:
+        databaseInterfaceInstance:
+            databaseInterface to read the pages and store the interests
+        (selectors):
+            CSS selectors of the interest elements, default defaultSelectors
+
+    Returns:
+        Dict
+            pages: number of parsed pages, unparsed: number of pages without interests
+    '''
+    databaseInterfaceInstance.clearInterests()
+    pages = sorted(databaseInterfaceInstance.getPages("googleProfile"),
+                   key=lambda page: (str(page.get("profil")), page.get("time") or datetime.min))
+    unparsed = 0
+    for page in pages:
+        html = databaseInterfaceInstance.loadHtml("googleProfile", "source", page["_id"], asText=True)
+        interests = parseInterests((html or {}).get("html"), selectors)
+        if interests is None:
+            unparsed += 1
+            continue
+        databaseInterfaceInstance.forProfile(page.get("profil")).saveInterests(
+            interests, page.get("time"), page.get("sessionNr"), page["_id"])
+    logging.info("interests rebuilt from %s pages, %s pages without interests" % (len(pages), unparsed))
+    return {"pages": len(pages), "unparsed": unparsed}
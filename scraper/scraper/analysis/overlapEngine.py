@@ -0,0 +1,266 @@
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from datetime import datetime, timedelta
+import numpy as np
+import logging
+
+
+# query parameters which only track the click and are removed from the canonical URL
+trackingParameters = {"fbclid", "gclid", "ocid", "ref", "cmpid", "wt_mc", "wt_zmc"}
+
+# number of set bits of every byte
+popcount = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+# source types compared by default
+sourceTypes = ["googleNews", "flipBoard"]
+
+
+def canonicalUrl(url):
+    '''
+    Returns the canonical form of an article URL: lower case host without www. and
+    default port, no fragment, no tracking parameters, sorted query and no trailing slash.
+    None if the URL is missing.
+    '''
+    if not url:
+        return None
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host += ":%s" % parts.port
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if not key.lower().startswith("utm_") and key.lower() not in trackingParameters)
+    return urlunsplit(("https", host, parts.path.rstrip("/") or "/", urlencode(query), ""))
+
+
+def articleUrl(article):
+    '''
+    Returns the canonical URL of a stored article. The canonical URL of the extraction
+    stage is preferred, otherwise the URL after the redirects is used.
+    '''
+    extract = article.get("extract") or {}
+    return canonicalUrl(extract.get("canonicalUrl") or article.get("url"))
+
+
+class urlIndex:
+    '''
+    Interns canonical URLs to consecutive integer IDs
+    '''
+
+    def __init__(self):
+        self.ids = {}
+
+    def intern(self, url):
+        '''
+        Returns the ID of a URL, a new URL gets the next free ID
+        '''
+        return self.ids.setdefault(url, len(self.ids))
+
+    def ranked(self, urls):
+        '''
+        Returns the IDs of a ranked list of URLs as int array. Repeated URLs and missing URLs
+        are removed, the first position of a URL is its rank.
+        '''
+        seen = set()
+        ranked = []
+        for url in urls:
+            if url is None:
+                continue
+            urlId = self.intern(url)
+            if urlId not in seen:
+                seen.add(urlId)
+                ranked.append(urlId)
+        return np.array(ranked, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def rankMatrix(snapshots):
+    '''
+    Function to map the ranked ID arrays of the snapshots of a window to a common rank matrix.
+
+    Parameters:
+        snapshots:
+            list of int arrays of URL IDs, ordered by rank
+
+    Returns:
+        ranks: int matrix snapshots x URLs of the window, rank of the URL in the snapshot
+            starting with 1, depth + 1 if the URL is not in the snapshot
+        lengths: int array, number of URLs per snapshot
+    '''
+    lengths = np.array([len(s) for s in snapshots], dtype=np.int64)
+    depth = int(lengths.max()) if len(lengths) else 0
+    allIds = np.concatenate(snapshots) if snapshots else np.empty(0, dtype=np.int64)
+    windowIds, columns = np.unique(allIds, return_inverse=True)
+    ranks = np.full((len(snapshots), len(windowIds)), depth + 1, dtype=np.int64)
+    rows = np.repeat(np.arange(len(snapshots)), lengths)
+    positions = np.concatenate([np.arange(1, n + 1) for n in lengths]) if len(lengths) else allIds
+    ranks[rows, columns] = positions
+    return ranks, lengths
+
+
+def bitsets(ranks, lengths):
+    '''
+    Returns the snapshots of a rank matrix as packed bitsets (uint8 matrix snapshots x bytes)
+    '''
+    depth = int(lengths.max()) if len(lengths) else 0
+    return np.packbits(ranks <= depth, axis=1)
+
+
+def jaccardMatrix(bits):
+    '''
+    Returns the pairwise Jaccard similarity of the bitsets, nan for two empty snapshots
+    '''
+    intersections = popcount[bits[:, None, :] & bits[None, :, :]].sum(axis=2, dtype=np.int64)
+    sizes = np.diagonal(intersections)
+    unions = sizes[:, None] + sizes[None, :] - intersections
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(unions > 0, intersections / unions, np.nan)
+
+
+def rboMatrix(ranks, lengths, persistence=0.9):
+    '''
+    Returns the pairwise rank-biased overlap (extrapolated, Webber et al. 2010) of the snapshots,
+    evaluated at the depth of the shorter snapshot of a pair, nan if a snapshot is empty.
+
+    Parameters:
+        ranks, lengths:
+            rank matrix of rankMatrix
+        (persistence):
+            weight of the deeper ranks, the top 1 / (1 - persistence) ranks carry most weight
+    '''
+    count = len(lengths)
+    depth = int(lengths.max()) if count else 0
+    if depth == 0:
+        return np.full((count, count), np.nan)
+    # an URL is in both prefixes of depth d if its larger rank is <= d
+    sharedDepth = np.maximum(ranks[:, None, :], ranks[None, :, :]).reshape(count * count, -1)
+    offsets = (np.arange(count * count) * (depth + 2))[:, None]
+    histogram = np.bincount((sharedDepth + offsets).ravel(),
+                            minlength=count * count * (depth + 2)).reshape(count * count, depth + 2)
+    overlap = np.cumsum(histogram[:, 1:depth + 1], axis=1)
+    depths = np.arange(1, depth + 1)
+    agreement = overlap / depths
+    weights = persistence ** depths
+    partialSums = np.cumsum(agreement * weights, axis=1)
+
+    k = np.minimum(lengths[:, None], lengths[None, :]).ravel()
+    rows = np.arange(count * count)
+    index = np.maximum(k - 1, 0)
+    rbo = agreement[rows, index] * persistence ** k + \
+        (1 - persistence) / persistence * partialSums[rows, index]
+    return np.where(k > 0, rbo, np.nan).reshape(count, count)
+
+
+def roundMatrix(matrix, digits=4):
+    '''
+    Returns a matrix as nested lists with rounded values and None for nan
+    '''
+    return [[None if np.isnan(value) else round(float(value), digits) for value in row]
+            for row in matrix]
+
+
+class overlapEngine:
+    '''
+    Computes the overlap between the articles shown to the profiles at the same time.
+    The collected pages of Google News and Flipboard are grouped into collection windows,
+    per window the newest page of every profile is a snapshot. Article URLs are interned
+    to integer IDs, every snapshot becomes a ranked ID array and a bitset, and the
+    Jaccard and rank-biased overlap matrices of all profile pairs are computed at once.
+    '''
+
+    def __init__(self, databaseInterfaceInstance, windowMinutes=60, persistence=0.9):
+        '''
+        Method to create an overlapEngine.
+
+        Parameters:
+            databaseInterfaceInstance:
+                databaseInterface to read the pages and store the results
+            (windowMinutes):
+                length of a collection window. Pages of the same window are compared.
+            (persistence):
+                persistence of the rank-biased overlap
+        '''
+        self.databaseInterface = databaseInterfaceInstance
+        self.windowMinutes = windowMinutes
+        self.persistence = persistence
+        self.urls = urlIndex()
+
+    def windowStart(self, time):
+        '''
+        Returns the start of the collection window of a time
+        '''
+        minutes = (time.hour * 60 + time.minute) // self.windowMinutes * self.windowMinutes
+        return datetime(time.year, time.month, time.day) + timedelta(minutes=minutes)
+
+    def loadSnapshots(self, database, start, end):
+        '''
+        Method to load the snapshots of the pages collected between start and end.
+
+        Parameters:
+            database:
+                googleNews or flipBoard
+            start, end:
+                datetime, time range of the pages
+
+        Returns:
+            Dict
+                window start -> profile -> (page ID, ranked URL ID array) of the newest page
+        '''
+        windows = {}
+        pages = self.databaseInterface.getPages(database, {"time": {"$gte": start, "$lt": end}})
+        for page in pages:
+            window = windows.setdefault(self.windowStart(page["time"]), {})
+            # the pages are read newest first, older pages of the window are skipped
+            if page.get("profil") in window:
+                continue
+            articles = self.databaseInterface.getArticlesOfPage(database, page["_id"])
+            window[page.get("profil")] = (page["_id"], self.urls.ranked(
+                articleUrl(article) for article in articles))
+        return windows
+
+    def compareWindow(self, snapshots):
+        '''
+        Method to compare the snapshots of one window.
+
+        Parameters:
+            snapshots:
+                profile -> (page ID, ranked URL ID array)
+
+        Returns:
+            Dict
+                profiles, pages, sizes, jaccard and rbo (matrices in the order of profiles)
+        '''
+        profiles = sorted(snapshots, key=str)
+        ranks, lengths = rankMatrix([snapshots[p][1] for p in profiles])
+        return {"profiles": profiles,
+                "pages": [snapshots[p][0] for p in profiles],
+                "sizes": lengths.tolist(),
+                "jaccard": roundMatrix(jaccardMatrix(bitsets(ranks, lengths))),
+                "rbo": roundMatrix(rboMatrix(ranks, lengths, self.persistence))}
+
+    def compute(self, start, end, databases=sourceTypes):
+        '''
+        Method to compute the overlap matrices of all windows between start and end.
+
+        Parameters:
+            start, end:
+                datetime, time range of the pages
+            (databases):
+                source types to compare
+
+        Returns:
+            list of results, each with sourceType, windowStart, windowMinutes, persistence,
+            profiles, pages, sizes, jaccard and rbo
+        '''
+        results = []
+        for database in databases:
+            windows = self.loadSnapshots(database, start, end)
+            for windowStart, snapshots in sorted(windows.items()):
+                result = {"sourceType": database, "windowStart": windowStart,
+                          "windowMinutes": self.windowMinutes, "persistence": self.persistence}
+                result.update(self.compareWindow(snapshots))
+                results.append(result)
+            logging.info("overlap of %s computed for %s windows" % (database, len(windows)))
+        return results
@@ -0,0 +1,421 @@
+from itertools import chain
+from datetime import datetime
+import scipy.sparse
+import numpy as np
+import logging
+import random
+import json
+import zlib
+import csv
+import re
+
+from scraper.extraction import articleExtractor
+from scraper.fetching import rawPage
+
+
+# coded columns of export.csv predicted by the classifier
+targets = ["oberthema", "unterthema", "form", "place"]
+
+# sourceType of export.csv -> database of the pages
+exportDatabases = {"googleNews": "googleNews", "flipBoard": "flipBoard",
+                   "spiegel": "spiegel", "wn": "westfaelischeNachrichten"}
+
+# databases whose pages are collected per profile, their rows are only joined with a page of the coded profile
+profileDatabases = ["googleNews", "flipBoard"]
+
+# field with the html of an article per database
+htmlFieldsOfArticles = {"googleNews": "finalPage"}
+
+tokenPattern = re.compile(r"\w\w+")
+
+
+def softmax(logits):
+    '''
+    Returns the row wise softmax of a matrix
+    '''
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exponentials = np.exp(logits)
+    return exponentials / exponentials.sum(axis=1, keepdims=True)
+
+
+class hashedVectorizer:
+    '''
+    Sparse hashed bag of words. Words and pairs of consecutive words are hashed into
+    2^bits columns, the counts are damped with log(1 + count) and every row is normalized
+    to length 1. No vocabulary is stored, so new words of new articles need no refit.
+    '''
+
+    def __init__(self, bits=16, maxTokens=600, bigrams=True):
+        '''
+        Parameters:
+            (bits):
+                number of columns is 2^bits
+            (maxTokens):
+                only the first maxTokens words of a text are used (headline and lead)
+            (bigrams):
+                hash pairs of consecutive words in addition to the words
+        '''
+        self.bits = bits
+        self.maxTokens = maxTokens
+        self.bigrams = bigrams
+        self.mask = (1 << bits) - 1
+        self.cache = {}
+
+    def hashTokens(self, tokens):
+        '''
+        Returns the hashes of a list of words as uint64 array. Only words which are not in
+        the cache are hashed in Python, the known words are mapped at C speed.
+        '''
+        cache = self.cache
+        if len(cache) > 1000000:
+            cache.clear()
+        for token in set(tokens).difference(cache):
+            cache[token] = zlib.crc32(token.encode())
+        return np.fromiter(map(cache.__getitem__, tokens), dtype=np.uint64, count=len(tokens))
+
+    def transform(self, texts):
+        '''
+        Method to translate texts into a sparse matrix.
+
+        Parameters:
+            texts:
+                list of str
+
+        Returns:
+            scipy.sparse.csr_matrix with len(texts) rows and 2^bits columns
+        '''
+        # long texts are cut before the tokenization, 16 characters are enough for a word
+        maxLength = self.maxTokens * 16
+        tokenLists = [tokenPattern.findall((text or "")[:maxLength].lower())[:self.maxTokens]
+                      for text in texts]
+        lengths = np.fromiter(map(len, tokenLists), dtype=np.int64, count=len(tokenLists))
+        hashes = self.hashTokens(list(chain.from_iterable(tokenLists)))
+        rows = np.repeat(np.arange(len(texts)), lengths)
+        columns = hashes & np.uint64(self.mask)
+        if self.bigrams and len(hashes) > 1:
+            # pairs of consecutive words of the same text
+            sameText = rows[1:] == rows[:-1]
+            pairs = (hashes[:-1][sameText] * np.uint64(1000003)) ^ hashes[1:][sameText]
+            columns = np.concatenate([columns, pairs & np.uint64(self.mask)])
+            rows = np.concatenate([rows, rows[1:][sameText]])
+
+        matrix = scipy.sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, columns.astype(np.int64))),
+            shape=(len(texts), self.mask + 1))
+        matrix.sum_duplicates()
+        matrix.data = np.log1p(matrix.data)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return scipy.sparse.diags(1 / norms).dot(matrix).tocsr().astype(np.float32)
+
+
+class linearModel:
+    '''
+    Multinomial logistic regression trained with mini batch gradient descent (AdaGrad)
+    '''
+
+    def __init__(self, classes, features):
+        '''
+        Parameters:
+            classes:
+                list of the labels
+            features:
+                number of columns of the input matrix
+        '''
+        self.classes = list(classes)
+        self.weights = np.zeros((features, len(self.classes)), dtype=np.float32)
+        self.bias = np.zeros(len(self.classes), dtype=np.float32)
+
+    def fit(self, matrix, labels, epochs=10, learningRate=0.5, l2=1e-5, batchSize=256, seed=1):
+        '''
+        Method to train the model.
+
+        Parameters:
+            matrix:
+                sparse input matrix
+            labels:
+                list of labels, one per row
+            (epochs):
+                number of passes over the rows
+            (learningRate):
+                initial step size of AdaGrad
+            (l2):
+                weight of the L2 regularization
+            (batchSize):
+                rows per gradient step
+            (seed):
+                seed of the order of the rows
+        '''
+        index = {label: i for i, label in enumerate(self.classes)}
+        targetCodes = np.array([index[label] for label in labels])
+        generator = np.random.RandomState(seed)
+        squaredWeights = np.full(self.weights.shape, 1e-8, dtype=np.float32)
+        squaredBias = np.full(self.bias.shape, 1e-8, dtype=np.float32)
+        for _ in range(epochs):
+            order = generator.permutation(matrix.shape[0])
+            for start in range(0, len(order), batchSize):
+                batch = order[start:start + batchSize]
+                rows = matrix[batch]
+                error = softmax(rows @ self.weights + self.bias)
+                error[np.arange(len(batch)), targetCodes[batch]] -= 1
+                error /= len(batch)
+                gradient = np.asarray(rows.T @ error) + l2 * self.weights
+                biasGradient = error.sum(axis=0)
+                squaredWeights += gradient ** 2
+                squaredBias += biasGradient ** 2
+                self.weights -= learningRate * gradient / np.sqrt(squaredWeights)
+                self.bias -= learningRate * biasGradient / np.sqrt(squaredBias)
+
+    def predictProba(self, matrix):
+        '''
+        Returns the probabilities of the classes, one row per input row
+        '''
+        return softmax(np.asarray(matrix @ self.weights) + self.bias)
+
+
+class topicClassifier:
+    '''
+    Predicts the coded columns (targets) of an article from its headline and text.
+    Every target has its own linearModel on the same hashed bag of words.
+    '''
+
+    def __init__(self, bits=16, meta=None):
+        '''
+        Parameters:
+            (bits):
+                bits of the hashedVectorizer
+            (meta):
+                description of the training, e.g. time and accuracy
+        '''
+        self.vectorizer = hashedVectorizer(bits)
+        self.models = {}
+        self.meta = meta or {}
+
+    def fit(self, texts, rows, **parameters):
+        '''
+        Method to train the models of all targets.
+
+        Parameters:
+            texts:
+                list of article texts
+            rows:
+                list of dicts with the coded targets, one per text. Empty values are skipped.
+            (parameters):
+                parameters of linearModel.fit
+        '''
+        matrix = self.vectorizer.transform(texts)
+        for target in targets:
+            coded = [i for i, row in enumerate(rows) if row.get(target)]
+            labels = [rows[i][target] for i in coded]
+            if not labels:
+                continue
+            model = linearModel(sorted(set(labels)), matrix.shape[1])
+            model.fit(matrix[coded], labels, **parameters)
+            self.models[target] = model
+
+    def predict(self, texts):
+        '''
+        Method to predict the targets of texts.
+
+        Parameters:
+            texts:
+                list of article texts
+
+        Returns:
+            list of dicts, per target label and confidence (probability of the label),
+            and confidence, the lowest confidence of all targets
+        '''
+        matrix = self.vectorizer.transform(texts)
+        predictions = [{} for _ in texts]
+        lowest = np.ones(len(texts))
+        for target, model in self.models.items():
+            probabilities = model.predictProba(matrix)
+            codes = probabilities.argmax(axis=1)
+            confidences = probabilities[np.arange(len(texts)), codes]
+            lowest = np.minimum(lowest, confidences)
+            for prediction, code, confidence in zip(predictions, codes.tolist(), confidences.tolist()):
+                prediction[target] = {"label": model.classes[code],
+                                      "confidence": round(confidence, 4)}
+        for prediction, confidence in zip(predictions, lowest.tolist()):
+            prediction["confidence"] = round(confidence, 4)
+        return predictions
+
+    def save(self, path):
+        '''
+        Method to store the classifier as compressed NumPy archive
+        '''
+        arrays = {"meta": np.array(json.dumps(dict(self.meta, bits=self.vectorizer.bits,
+                                                   targets=list(self.models))))}
+        for target, model in self.models.items():
+            arrays[target + "Weights"] = model.weights
+            arrays[target + "Bias"] = model.bias
+            arrays[target + "Classes"] = np.array(model.classes)
+        with open(path, "wb") as file:
+            np.savez_compressed(file, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Returns a classifier stored with save
+        '''
+        with np.load(path, allow_pickle=False) as arrays:
+            meta = json.loads(str(arrays["meta"]))
+            classifier = cls(meta["bits"], meta)
+            for target in meta["targets"]:
+                model = linearModel(arrays[target + "Classes"].tolist(), 1 << meta["bits"])
+                model.weights = arrays[target + "Weights"]
+                model.bias = arrays[target + "Bias"]
+                classifier.models[target] = model
+        return classifier
+
+
+def articleText(article, databaseInterfaceInstance, database):
+    '''
+    Returns headline and text of a stored article. The text of the extraction stage is used,
+    if it is missing the main text is extracted from the html of the article.
+    '''
+    extract = article.get("extract") or {}
+    if not extract.get("text"):
+        field = htmlFieldsOfArticles.get(database, "html")
+        document = databaseInterfaceInstance.loadHtml(database, "articles", article["_id"], [field])
+        if document and document.get(field):
+            extract = articleExtractor.extractArticle(rawPage.documentText(document, field))
+    return "%s\n%s" % (extract.get("headline") or "", extract.get("text") or "")
+
+
+def trainingSet(databaseInterfaceInstance, exportPath):
+    '''
+    Function to join the coded rows of export.csv with the stored articles.
+    A row is the articleCounter-th article (from 1) of the page of sourceType collected at
+    sourceDatetime, for Google News counted over the tiles from top to bottom.
+    Rows of Google News and Flipboard are only joined with a page of their profile.
+
+    Parameters:
+        databaseInterfaceInstance:
+            databaseInterface to read the pages and articles
+        exportPath:
+            path of export.csv
+
+    Returns:
+        texts, rows: texts of the found articles and their coded rows
+    '''
+    with open(exportPath, newline="", encoding="utf-8") as file:
+        exportRows = list(csv.DictReader(file))
+
+    pages = {}
+    for row in exportRows:
+        pages.setdefault((row["sourceType"], row["profil"], row["sourceDatetime"]), []).append(row)
+
+    texts, rows = [], []
+    for (sourceType, profile, sourceDatetime), pageRows in pages.items():
+        database = exportDatabases.get(sourceType)
+        if database is None:
+            continue
+        candidates = list(databaseInterfaceInstance.getPages(
+            database, {"time": datetime.fromisoformat(sourceDatetime)}))
+        page = next((p for p in candidates if p.get("profil") == profile), None)
+        # the pages of the RSS feeds have no profile
+        if page is None and database not in profileDatabases and candidates:
+            page = candidates[0]
+        if page is None:
+            logging.info("page of %s %s %s not found" % (sourceType, profile, sourceDatetime))
+            continue
+        articles = list(databaseInterfaceInstance.getArticlesOfPage(database, page["_id"]))
+        for row in pageRows:
+            number = int(row["articleCounter"])
+            if 1 <= number <= len(articles):
+                texts.append(articleText(articles[number - 1], databaseInterfaceInstance, database))
+                rows.append(row)
+    logging.info("%s of %s coded rows joined with their articles" % (len(rows), len(exportRows)))
+    return texts, rows
+
+
+def train(databaseInterfaceInstance, exportPath, modelPath, holdout=0.2, bits=16):
+    '''
+    Function to train the classifier on the coded rows and store it.
+    The accuracy is measured on a holdout part of the rows first, the stored
+    classifier is then trained on all rows.
+
+    Parameters:
+        databaseInterfaceInstance:
+            databaseInterface to read the pages and articles
+        exportPath:
+            path of export.csv
+        modelPath:
+            path of the stored classifier
+        (holdout):
+            part of the rows used to measure the accuracy
+        (bits):
+            bits of the hashedVectorizer
+
+    Returns:
+        Dict
+            rows, holdout rows and accuracy per target
+    '''
+    texts, rows = trainingSet(databaseInterfaceInstance, exportPath)
+    if not rows:
+        raise ValueError("no coded row could be joined with an article")
+    order = list(range(len(rows)))
+    random.Random(1).shuffle(order)
+    split = int(len(order) * holdout)
+    test, fit = order[:split], order[split:]
+
+    accuracy = {}
+    if test:
+        classifier = topicClassifier(bits)
+        classifier.fit([texts[i] for i in fit], [rows[i] for i in fit])
+        predictions = classifier.predict([texts[i] for i in test])
+        for target in classifier.models:
+            coded = [(p, rows[i][target]) for p, i in zip(predictions, test) if rows[i].get(target)]
+            accuracy[target] = round(sum(p[target]["label"] == label for p, label in coded) /
+                                     max(len(coded), 1), 4)
+
+    report = {"trained": datetime.utcnow().isoformat(), "rows": len(rows),
+              "holdout": len(test), "accuracy": accuracy}
+    classifier = topicClassifier(bits, report)
+    classifier.fit(texts, rows)
+    classifier.save(modelPath)
+    logging.info("topic classifier trained: " + json.dumps(report))
+    return report
+
+
+def classify(databaseInterfaceInstance, modelPath, databases, batchSize=2000):
+    '''
+    Function to pre-label all stored articles without topic with the stored classifier.
+    The articles are read, vectorized and predicted in batches of batchSize.
+
+    Parameters:
+        databaseInterfaceInstance:
+            databaseInterface to read and update the articles
+        modelPath:
+            path of the stored classifier
+        databases:
+            databases of the articles, e.g. googleNews, flipBoard and the RSS databases
+        (batchSize):
+            articles per batch
+
+    Returns:
+        Dict
+            articles: number of labeled articles, seconds: duration of the prediction
+    '''
+    classifier = topicClassifier.load(modelPath)
+    model = classifier.meta.get("trained")
+    labeled = 0
+    seconds = 0.0
+    for database in databases:
+        cursor = databaseInterfaceInstance.getArticles(
+            database, {"topic": {"$exists": False}}, pageSize=batchSize)
+        for batch in cursor.pages():
+            texts = [articleText(article, databaseInterfaceInstance, database) for article in batch]
+            start = datetime.utcnow()
+            predictions = classifier.predict(texts)
+            seconds += (datetime.utcnow() - start).total_seconds()
+            for prediction in predictions:
+                prediction["model"] = model
+            databaseInterfaceInstance.saveTopics(
+                database, [article["_id"] for article in batch], predictions)
+            labeled += len(batch)
+        logging.info("topics of %s predicted" % database)
+    logging.info("%s articles labeled, %.0f articles per second" %
+                 (labeled, labeled / seconds if seconds else 0))
+    return {"articles": labeled, "seconds": seconds}
@@ -0,0 +1,206 @@
+from bson import ObjectId
+import numpy as np
+import threading
+import logging
+import json
+import zlib
+import re
+import os
+
+
+# prime of the universal hash functions of the MinHash permutations
+mersennePrime = np.uint64((1 << 61) - 1)
+maxHash = np.uint64((1 << 32) - 1)
+
+tokenPattern = re.compile(r"\w+")
+
+
+class storyClusterer:
+    '''
+    Incremental MinHash LSH index which assigns articles to story clusters.
+    Articles whose word shingles have an estimated Jaccard similarity of at least
+    threshold to an already indexed article get the cluster of the most similar one,
+    otherwise a new cluster is created.
+
+    Candidates are found through LSH buckets (numPerm = bands * rows), so an
+    assignment only compares against articles sharing a bucket and not against
+    all collected articles.
+
+    The index is persisted as an append-only file of fixed size records
+    (cluster ID and signature). Every assignment is appended immediately,
+    so a later run resumes with all articles of the previous runs.
+    '''
+
+    def __init__(self, indexPath, bands=32, rows=4, threshold=0.5, shingleSize=5, seed=1):
+        '''
+        Method to create a storyClusterer. An existing index at indexPath is loaded.
+
+        Parameters:
+            indexPath:
+                path of the index file. The parameters are stored in indexPath + ".json"
+            (bands):
+                number of LSH bands
+            (rows):
+                number of signature values per band
+            (threshold):
+                minimum estimated Jaccard similarity of articles of the same story
+            (shingleSize):
+                number of words per shingle
+            (seed):
+                seed of the permutations, must be the same for all runs on an index
+        '''
+        self.indexPath = indexPath
+        self.bands = bands
+        self.rows = rows
+        self.numPerm = bands * rows
+        self.threshold = threshold
+        self.shingleSize = shingleSize
+        self.seed = seed
+        self.lock = threading.Lock()
+
+        generator = np.random.RandomState(seed)
+        self.a = generator.randint(1, int(mersennePrime), size=self.numPerm,
+                                   dtype=np.uint64)
+        self.b = generator.randint(0, int(mersennePrime), size=self.numPerm,
+                                   dtype=np.uint64)
+
+        self.recordType = np.dtype([("cluster", "S24"),
+                                    ("signature", "<u4", (self.numPerm,))])
+        self.clusters = []
+        self.signatures = np.empty((0, self.numPerm), dtype=np.uint32)
+        self.buckets = {}
+        self.load()
+
+    def parameters(self):
+        '''
+        Returns the parameters which must match between the runs on an index
+        '''
+        return {"bands": self.bands, "rows": self.rows,
+                "shingleSize": self.shingleSize, "seed": self.seed}
+
+    def load(self):
+        '''
+        Method to load the index file. The file is created if it does not exist.
+        '''
+        parameterPath = self.indexPath + ".json"
+        if os.path.exists(parameterPath):
+            with open(parameterPath) as f:
+                if json.load(f) != self.parameters():
+                    raise ValueError("story index %s was created with other parameters: %s" % (
+                        self.indexPath, parameterPath))
+        else:
+            with open(parameterPath, "w") as f:
+                json.dump(self.parameters(), f)
+
+        if os.path.exists(self.indexPath):
+            records = np.fromfile(self.indexPath, dtype=self.recordType)
+            self.clusters = [cluster.decode() for cluster in records["cluster"]]
+            self.signatures = np.array(records["signature"], dtype=np.uint32)
+            for i in range(len(self.clusters)):
+                for key in self.bandKeys(self.signatures[i]):
+                    self.buckets.setdefault(key, []).append(i)
+        logging.info("story index loaded with %s articles", len(self.clusters))
+
+    def shingles(self, text):
+        '''
+        Returns the hashes of the word shingles of a text.
+
+        Parameters:
+            text:
+                text of the article
+
+        Returns:
+            array of unique 32 bit hashes
+        '''
+        words = tokenPattern.findall(text.lower())
+        size = min(self.shingleSize, len(words))
+        shingles = {" ".join(words[i:i + size])
+                    for i in range(len(words) - size + 1)} if size else set()
+        return np.fromiter((zlib.crc32(s.encode()) for s in shingles),
+                           dtype=np.uint64, count=len(shingles))
+
+    def signature(self, text):
+        '''
+        Returns the MinHash signature of a text or None if the text has no words.
+
+        Parameters:
+            text:
+                text of the article
+
+        Returns:
+            array of numPerm 32 bit values
+        '''
+        hashes = self.shingles(text)
+        if len(hashes) == 0:
+            return None
+        permuted = (np.outer(hashes, self.a) + self.b) % mersennePrime & maxHash
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def bandKeys(self, signature):
+        '''
+        Returns the LSH bucket keys of a signature, one per band
+        '''
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+                for band in range(self.bands)]
+
+    def assign(self, text):
+        '''
+        Method to assign an article to a story cluster and add it to the index.
+
+        Parameters:
+            text:
+                text of the article
+
+        Returns:
+            str
+                ID of the story cluster or None if the text is empty
+        '''
+        if not text:
+            return None
+        signature = self.signature(text)
+        if signature is None:
+            return None
+
+        with self.lock:
+            keys = self.bandKeys(signature)
+            candidates = set()
+            for key in keys:
+                candidates.update(self.buckets.get(key, []))
+
+            cluster = None
+            if candidates:
+                candidates = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+                similarity = (self.signatures[candidates] == signature).mean(axis=1)
+                best = similarity.argmax()
+                if similarity[best] >= self.threshold:
+                    cluster = self.clusters[candidates[best]]
+            if cluster is None:
+                cluster = str(ObjectId())
+
+            self.append(cluster, signature, keys)
+        return cluster
+
+    def append(self, cluster, signature, keys):
+        '''
+        Adds an article to the index in memory and appends it to the index file.
+        The record is written with a single write on a file opened in append mode,
+        so parallel runs on the same index do not overwrite each other.
+        '''
+        i = len(self.clusters)
+        self.clusters.append(cluster)
+        if i == len(self.signatures):
+            grown = np.empty((max(1024, 2 * i), self.numPerm), dtype=np.uint32)
+            grown[:i] = self.signatures[:i]
+            self.signatures = grown
+        self.signatures[i] = signature
+        for key in keys:
+            self.buckets.setdefault(key, []).append(i)
+
+        record = np.zeros(1, dtype=self.recordType)
+        record["cluster"] = cluster.encode()
+        record["signature"] = signature
+        with open(self.indexPath, "ab") as f:
+            f.write(record.tobytes())
+
+    def __len__(self):
+        return len(self.clusters)
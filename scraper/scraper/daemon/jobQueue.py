@@ -0,0 +1,379 @@
+from datetime import datetime, timedelta
+import threading
+import logging
+import signal
+import socket
+import time
+import os
+
+import pymongo
+
+from scraper.daemon import workerDaemon
+
+
+# database and collections of the queue
+queueDatabase = "jobs"
+queueCollection = "queue"
+lockCollection = "profileLocks"
+
+# states of a job
+queued, running, done, failed = "queued", "running", "done", "failed"
+
+
+def defaultOwner():
+    '''
+    Returns the name of a worker: host name and process ID
+    '''
+    return "%s:%s" % (socket.gethostname(), os.getpid())
+
+
+def enqueue(client, execType, session=None, profileName=None, at=None, maxAttempts=3):
+    '''
+    Function to add a job to the queue.
+
+    Parameters:
+        client:
+            pymongo.MongoClient
+        execType:
+            type of execution, e.g. googleNews
+        (session):
+            number of the session executed before the collection
+        (profileName):
+            profile of the job, required for jobs with browser
+        (at):
+            earliest start, None (immediately), unix time or ISO date in local time
+        (maxAttempts):
+            number of executions before a failing job is given up
+
+    Returns:
+        _id of the job
+    '''
+    if not profileName and execType not in workerDaemon.browserlessTypes:
+        raise ValueError("job without profile")
+    job = {"type": execType,
+           "session": int(session) if session is not None else None,
+           "profile": profileName,
+           "notBefore": datetime.utcfromtimestamp(workerDaemon.parseTime(at)),
+           "state": queued,
+           "attempts": 0,
+           "maxAttempts": maxAttempts,
+           "created": datetime.utcnow()}
+    return client[queueDatabase][queueCollection].insert_one(job).inserted_id
+
+
+class jobQueue:
+    '''
+    Job queue in MongoDB shared by the workers of all collection nodes.
+
+    jobs.queue:
+        type, session, profile: job as on the command line
+        notBefore: earliest start (UTC)
+        state: queued, running, done or failed
+        attempts: number of claims, maxAttempts: claims before a failing job is given up
+        lease: owner (worker) and expires (UTC) while running
+        created, started, finished, (error), (node): worker of the last attempt
+
+    jobs.profileLocks:
+        _id: profile, owner, expires, jobId
+
+    A worker claims a due job with a lease of leaseSeconds and renews it with heartbeats.
+    If a worker dies, its lease expires and the job is claimed again by another worker.
+    A job with browser also takes the lock of its profile, so a profile runs on one node at a
+    time. Leases are compared with the clocks of the nodes, leaseSeconds must be much longer
+    than the difference between the clocks.
+    '''
+
+    def __init__(self, client, owner=None, leaseSeconds=300, retrySeconds=600):
+        '''
+        Method to create a jobQueue.
+
+        Parameters:
+            client:
+                pymongo.MongoClient
+            (owner):
+                name of the worker, default host name and process ID
+            (leaseSeconds):
+                duration of a lease, it is renewed every leaseSeconds / 3 seconds
+            (retrySeconds):
+                delay before a failed job is claimed again
+        '''
+        self.jobs = client[queueDatabase][queueCollection]
+        self.locks = client[queueDatabase][lockCollection]
+        self.owner = owner or defaultOwner()
+        self.leaseSeconds = leaseSeconds
+        self.retrySeconds = retrySeconds
+
+    def leaseEnd(self):
+        '''
+        Returns the end of a lease taken now
+        '''
+        return datetime.utcnow() + timedelta(seconds=self.leaseSeconds)
+
+    def claimable(self, now):
+        '''
+        Returns the filter of the jobs which can be claimed: due queued jobs and running jobs
+        whose lease has expired
+        '''
+        return {"notBefore": {"$lte": now},
+                "$or": [{"state": queued},
+                        {"state": running, "lease.expires": {"$lt": now}}]}
+
+    def lockProfile(self, profileName, jobId):
+        '''
+        Method to take the lock of a profile. A lock of the same worker or an expired lock is taken over.
+
+        Returns:
+            True if the lock was taken
+        '''
+        now = datetime.utcnow()
+        try:
+            self.locks.update_one(
+                {"_id": profileName, "$or": [{"owner": self.owner}, {"expires": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires": self.leaseEnd(), "jobId": jobId}},
+                upsert=True)
+            return True
+        except pymongo.errors.DuplicateKeyError:
+            # the profile is locked by another worker
+            return False
+
+    def unlockProfile(self, profileName):
+        '''
+        Method to release the lock of a profile held by this worker
+        '''
+        self.locks.delete_one({"_id": profileName, "owner": self.owner})
+
+    def failExhausted(self):
+        '''
+        Method to mark running jobs with expired lease and no attempts left as failed
+        '''
+        now = datetime.utcnow()
+        result = self.jobs.update_many(
+            {"state": running, "lease.expires": {"$lt": now},
+             "$expr": {"$gte": ["$attempts", "$maxAttempts"]}},
+            {"$set": {"state": failed, "finished": now, "error": "lease expired"},
+             "$unset": {"lease": ""}})
+        if result.modified_count:
+            logging.error("%s jobs failed after their last lease expired" % result.modified_count)
+
+    def claim(self, candidates=20):
+        '''
+        Method to claim the next due job.
+        Jobs of profiles locked by other workers are skipped.
+
+        Parameters:
+            (candidates):
+                number of due jobs which are tried
+
+        Returns:
+            claimed job or None if no job can be claimed
+        '''
+        self.failExhausted()
+        now = datetime.utcnow()
+        query = dict(self.claimable(now), **{"$expr": {"$lt": ["$attempts", "$maxAttempts"]}})
+        for candidate in self.jobs.find(query, {"profile": 1}).sort("notBefore", 1).limit(candidates):
+            profileName = candidate.get("profile")
+            if profileName and not self.lockProfile(profileName, candidate["_id"]):
+                continue
+            # the job is only taken if no other worker claimed it in the meantime
+            job = self.jobs.find_one_and_update(
+                dict(query, _id=candidate["_id"]),
+                {"$set": {"state": running, "started": now, "node": self.owner,
+                          "lease": {"owner": self.owner, "expires": self.leaseEnd()}},
+                 "$inc": {"attempts": 1}},
+                return_document=pymongo.ReturnDocument.AFTER)
+            if job is not None:
+                logging.info("job %s claimed: %s" % (job["_id"], job["type"]))
+                return job
+            if profileName:
+                self.unlockProfile(profileName)
+        return None
+
+    def heartbeat(self, job):
+        '''
+        Method to renew the lease of a job and the lock of its profile.
+
+        Returns:
+            False if the lease was lost, e.g. because it expired and the job was claimed again
+        '''
+        renewed = self.jobs.update_one(
+            {"_id": job["_id"], "state": running, "lease.owner": self.owner},
+            {"$set": {"lease.expires": self.leaseEnd()}}).matched_count
+        if job.get("profile"):
+            self.locks.update_one({"_id": job["profile"], "owner": self.owner},
+                                  {"$set": {"expires": self.leaseEnd()}})
+        if not renewed:
+            logging.error("lease of job %s lost" % job["_id"])
+        return bool(renewed)
+
+    def complete(self, job, error=None):
+        '''
+        Method to finish a claimed job and release the lock of its profile.
+        A failed job with attempts left is queued again after retrySeconds.
+        Nothing is written if the job is no longer leased by this worker.
+
+        Parameters:
+            job:
+                claimed job
+            (error):
+                error message if the job failed
+
+        Returns:
+            False if the lease of the job was lost
+        '''
+        now = datetime.utcnow()
+        if error is None:
+            update = {"$set": {"state": done, "finished": now}, "$unset": {"lease": "", "error": ""}}
+        elif job["attempts"] < job["maxAttempts"]:
+            update = {"$set": {"state": queued, "error": error,
+                               "notBefore": now + timedelta(seconds=self.retrySeconds)},
+                      "$unset": {"lease": ""}}
+        else:
+            update = {"$set": {"state": failed, "finished": now, "error": error}, "$unset": {"lease": ""}}
+        owned = self.jobs.update_one({"_id": job["_id"], "state": running, "lease.owner": self.owner},
+                                     update).matched_count
+        if not owned:
+            logging.error("job %s not completed, its lease was lost" % job["_id"])
+            return False
+        if job.get("profile"):
+            self.unlockProfile(job["profile"])
+        return True
+
+    def status(self):
+        '''
+        Returns the number of jobs per state and the locked profiles
+        '''
+        states = {row["_id"]: row["count"] for row in self.jobs.aggregate(
+            [{"$group": {"_id": "$state", "count": {"$sum": 1}}}])}
+        return {"jobs": states, "profiles": list(self.locks.find({}, {"owner": 1, "expires": 1}))}
+
+
+class jobLease:
+    '''
+    Lease of a job executed by a queueWorker. When the lease is lost, the job is owned by
+    nobody or by another worker, so the functions registered with onLost are called to stop it,
+    e.g. to force-close the browser of its profile.
+    '''
+
+    def __init__(self, job):
+        self.job = job
+        self.lost = threading.Event()
+        self.handlers = []
+        self.lock = threading.Lock()
+
+    def onLost(self, handler):
+        '''
+        Method to register a function() which stops the job. It is called at once if the lease
+        is already lost.
+        '''
+        with self.lock:
+            if not self.lost.is_set():
+                self.handlers.append(handler)
+                return
+        handler()
+
+    def markLost(self):
+        '''
+        Method to mark the lease as lost and call the registered functions
+        '''
+        with self.lock:
+            if self.lost.is_set():
+                return
+            self.lost.set()
+            handlers, self.handlers = self.handlers, []
+        logging.error("lease of job %s lost, the job is stopped" % self.job["_id"])
+        for handler in handlers:
+            try:
+                handler()
+            except Exception as e:
+                logging.error("job %s could not be stopped: %s" % (self.job["_id"], str(e)))
+
+
+class queueWorker:
+    '''
+    Worker of a collection node. It claims due jobs from the jobQueue one after another and
+    executes them while a heartbeat thread renews the lease. If the lease is lost, the job is
+    stopped and not completed by this worker, it belongs to the worker that claims it again.
+    More collection capacity is added by starting more workers, e.g. one per container.
+    '''
+
+    def __init__(self, queue, execute, pollSeconds=10):
+        '''
+        Method to create a queueWorker.
+
+        Parameters:
+            queue:
+                jobQueue
+            execute:
+                function(job, lease) which executes a job, an exception marks the job as failed.
+                It registers with lease.onLost how the job is stopped when the lease is lost.
+            (pollSeconds):
+                seconds to wait if no job is due
+        '''
+        self.queue = queue
+        self.execute = execute
+        self.pollSeconds = pollSeconds
+        self.stopped = threading.Event()
+
+    def runJob(self, job):
+        '''
+        Method to execute a claimed job with heartbeats.
+        A lease which can not be renewed for leaseSeconds is treated as lost.
+        '''
+        finished = threading.Event()
+        lease = jobLease(job)
+
+        def beat():
+            renewed = time.monotonic()
+            while not finished.wait(self.queue.leaseSeconds / 3):
+                try:
+                    if not self.queue.heartbeat(job):
+                        lease.markLost()
+                        return
+                    renewed = time.monotonic()
+                except pymongo.errors.PyMongoError as e:
+                    logging.error("heartbeat of job %s failed: %s" % (job["_id"], str(e)))
+                    if time.monotonic() - renewed >= self.queue.leaseSeconds:
+                        lease.markLost()
+                        return
+
+        heartbeatThread = threading.Thread(target=beat, name="heartbeat", daemon=True)
+        heartbeatThread.start()
+        error = None
+        try:
+            self.execute(job, lease)
+        except Exception as e:
+            logging.exception("job %s failed: %s" % (job["_id"], str(e)))
+            error = str(e)
+        finally:
+            finished.set()
+            heartbeatThread.join()
+        if lease.lost.is_set():
+            logging.error("job %s stopped after its lease was lost, it is not completed" % job["_id"])
+            return
+        self.queue.complete(job, error)
+
+    def serve(self):
+        '''
+        Method to execute jobs until the worker is stopped with SIGTERM or SIGINT.
+        The running job is finished before the worker stops.
+        '''
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        signal.signal(signal.SIGINT, lambda signum, frame: self.stop())
+        logging.info("queue worker %s started" % self.queue.owner)
+        while not self.stopped.is_set():
+            try:
+                job = self.queue.claim()
+            except pymongo.errors.PyMongoError as e:
+                logging.error("jobs could not be claimed: " + str(e))
+                job = None
+            if job is None:
+                self.stopped.wait(self.pollSeconds)
+                continue
+            self.runJob(job)
+        logging.info("queue worker %s stopped" % self.queue.owner)
+
+    def stop(self):
+        '''
+        Method to stop the worker after the running job
+        '''
+        self.stopped.set()
@@ -0,0 +1,264 @@
+from datetime import datetime
+import socketserver
+import threading
+import logging
+import signal
+import socket
+import heapq
+import json
+import time
+import os
+
+
+# job types which do not use the browser
+browserlessTypes = ["createIndexes", "replaySpool", "rebuildRollups", "rebuildInterests", "overlap", "trainTopics", "classifyTopics", "resourceSummary", "wn", "spiegel", "rss"]
+
+
+def parseTime(value):
+    '''
+    Returns the scheduled time of a job as unix time.
+    Jobs without time are due immediately.
+
+    Parameters:
+        value:
+            None, unix time or ISO date in local time, e.g. 2020-05-01T10:00:00
+    '''
+    if value is None:
+        return time.time()
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value).timestamp()
+
+
+class jobHandler(socketserver.StreamRequestHandler):
+    '''
+    Handles a connection to the socket of the daemon.
+    Every line is a JSON request, every request is answered with a JSON line.
+    '''
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                response = self.server.daemon.handleRequest(json.loads(line))
+            except Exception as e:
+                response = {"accepted": False, "error": str(e)}
+            self.wfile.write((json.dumps(response) + "\n").encode())
+
+
+class jobServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class workerDaemon:
+    '''
+    Long running process which executes collection jobs.
+    One browser per profile is kept open between the jobs and all jobs share the
+    database connection, so a job does not pay for the start of the browser and the
+    connection.
+
+    Jobs are sent to a unix socket as JSON lines:
+        {"type": "googleNews", "session": 3, "profile": "profil1", "time": "2020-05-01T10:00:00"}
+    type and session are the arguments of main.py, time is optional.
+    Due jobs are executed one after another in the order of their time.
+    '''
+
+    def __init__(self, socketPath, execute, createPersonalizer):
+        '''
+        Method to create a workerDaemon.
+
+        Parameters:
+            socketPath:
+                path of the unix socket
+            execute:
+                function(job, personalizerInstance) which executes a job.
+                personalizerInstance is None for browserlessTypes.
+            createPersonalizer:
+                function(profileName) which returns a new personalizer of the profile
+        '''
+        self.socketPath = socketPath
+        self.execute = execute
+        self.createPersonalizer = createPersonalizer
+        self.personalizers = {}
+        self.jobs = []
+        self.jobNr = 0
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.server = None
+
+    def handleRequest(self, request):
+        '''
+        Method to handle a request of the socket.
+
+        Parameters:
+            request:
+                job, {"type": "status"} or {"type": "stop"}
+
+        Returns:
+            Dict
+                response to the client
+        '''
+        if request.get("type") == "status":
+            return self.status()
+        if request.get("type") == "stop":
+            self.stop()
+            return {"accepted": True}
+        return self.submit(request)
+
+    def submit(self, job):
+        '''
+        Method to queue a job.
+
+        Parameters:
+            job:
+                dict with type, session, profile and (time)
+
+        Returns:
+            Dict
+                accepted, id and time of the job
+        '''
+        if not job.get("profile") and job.get("type") not in browserlessTypes:
+            raise ValueError("job without profile")
+        scheduled = parseTime(job.get("time"))
+        with self.condition:
+            self.jobNr += 1
+            job["id"] = self.jobNr
+            heapq.heappush(self.jobs, (scheduled, self.jobNr, job))
+            self.condition.notify()
+        logging.info("job %s queued for %s: %s" %
+                     (job["id"], datetime.fromtimestamp(scheduled).isoformat(), job))
+        return {"accepted": True, "id": job["id"],
+                "time": datetime.fromtimestamp(scheduled).isoformat()}
+
+    def status(self):
+        '''
+        Returns the queued jobs and the profiles with an open browser
+        '''
+        with self.condition:
+            jobs = [dict(job, time=datetime.fromtimestamp(scheduled).isoformat())
+                    for scheduled, _, job in sorted(self.jobs)]
+        return {"jobs": jobs, "profiles": list(self.personalizers)}
+
+    def nextJob(self):
+        '''
+        Waits until the next job is due.
+
+        Returns:
+            job or None if the daemon is stopped
+        '''
+        with self.condition:
+            while not self.stopped:
+                if self.jobs and self.jobs[0][0] <= time.time():
+                    return heapq.heappop(self.jobs)[2]
+                timeout = self.jobs[0][0] - time.time() if self.jobs else None
+                self.condition.wait(timeout)
+            return None
+
+    def personalizerFor(self, profileName):
+        '''
+        Returns the open personalizer of a profile. It is created with the first job of the profile.
+        '''
+        if profileName not in self.personalizers:
+            logging.info("starting browser of profile " + profileName)
+            self.personalizers[profileName] = self.createPersonalizer(
+                profileName)
+        return self.personalizers[profileName]
+
+    def closePersonalizer(self, profileName):
+        '''
+        Closes the browser of a profile. Errors are logged, as the browser may already be dead.
+        '''
+        personalizerInstance = self.personalizers.pop(profileName, None)
+        if personalizerInstance is None:
+            return
+        try:
+            personalizerInstance.closeDriver()
+        except Exception as e:
+            logging.error("browser of profile %s could not be closed: %s" %
+                          (profileName, str(e)))
+
+    def runJob(self, job):
+        '''
+        Method to execute a job. If a job with browser fails or its browser was force-closed at
+        a deadline, the browser of the profile is closed, so the next job of the profile starts
+        with a new one.
+        '''
+        start = time.time()
+        logging.info("starting job %s: %s" % (job["id"], job))
+        usesBrowser = job.get("type") not in browserlessTypes
+        try:
+            personalizerInstance = self.personalizerFor(
+                job["profile"]) if usesBrowser else None
+            self.execute(job, personalizerInstance)
+            logging.info("job %s finished in %.1f seconds" %
+                         (job["id"], time.time() - start))
+            if usesBrowser and getattr(personalizerInstance, "closed", False):
+                # the browser was force-closed at a deadline
+                self.personalizers.pop(job["profile"], None)
+        except Exception as e:
+            logging.exception("job %s failed: %s" % (job["id"], str(e)))
+            if usesBrowser:
+                self.closePersonalizer(job["profile"])
+
+    def serve(self):
+        '''
+        Method to run the daemon until it is stopped with SIGTERM, SIGINT or a stop request.
+        All browsers are closed at the end.
+        '''
+        if os.path.exists(self.socketPath):
+            os.remove(self.socketPath)
+        self.server = jobServer(self.socketPath, jobHandler)
+        self.server.daemon = self
+        threading.Thread(target=self.server.serve_forever,
+                         name="jobServer", daemon=True).start()
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        signal.signal(signal.SIGINT, lambda signum, frame: self.stop())
+        logging.info("daemon listening on " + self.socketPath)
+
+        try:
+            while True:
+                job = self.nextJob()
+                if job is None:
+                    break
+                self.runJob(job)
+        finally:
+            self.server.shutdown()
+            self.server.server_close()
+            os.remove(self.socketPath)
+            for profileName in list(self.personalizers):
+                self.closePersonalizer(profileName)
+            logging.info("daemon stopped, %s queued jobs dropped" %
+                         len(self.jobs))
+
+    def stop(self):
+        '''
+        Method to stop the daemon after the running job
+        '''
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+
+def send(socketPath, request, timeout=10):
+    '''
+    Function to send a request to a running daemon.
+
+    Parameters:
+        socketPath:
+            path of the unix socket of the daemon
+        request:
+            job, {"type": "status"} or {"type": "stop"}
+        (timeout):
+            seconds to wait for the response
+
+    Returns:
+        Dict
+            response of the daemon
+    '''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(socketPath)
+        client.sendall((json.dumps(request) + "\n").encode())
+        with client.makefile("rb") as response:
+            return json.loads(response.readline())
@@ -0,0 +1,224 @@
+from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor
+import json
+import logging
+
+from scraper.fetching import rawPage
+
+# elements which never contain the text of the article
+boilerplateTags = ["script", "style", "noscript", "nav", "header", "footer",
+                   "aside", "form", "iframe", "svg", "button", "figure"]
+
+# minimum length of a paragraph to be counted as article text
+minParagraphLength = 40
+
+# JSON-LD types which describe an article
+articleTypes = ["NewsArticle", "Article", "ReportageNewsArticle",
+                "AnalysisNewsArticle", "OpinionNewsArticle", "BlogPosting", "LiveBlogPosting"]
+
+
+def extractArticle(html, url=None):
+    '''
+    Function to extract the main text and the metadata of an article website.
+    The metadata is taken from JSON-LD, the og: meta tags and <link rel=canonical>
+    in this order. The main text is the text of the paragraphs of the element
+    with the most paragraph text, after removing navigation, scripts and similar boilerplate.
+
+    Parameters:
+        html:
+            source code of the article website as str or rawPage
+        (url):
+            URL of the website, used if no canonical URL is found
+
+    Returns:
+        Dict
+            headline, publisher, canonicalUrl, publishDate, text
+    '''
+    soup = BeautifulSoup(rawPage.toText(html), 'html.parser')
+
+    linkedData = getLinkedData(soup)
+    meta = getMetaTags(soup)
+    canonical = soup.find("link", rel="canonical")
+
+    publisher = linkedData.get("publisher")
+    if isinstance(publisher, dict):
+        publisher = publisher.get("name")
+
+    extract = {
+        "headline": linkedData.get("headline") or meta.get("og:title") or getTitle(soup),
+        "publisher": publisher or meta.get("og:site_name"),
+        "canonicalUrl": (canonical.get("href") if canonical else None) or meta.get("og:url") or url,
+        "publishDate": linkedData.get("datePublished") or meta.get("article:published_time"),
+        "text": linkedData.get("articleBody") or getMainText(soup)
+    }
+    return extract
+
+
+def getLinkedData(soup):
+    '''
+    Returns the first JSON-LD object of the website which describes an article.
+    Objects in lists and in @graph are searched as well.
+
+    Parameters:
+        soup:
+            BeautifulSoup of the website
+
+    Returns:
+        Dict
+            JSON-LD object or an empty dict
+    '''
+    for script in soup.find_all("script", type="application/ld+json"):
+        try:
+            data = json.loads(script.string or "")
+        except ValueError:
+            continue
+
+        candidates = data if isinstance(data, list) else [data]
+        while candidates:
+            candidate = candidates.pop(0)
+            if not isinstance(candidate, dict):
+                continue
+            candidates += candidate.get("@graph", [])
+            types = candidate.get("@type")
+            types = types if isinstance(types, list) else [types]
+            if any(t in articleTypes for t in types):
+                return candidate
+    return {}
+
+
+def getMetaTags(soup):
+    '''
+    Returns the og: and article: meta tags of the website.
+
+    Parameters:
+        soup:
+            BeautifulSoup of the website
+
+    Returns:
+        Dict
+            property: content
+    '''
+    meta = {}
+    for tag in soup.find_all("meta"):
+        key = tag.get("property") or tag.get("name")
+        if key and tag.get("content") and key not in meta:
+            meta[key] = tag["content"]
+    return meta
+
+
+def getTitle(soup):
+    '''
+    Returns the title of the website or None
+    '''
+    if soup.title and soup.title.string:
+        return soup.title.string.strip()
+    return None
+
+
+def getMainText(soup):
+    '''
+    Returns the main text of the website without boilerplate.
+    Every paragraph adds its text length to its parent element,
+    the paragraphs of the parent with the most text are the main text.
+
+    Parameters:
+        soup:
+            BeautifulSoup of the website. Boilerplate elements are removed from it.
+
+    Returns:
+        str
+            paragraphs separated by new lines
+    '''
+    for tag in soup.find_all(boilerplateTags):
+        tag.decompose()
+
+    scores = {}
+    parents = {}
+    for paragraph in soup.find_all("p"):
+        text = paragraph.get_text(" ", strip=True)
+        if len(text) < minParagraphLength or paragraph.parent is None:
+            continue
+        key = id(paragraph.parent)
+        parents[key] = paragraph.parent
+        scores[key] = scores.get(key, 0) + len(text)
+
+    if not scores:
+        return None
+
+    best = parents[max(scores, key=scores.get)]
+    paragraphs = [p.get_text(" ", strip=True) for p in best.find_all("p")]
+    return "\n".join(p for p in paragraphs if len(p) >= minParagraphLength)
+
+
+def safeExtractArticle(html, url=None):
+    '''
+    Wrapper of extractArticle for the worker processes, which returns None instead of raising.
+    '''
+    try:
+        return extractArticle(html, url)
+    except Exception as e:
+        logging.error("article could not be extracted: " + str(e))
+        return None
+
+
+class extractionPool:
+    '''
+    Worker pool which extracts articles in separate processes, so the download of
+    further articles is not slowed down by parsing.
+    '''
+
+    def __init__(self, workers=2):
+        '''
+        Method to create an extraction pool.
+        Parameters:
+            (workers):
+                number of worker processes
+        '''
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        logging.info("extraction pool started with %s workers", workers)
+
+    def submit(self, html, url=None):
+        '''
+        Method to queue an article for extraction.
+
+        Parameters:
+            html:
+                source code of the article website as str or rawPage.
+            The rawPage is decoded in the worker process. If None, nothing is queued.
+            (url):
+                URL of the article
+
+        Returns:
+            Future of the extraction or None
+        '''
+        if not html:
+            return None
+        return self.executor.submit(safeExtractArticle, html, url)
+
+    def resolve(self, articles, field="extract"):
+        '''
+        Method to wait for the extractions of a list of articles.
+        The futures in article[field] are replaced by their results.
+
+        Parameters:
+            articles:
+                list of article dicts
+            (field):
+                field in which the future is stored
+        '''
+        for article in articles:
+            future = article.get(field)
+            if future is None or isinstance(future, dict):
+                continue
+            try:
+                article[field] = future.result()
+            except Exception as e:
+                logging.error("article could not be extracted: " + str(e))
+                article[field] = None
+
+    def close(self):
+        '''
+        Method to stop the worker processes after all queued extractions are done.
+        '''
+        self.executor.shutdown(wait=True)
+        logging.info("extraction pool closed")
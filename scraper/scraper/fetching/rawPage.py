@@ -0,0 +1,176 @@
+import urllib.request
+import codecs
+import re
+
+
+# Der User Agent wurde verändert um Bot Detection zu verhindern
+defaultHeaders = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_3) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/35.0.1916.47 Safari/537.36'
+}
+
+# charset used if the response neither declares one nor contains a meta tag
+defaultCharset = "utf-8"
+# charset used if the body can not be decoded with the declared charset.
+# windows-1252 covers ISO-8859-1 pages which are declared as UTF-8
+fallbackCharset = "windows-1252"
+
+# number of bytes searched for a meta charset or an XML declaration
+sniffLength = 2048
+metaCharsetPattern = re.compile(
+    rb'<meta[^>]+charset\s*=\s*["\']?\s*([\w:.-]+)', re.IGNORECASE)
+xmlEncodingPattern = re.compile(
+    rb'<\?xml[^>]+encoding\s*=\s*["\']([\w:.-]+)', re.IGNORECASE)
+
+
+class rawPage:
+    '''
+    Downloaded page as raw bytes with its charset.
+    The body is only decoded when text is accessed, e.g. by a parser.
+    The bytes are stored in the database as they were received.
+    '''
+    __slots__ = ("body", "charset", "url")
+
+    def __init__(self, body, charset=None, url=None):
+        '''
+        Method to create a rawPage.
+
+        Parameters:
+            body:
+                bytes of the response
+            (charset):
+                charset declared in the Content-Type header. If None, it is detected from the body.
+            (url):
+                URL of the page after redirection
+        '''
+        self.body = body
+        self.charset = validCharset(charset) or detectCharset(body)
+        self.url = url
+
+    @property
+    def text(self):
+        '''
+        Returns the body decoded with the charset of the page.
+        If the body is not valid in this charset, it is decoded with fallbackCharset.
+        '''
+        return decode(self.body, self.charset)
+
+    def __len__(self):
+        return len(self.body)
+
+    def __bool__(self):
+        return bool(self.body)
+
+
+def validCharset(charset):
+    '''
+    Returns the normalized name of a charset or None if Python does not know it
+    '''
+    if not charset:
+        return None
+    if isinstance(charset, bytes):
+        charset = charset.decode("ascii", "ignore")
+    try:
+        return codecs.lookup(charset.strip()).name
+    except LookupError:
+        return None
+
+
+def detectCharset(body):
+    '''
+    Detects the charset of a body from a meta tag or an XML declaration in the first
+    sniffLength bytes.
+
+    Parameters:
+        body:
+            bytes of the page
+
+    Returns:
+        name of the charset, defaultCharset if none is found
+    '''
+    head = body[:sniffLength]
+    for pattern in (metaCharsetPattern, xmlEncodingPattern):
+        match = pattern.search(head)
+        if match and validCharset(match.group(1)):
+            return validCharset(match.group(1))
+    return defaultCharset
+
+
+def decode(body, charset):
+    '''
+    Decodes bytes with a charset. Bodies which are not valid in the charset are decoded
+    with fallbackCharset instead of being lost.
+
+    Parameters:
+        body:
+            bytes
+        charset:
+            name of the charset
+
+    Returns:
+        str
+    '''
+    try:
+        return body.decode(charset or defaultCharset)
+    except (UnicodeDecodeError, LookupError):
+        return body.decode(fallbackCharset, errors="replace")
+
+
+def fetch(url, timeout=10, headers=None):
+    '''
+    Function to download a page without decoding it.
+
+    Parameters:
+        url:
+            URL of the page
+        (timeout):
+            timeout of the download in seconds
+        (headers):
+            request headers, default is defaultHeaders
+
+    Returns:
+        rawPage
+    '''
+    request = urllib.request.Request(
+        url, data=None, headers=defaultHeaders if headers is None else headers)
+    response = urllib.request.urlopen(request, timeout=timeout)
+    body = response.read()
+    return rawPage(body, response.headers.get_content_charset(), response.url)
+
+
+def toText(value, charset=None):
+    '''
+    Function to get the text of a page field in any form it is passed or stored:
+    str, rawPage or raw bytes with their charset as stored in the database.
+
+    Parameters:
+        value:
+            str, rawPage, bytes or None
+        (charset):
+            charset of bytes, e.g. the field <field>Charset of a document
+
+    Returns:
+        str or None
+    '''
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, rawPage):
+        return value.text
+    return decode(bytes(value), validCharset(charset) or detectCharset(value))
+
+
+def documentText(document, field):
+    '''
+    Function to get the text of an HTML field of a stored document.
+    Documents collected before the raw capture contain str, newer ones bytes and
+    the charset in <field>Charset.
+
+    Parameters:
+        document:
+            document from the database
+        field:
+            name of the field, e.g. html or finalPage
+
+    Returns:
+        str or None
+    '''
+    return toText(document.get(field), document.get(field + "Charset"))
@@ -1,24 +1,37 @@
 from selenium import webdriver
 from bs4 import BeautifulSoup
-from datetime import datetime
 import logging
-import urllib
 import time
 
+from scraper.records import pageRecords
+from scraper.fetching import rawPage
 
 class flipboard_page:
     '''
     This class symbolizes a flipboard page
     '''
 
-    def __init__(self, html):
+    def __init__(self, html, extractionPoolInstance=None, harvestedItems=None, deadlineInstance=None,
+                 checkpointInstance=None):
         '''
         Method to create a flipboard page instance
         Parameters:
             html: source code of the page
+            (extractionPoolInstance): extractionPool to extract the text and metadata of the articles
+            (harvestedItems): articles harvested while scrolling (personalizer.harvestScroll).
+                If given, they are used instead of the article elements of html.
+            (deadlineInstance): stageDeadline of the downloads. If it expires, the remaining
+                articles are skipped and incomplete is set.
+            (checkpointInstance): runCheckpoint.pageCheckpoint of the page. Every downloaded article
+                is stored, articles stored by an earlier attempt of the run are not downloaded again.
         '''
 
         self.html = html
+        self.extractionPool = extractionPoolInstance
+        self.harvestedItems = harvestedItems
+        self.deadline = deadlineInstance
+        self.checkpoint = checkpointInstance
+        self.incomplete = False
         self.soup = BeautifulSoup(html, 'html.parser')
         logging.info("flipboardPage instance created")
 
@@ -33,7 +46,7 @@ class flipboard_page:
             mydivs = self.soup.findAll("li", {"class": "item-list__item"})
             return mydivs
         except Exception as e:
-            logging.info("articleList could not be found: "+e)
+            logging.info("articleList could not be found: %s", e)
 
     def getAllArticles(self):
         '''
@@ -43,27 +56,52 @@ class flipboard_page:
         From thta the return structure is created. 
         Erroneous articles are discarded and an error is pushed to the log file.
         Returns:
-            List of all articles in a structured form: 
+            List of all articles as flipboardArticleRecord: 
                 url: article url
                 timestamp: time of save
-                html: html sourcecode of the article
+                html: rawPage of the html sourcecode of the article
+                (scrollDepth): distance of a harvested article from the top of the page in pixels
+                (extract): headline, publisher, canonicalUrl, publishDate and text of the article
         '''
         logging.info("getting Articles from Flipboard")
-        rawArticles = self.get_article_list_items_html()
+        if self.harvestedItems is not None:
+            rawArticles = [(item["html"], item["depth"])
+                           for item in self.harvestedItems]
+        else:
+            rawArticles = [(str(article), None)
+                           for article in self.get_article_list_items_html() or []]
+        # der Parse Tree der Seite wird nach dem Auslesen der Artikelelemente freigegeben
+        self.soup = None
         articles = []
-        for article in rawArticles:
+        for article, scrollDepth in rawArticles:
+            if self.deadline is not None and self.deadline.expired():
+                logging.error("downloads of Flipboard stopped by deadline")
+                self.incomplete = True
+                break
             try:
-                article = flipboard_articleElement(str(article))
-                articleDict = {
-                    "url": article.url,
-                    "timestamp": datetime.utcnow(),
-                    "html": article.html}
-                time.sleep(1)
+                # bereits heruntergeladene Artikel werden aus dem Checkpoint übernommen
+                articleRecord = self.checkpoint.restore(
+                    article, pageRecords.flipboardArticleRecord) if self.checkpoint else None
+                downloaded = articleRecord is None
+                if downloaded:
+                    articleElement = flipboard_articleElement(article)
+                    articleRecord = pageRecords.flipboardArticleRecord(
+                        articleElement.url, articleElement.html)
+                    if scrollDepth is not None:
+                        articleRecord.scrollDepth = scrollDepth
+                    if self.checkpoint:
+                        self.checkpoint.put(article, articleRecord)
+                if self.extractionPool:
+                    articleRecord.extract = self.extractionPool.submit(
+                        articleRecord.html, articleRecord.url)
+                articles.append(articleRecord)
+                if downloaded:
+                    time.sleep(1)
             except Exception as e:
-                logging.error("article could not be parsed "+str(e))
-
-            articles.append(articleDict)
+                logging.error("article could not be parsed: %s", e)
 
+        if self.extractionPool:
+            self.extractionPool.resolve(articles)
         return(articles)
 
     def getHtml(self):
@@ -90,9 +128,10 @@ class flipboard_articleElement:
                 element that represents an article. 
                 eg. html tag "li" with class "item-list_item"
         '''
-        self.articleHtml = articleHtml
         self.soup = BeautifulSoup(articleHtml, 'html.parser')
         self.get_link()
+        # der Parse Tree wird vor dem Download freigegeben
+        self.soup = None
         self.getHtml()
 
     def get_link(self):
@@ -109,23 +148,12 @@ class flipboard_articleElement:
         '''
         downloads the HTML code of the article. 
         The user agent of urllib was changed to prevent bot detection. 
-        self.html and self. url are set form content
+        self.html is set to the rawPage and self.url to the url after redirection
         '''
         logging.info("  downloading page")
         try:
-
-            # Der User Agent wurde verändert um Bot Detection zu verhindern
-            req = urllib.request.Request(
-                self.flipboardLink,
-                data=None,
-                headers={
-                    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_3) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/35.0.1916.47 Safari/537.36'
-                }
-            )
-
-            response = urllib.request.urlopen(req, timeout=4)
-            self.html = response.read().decode('utf-8')
-            self.url = response.url
+            self.html = rawPage.fetch(self.flipboardLink, timeout=4)
+            self.url = self.html.url
             logging.info("  page downloaded")
         except Exception as e:
-            logging.error("  download failed: " + str(e))
+            logging.error("  download failed: %s", e)
@@ -0,0 +1,189 @@
+import threading
+import binascii
+import base64
+import re
+
+
+# ID of an article in a Google News link, e.g. ./articles/CBMiT2h0dHBzOi8v...?hl=de
+articleIdPattern = re.compile(r"/(?:rss/)?(?:articles|read)/([A-Za-z0-9_-]+)")
+
+# field of the protobuf message with the AMP version of the article
+ampField = 26
+
+# start of the IDs used since 2024. They contain a token instead of the URL,
+# the URL is only returned by Google, so the referrer page is needed.
+tokenPrefix = b"AU_yqL"
+
+# reasons why a link can not be decoded
+reasons = ["noId", "invalid", "token", "noUrl"]
+
+
+def articleId(link):
+    '''
+    Returns the article ID of a Google News link, None if the link contains none
+    '''
+    match = articleIdPattern.search(link or "")
+    return match.group(1) if match else None
+
+
+def readVarint(data, position):
+    '''
+    Function to read a protobuf varint.
+
+    Parameters:
+        data:
+            bytes of the message
+        position:
+            position of the first byte of the varint
+
+    Returns:
+        value and position after the varint
+
+    Raises:
+        ValueError if the message ends within the varint
+    '''
+    value = shift = 0
+    while True:
+        if position >= len(data) or shift > 63:
+            raise ValueError("truncated varint")
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, position
+
+
+def protobufStrings(data):
+    '''
+    Function to read the length-delimited fields of the top level of a protobuf message.
+    Fields of other wire types are skipped.
+
+    Parameters:
+        data:
+            bytes of the message
+
+    Returns:
+        list of field number and bytes of the field
+
+    Raises:
+        ValueError if the data is no valid protobuf message
+    '''
+    fields = []
+    position = 0
+    while position < len(data):
+        key, position = readVarint(data, position)
+        fieldNumber, wireType = key >> 3, key & 0x07
+        if fieldNumber == 0:
+            raise ValueError("invalid field number")
+        if wireType == 0:
+            _, position = readVarint(data, position)
+        elif wireType == 1:
+            position += 8
+        elif wireType == 5:
+            position += 4
+        elif wireType == 2:
+            length, position = readVarint(data, position)
+            if position + length > len(data):
+                raise ValueError("truncated field")
+            fields.append((fieldNumber, data[position:position + length]))
+            position += length
+        else:
+            raise ValueError("unsupported wire type %s" % wireType)
+    if position > len(data):
+        raise ValueError("truncated field")
+    return fields
+
+
+def decodeArticleId(articleIdValue):
+    '''
+    Function to decode the URL of the publisher from a Google News article ID without a
+    network call. The ID is a base64 (URL-safe, without padding) encoded protobuf message
+    whose string fields contain the URL of the article and possibly its AMP version.
+
+    Parameters:
+        articleIdValue:
+            article ID from a Google News link, see articleId
+
+    Returns:
+        URL and None, or None and the reason why the ID can not be decoded (one of reasons)
+    '''
+    if not articleIdValue:
+        return None, "noId"
+    try:
+        data = base64.urlsafe_b64decode(articleIdValue + "=" * (-len(articleIdValue) % 4))
+        fields = protobufStrings(data)
+    except (ValueError, binascii.Error):
+        return None, "invalid"
+    urls = []
+    for fieldNumber, value in fields:
+        if value.startswith(tokenPrefix):
+            return None, "token"
+        if value.startswith((b"http://", b"https://")):
+            try:
+                urls.append((fieldNumber == ampField, value.decode("utf-8")))
+            except UnicodeDecodeError:
+                continue
+    if not urls:
+        return None, "noUrl"
+    # the article is preferred over its AMP version
+    return sorted(urls, key=lambda url: url[0])[0][1], None
+
+
+def decodeLink(link):
+    '''
+    Returns the URL of the publisher of a Google News link and None, or None and the reason why
+    the link can not be decoded (one of reasons)
+    '''
+    return decodeArticleId(articleId(link))
+
+
+class decoderStats:
+    '''
+    Counts how the URLs of the articles of a page were found:
+        decoded: decoded from the link without a network call
+        referrer: read from the referrer page after the link could not be decoded
+        failed: neither decoded nor found on the referrer page
+        reasons: number of links per reason why they could not be decoded
+    '''
+
+    def __init__(self):
+        self.decoded = 0
+        self.referrer = 0
+        self.failed = 0
+        self.reasons = {}
+        self.lock = threading.Lock()
+
+    def addDecoded(self):
+        '''
+        Method to count a decoded link
+        '''
+        with self.lock:
+            self.decoded += 1
+
+    def addFallback(self, reason, found):
+        '''
+        Method to count a link which was resolved with the referrer page
+
+        Parameters:
+            reason:
+                reason why the link could not be decoded
+            found:
+                True if the URL was found on the referrer page
+        '''
+        with self.lock:
+            self.reasons[reason] = self.reasons.get(reason, 0) + 1
+            if found:
+                self.referrer += 1
+            else:
+                self.failed += 1
+
+    def report(self):
+        '''
+        Returns the counts and hitRate, the part of the links decoded without a network call
+        '''
+        with self.lock:
+            total = self.decoded + self.referrer + self.failed
+            return {"decoded": self.decoded, "referrer": self.referrer, "failed": self.failed,
+                    "reasons": dict(self.reasons),
+                    "hitRate": round(self.decoded / total, 3) if total else None}
@@ -1,24 +1,44 @@
 
 from bs4 import BeautifulSoup
-import urllib
 import logging
 import time
 
+from scraper.records import pageRecords
+from scraper.fetching import rawPage
+from scraper.newsPages import googleNewsLinks
 
 class GoogleNewsPage:
     '''
     This class represents a Google News page
     '''
 
-    def __init__(self, html):
+    def __init__(self, html, extractionPoolInstance=None, harvestedItems=None, deadlineInstance=None,
+                 decodeLinks=True, checkpointInstance=None):
         '''
         Method to create a Google News page instance. 
         At creation the article area and the "Panorama" area is saved
         Parameter:
             html: HTML code to the website
+            (extractionPoolInstance): extractionPool to extract the text and metadata of the articles
+            (harvestedItems): tiles harvested while scrolling (personalizer.harvestScroll).
+                If given, they are used instead of the tiles of the article area of html.
+            (deadlineInstance): stageDeadline of the downloads. If it expires, the remaining
+                articles are skipped and incomplete is set.
+            (decodeLinks): if True, the URLs of the articles are decoded from their links and the
+                referrer page is only downloaded for links which can not be decoded.
+                The counts are kept in linkStats.
+            (checkpointInstance): runCheckpoint.pageCheckpoint of the page. Every downloaded article
+                is stored, articles stored by an earlier attempt of the run are not downloaded again.
         '''
         logging.info("creating Google News Page Instance")
         self.html = html
+        self.extractionPool = extractionPoolInstance
+        self.harvestedItems = harvestedItems
+        self.deadline = deadlineInstance
+        self.incomplete = False
+        self.decodeLinks = decodeLinks
+        self.linkStats = googleNewsLinks.decoderStats()
+        self.checkpoint = checkpointInstance
         self.soup = BeautifulSoup(html, 'html.parser')
         self.getArticleArea()
         self.getPanoramaArea()
@@ -42,7 +62,7 @@ class GoogleNewsPage:
                 "div", {'class': "lBwEZb BL5WZb xP6mwf"})
             return self.articleArea
         except Exception as e:
-            logging.error("could not find Article Area " + e)
+            logging.error("could not find Article Area: %s", e)
 
     def getPanoramaArea(self):
         '''
@@ -55,7 +75,7 @@ class GoogleNewsPage:
                 "div", {'class': "ndSf3d eDrqsc eVhOjb XWHGK j7vNaf Pz9Pcd a8arzf"})
             return self.panoramaArea
         except Exception as e:
-            logging.error("could not find Panorama Area "+e)
+            logging.error("could not find Panorama Area: %s", e)
 
     def getArticlesFromArticleArea(self):
         '''
@@ -63,22 +83,30 @@ class GoogleNewsPage:
         Searches for all tiles in the article area. All articles are then extracted from the tiles.
         All tiles are saved with associated articles.
         Returns:
-            List of all tiles in structured form:
+            List of all tiles as tileRecord:
             tileType: singleField or multifield. Type of tile
-            articles: all articles of a tile in the following form:
+            (scrollDepth): distance of a harvested tile from the top of the page in pixels
+            articles: all articles of a tile as googleNewsArticleRecord:
                 googleLink: Google referrer page
                 url: last url after redirection
                 timestamp: timestamp of the download
                 age: age of the article
-                referrerPage: html of the referrer page
-                finalPage: last source code after redirection
+                referrerPage: rawPage of the referrer page
+                finalPage: rawPage of the last source code after redirection
 
         '''
 
-        tiles = self.articleArea.findAll("div", {"class": "NiLAwe"})
+        if self.harvestedItems is not None:
+            tiles = [(BeautifulSoup(item["html"], 'html.parser'), item["depth"])
+                     for item in self.harvestedItems]
+        else:
+            tiles = [(tile, None)
+                     for tile in self.articleArea.findAll("div", {"class": "NiLAwe"})]
 
         tileList = []
-        for tile in tiles:
+        for tile, scrollDepth in tiles:
+            if self.downloadsStopped():
+                break
 
             logging.info("  analyzing tile")
             rawArticles = tile.findAll("article")
@@ -94,24 +122,22 @@ class GoogleNewsPage:
 
             articles = []
             for article in rawArticles:
+                if self.downloadsStopped():
+                    break
+                downloaded = True
                 try:
-                    article = GoogleNewsArticle(str(article))
-
-                    articleDict = {
-                        "googleLink": article.googleLink,
-                        "url": article.url,
-                        "timestamp": time.asctime(),
-                        "age": article.age,
-                        "referrerPage": article.referrerPage,
-                        "finalPage": article.finalPage}
-
-                    articles.append(articleDict)
+                    articleRecord, downloaded = self.analyzeArticle(
+                        str(article), pageRecords.googleNewsArticleRecord)
+                    articles.append(articleRecord)
                 except Exception as e:
-                    logging.error("article could not be analyzed: "+str(e))
-                time.sleep(0.5)
+                    logging.error("article could not be analyzed: %s", e)
+                if downloaded:
+                    time.sleep(0.5)
 
-            elem = {"tileType": tileType, "articles": articles}
-            tileList.append(elem)
+            tileRecord = pageRecords.tileRecord(tileType, articles)
+            if scrollDepth is not None:
+                tileRecord.scrollDepth = scrollDepth
+            tileList.append(tileRecord)
 
         return tileList
 
@@ -121,38 +147,34 @@ class GoogleNewsPage:
         Searches all tiles in the panorama area. All articles are then extracted from the tiles.
         All tiles with associated articles are saved.
         Returns:
-            List of all tiles in structured form:
+            tileRecord of the panorama area:
             tileType: panorama, type of tile
-            articles: all articles of a tile in the following form:
+            articles: all articles of a tile as panoramaArticleRecord:
                 googleLink: Google referrer page
                 url: last url after redirection
                 timestamp: timestamp of the download
                 age: age of the article
-                referrerPage: html of the referrer page
-                finalPage: last source code after redirection
+                referrerPage: rawPage of the referrer page
+                finalPage: rawPage of the last source code after redirection
         '''
         rawArticles = self.panoramaArea.findAll("article")
 
         articles = []
         for article in rawArticles:
+            if self.downloadsStopped():
+                break
             try:
                 logging.info("    analyzing article")
-                article = GoogleNewsArticle(str(article))
-
-                articleDict = {
-                    "googleLink": article.googleLink,
-                    "url": article.url,
-                    "timestamp": time.asctime(),
-                    "alter": article.age,
-                    "referrerPage": article.referrerPage,
-                    "finalPage": article.finalPage}
-
-                articles.append(articleDict)
-                time.sleep(1)
+                articleRecord, downloaded = self.analyzeArticle(
+                    str(article), pageRecords.panoramaArticleRecord)
+
+                articles.append(articleRecord)
+                if downloaded:
+                    time.sleep(1)
             except Exception as e:
-                logging.error("article could not be analyzed" + str(e))
+                logging.error("article could not be analyzed: %s", e)
 
-        return {"tileType": "Panorama", "articles": articles}
+        return pageRecords.tileRecord("Panorama", articles)
 
     def getAllArticles(self):
         '''
@@ -160,28 +182,78 @@ class GoogleNewsPage:
         Searches for all tiles. All articles are then extracted from the tiles.
         All tiles saved with associated articles.
         Returns:
-            List of all tiles in structured form:
+            List of all tiles as tileRecord:
             tileType: panorama, single tile, multi tile. Tile type
-            articles: all articles of a tile in the following form:
+            articles: all articles of a tile as googleNewsArticleRecord:
                 googleLink: Google referrer page
                 url: last url after redirection
                 timestamp: timestamp of the download
                 age: age of the article
-                referrerPage: html of the referrer page
-                finalPage: last source code after redirection
+                referrerPage: rawPage of the referrer page
+                finalPage: rawPage of the last source code after redirection
+                (extract): headline, publisher, canonicalUrl, publishDate and text of the article
         '''
 
         articles = self.getArticlesFromArticleArea()
         articles.append(self.getArticlesFromPanoramaArea())
+        self.releaseSoup()
+        if self.decodeLinks:
+            logging.info("links of Google News decoded: %s" % self.linkStats.report())
+        if self.extractionPool:
+            for tile in articles:
+                self.extractionPool.resolve(tile.articles)
         return articles
 
+    def analyzeArticle(self, articleHtml, recordClass):
+        '''
+        Method to download an article element and create its record.
+        An article with a checkpoint is restored instead of downloaded.
+        Parameters:
+            articleHtml: html of the article element
+            recordClass: googleNewsArticleRecord or panoramaArticleRecord
+        Returns:
+            record of the article and True if it was downloaded
+        '''
+        articleRecord = self.checkpoint.restore(articleHtml, recordClass) if self.checkpoint else None
+        downloaded = articleRecord is None
+        if downloaded:
+            article = GoogleNewsArticle(articleHtml, self.decodeLinks, self.linkStats)
+            articleRecord = recordClass(
+                article.googleLink, article.url, article.age,
+                article.referrerPage, article.finalPage, urlSource=article.urlSource)
+            if self.checkpoint:
+                self.checkpoint.put(articleHtml, articleRecord)
+        if self.extractionPool:
+            articleRecord.extract = self.extractionPool.submit(
+                articleRecord.finalPage, articleRecord.url)
+        return articleRecord, downloaded
+
+    def downloadsStopped(self):
+        '''
+        Returns True if the deadline of the downloads has passed. The remaining articles are
+        skipped and the page is marked as incomplete.
+        '''
+        if self.deadline is not None and self.deadline.expired() and not self.incomplete:
+            logging.error("downloads of Google News stopped by deadline")
+            self.incomplete = True
+        return self.incomplete
+
+    def releaseSoup(self):
+        '''
+        Releases the parse tree of the page after the articles have been extracted.
+        The html is kept for getHtml.
+        '''
+        self.soup = None
+        self.articleArea = None
+        self.panoramaArea = None
+
 
 class GoogleNewsArticle:
     '''
     Klasse zum repräsentieren eines GoogleNews Artikelements
     '''
 
-    def __init__(self, articleHtml):
+    def __init__(self, articleHtml, decodeLink=False, linkStats=None):
         '''
         This is a method to create a Google News article element.
         It extracts Html and article link from an element representing an article
@@ -189,13 +261,37 @@ class GoogleNewsArticle:
             articleHtml: 
                 Element representing an article element. 
                 Can be for example the html tag "article".
+            (decodeLink):
+                if True, the url is decoded from the link and the referrer page is
+                only downloaded if the link can not be decoded
+            (linkStats):
+                googleNewsLinks.decoderStats counting decoded and not decoded links
         '''
-        self.articleHtml = articleHtml
         self.soup = BeautifulSoup(articleHtml, 'html.parser')
         self.getLink()
-        self.getReferrerPage()
-        self.getFinalPage()
         self.getAge()
+        # der Parse Tree wird vor den Downloads freigegeben
+        self.soup = None
+        self.referrerPage = None
+        self.url = None
+        self.urlSource = None
+        reason = None
+        if decodeLink:
+            self.url, reason = googleNewsLinks.decodeLink(self.googleLink)
+        if self.url is not None:
+            # die Url wurde ohne Download der Weiterleitungsseite gefunden
+            self.urlSource = "decoded"
+            if linkStats is not None:
+                linkStats.addDecoded()
+        else:
+            self.getReferrerPage()
+            try:
+                self.getUrlFromReferrer()
+                self.urlSource = "referrer"
+            finally:
+                if linkStats is not None and decodeLink:
+                    linkStats.addFallback(reason, self.url is not None)
+        self.getFinalPage()
 
     def getLink(self):
         '''
@@ -206,48 +302,34 @@ class GoogleNewsArticle:
 
     def getReferrerPage(self):
         '''
-        Downloads the referrer page and stores it in self.referrerPage
+        Downloads the referrer page and stores it as rawPage in self.referrerPage
         '''
         logging.info("    downloading Html of Google News Article")
         try:
-            # Der User Agent wurde verändert um Bot Detection zu verhindern
-            req = urllib.request.Request(
-                self.googleLink,
-                data=None,
-                headers={
-                    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_3) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/35.0.1916.47 Safari/537.36'
-                }
-            )
-            response = urllib.request.urlopen(req, timeout=5)
-            self.referrerPage = response.read().decode('utf-8')
+            self.referrerPage = rawPage.fetch(self.googleLink, timeout=5)
 
         except Exception as e:
-            logging.error("     could not download referrer page: " + str(e))
+            logging.error("     could not download referrer page: %s", e)
             self.referrerPage = None
 
+    def getUrlFromReferrer(self):
+        '''
+        extracts the link to the article from the referrer page and stores it in self.url
+        '''
+        soup = BeautifulSoup(rawPage.toText(self.referrerPage), 'html.parser')
+        self.url = soup.find("a", attrs={"jsname": "tljFtd"})["href"]
+
     def getFinalPage(self):
         '''
-        extracts the link to the article from the referrer page, downloads the page
-        and stores the link and the page of the article in self.finalPage
+        downloads the page of the article and stores it as rawPage in self.finalPage
         '''
-        soup = BeautifulSoup(self.referrerPage, 'html.parser')
         try:
-            self.url = soup.find("a", attrs={"jsname": "tljFtd"})["href"]
-            # Der User Agent wurde verändert um Bot Detection zu verhindern
-            req = urllib.request.Request(
-                self.url,
-                data=None,
-                headers={
-                    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_3) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/35.0.1916.47 Safari/537.36'
-                }
-            )
-            response = urllib.request.urlopen(req, timeout=5)
-            self.finalPage = response.read().decode('utf-8')
+            self.finalPage = rawPage.fetch(self.url, timeout=5)
 
             logging.info("     download successfull")
 
         except Exception as e:
-            logging.error("     could not download final page: " + str(e))
+            logging.error("     could not download final page: %s", e)
             self.finalPage = None
 
     def getAge(self):
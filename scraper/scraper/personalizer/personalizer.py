@@ -11,6 +11,46 @@ from datetime import datetime
 
 import os
 import shutil
+import signal
+
+from scraper.records import pageRecords
+from scraper.personalizer import sleepPolicy
+
+
+# URLs of the websites used by the personalizer. They can be replaced, e.g. by mock sites for benchmarks.
+defaultSiteUrls = {
+    "youtube": "https://www.youtube.com/",
+    "amazon": "https://www.amazon.de/",
+    "google": "https://www.google.de/",
+    "ebay": "https://www.ebay.de/",
+    "googleNews": "https://news.google.de/",
+    "flipboard": "https://flipboard.com/",
+    "adsSettings": "https://adssettings.google.com/authenticated",
+    "location": "https://www.whatismyip-address.com/?check"
+}
+
+
+# CSS selectors of the items harvested while scrolling (see harvestScroll)
+harvestSelectors = {
+    "googleNews": "div.NiLAwe",
+    "flipboard": "li.item-list__item"
+}
+
+# script returning the items which are not yet known, with their key, position and html
+harvestScript = '''
+var known = new Set(arguments[1]);
+var elements = document.querySelectorAll(arguments[0]);
+var items = [];
+for (var i = 0; i < elements.length; i++) {
+    var link = elements[i].querySelector("a[href]");
+    var key = link ? link.href : elements[i].outerHTML.slice(0, 500);
+    if (known.has(key)) { continue; }
+    known.add(key);
+    items.push([key, Math.round(elements[i].getBoundingClientRect().top + window.scrollY), elements[i].outerHTML]);
+}
+return {"items": items, "height": document.body.scrollHeight,
+        "bottom": window.scrollY + window.innerHeight};
+'''
 
 
 class personalizer:
@@ -22,18 +62,28 @@ class personalizer:
     Chrome profile and calling Flipboard or Google News.
     '''
 
-    def __init__(self, profilePath, userAgent, profileName):
+    def __init__(self, profilePath, userAgent, profileName, screenshotStoreInstance=None,
+                 sleepPolicyInstance=None, siteUrls=None, headless=False):
         '''
         Method to prepare a Personalizer instance.
 
         :param profilePath: Path where the profiles were stored.
         :param userAgent: The user agent to use when using the scraper.
         :param profileName: The name of the profile. Used to select the profile in the profile folder.
+        :param screenshotStoreInstance: screenshotStore which stores the screenshots in GridFS.
+            Without it the PNG is returned in the output of the actions.
+        :param sleepPolicyInstance: sleepPolicy used for all waiting times, default are the real times.
+        :param siteUrls: URLs replacing those of defaultSiteUrls, e.g. of mock sites.
+        :param headless: start Firefox without window.
         '''
         logging.info("personalizer initalizing")
         self.profilePath = profilePath
         self.profileName = profileName
         self.userAgent = userAgent
+        self.screenshotStore = screenshotStoreInstance
+        self.sleep = sleepPolicyInstance or sleepPolicy.sleepPolicy()
+        self.siteUrls = dict(defaultSiteUrls, **(siteUrls or {}))
+        self.headless = headless
         self.createDriver()
         logging.info("personalizer initialized")
 
@@ -55,8 +105,11 @@ class personalizer:
         profile.set_preference('intl.accept_languages', 'de-DE, de')
 
         # open gecokdriver
+        options = webdriver.FirefoxOptions()
+        if self.headless:
+            options.add_argument("-headless")
         driver = webdriver.Firefox(
-            profile)
+            profile, options=options)
 
         # set virtual screen size 1920*1090
         driver.set_window_size(1920, 1080)
@@ -69,20 +122,23 @@ class personalizer:
         addonPath = workingDirectory + \
             "/thirdPartyplugins/firefox/i_dont_care_about_cookies-3.2.9-an+fx.xpi"
 
-        driver.install_addon(
-            addonPath, temporary=True)
+        if os.path.exists(addonPath):
+            driver.install_addon(
+                addonPath, temporary=True)
+        else:
+            logging.error("cookie add-on not found: " + addonPath)
 
         self.driver = driver
-        time.sleep(5)
+        self.closed = False
+        self.sleep.sleep(5)
 
         logging.info("driver created")
 
-    def closeDriver(self):
+    def saveProfile(self):
         '''
-        Method to close the driver
-        The profile is copied from the temporary folder to the profile folder.
+        Method to copy the profile from the temporary folder of the driver to the profile folder.
+        The driver stays open, so a long running process can save the profile after every job.
         '''
-
         mozprofile = self.driver.capabilities["moz:profile"]
         try:
 
@@ -94,13 +150,60 @@ class personalizer:
         path = workingDirectory+"/profile/firefox/"+self.profileName
         if os.path.exists(path):
             shutil.rmtree(path)
-        shutil.copytree(mozprofile, path)
+        shutil.copytree(mozprofile, path,
+                        ignore=shutil.ignore_patterns("lock", ".parentlock"))
+        logging.info("profile saved")
+
+    def closeDriver(self):
+        '''
+        Method to close the driver
+        The profile is copied from the temporary folder to the profile folder.
+        A driver closed by forceClose is not closed again.
+        '''
+        if self.closed:
+            return
+
+        self.saveProfile()
 
-        time.sleep(3)
+        self.sleep.sleep(3)
         self.driver.quit()
+        self.closed = True
 
         logging.info("driver closed")
 
+    def driverProcessId(self):
+        '''
+        Returns the process ID of the geckodriver, None if it is not known
+        '''
+        process = getattr(getattr(self.driver, "service", None), "process", None)
+        return process.pid if process is not None else None
+
+    def forceClose(self):
+        '''
+        Method to close a driver which does not respond, e.g. when a deadline is reached.
+        Firefox and geckodriver are killed, so a hanging call of the driver fails.
+        The profile is then copied from the temporary folder to the profile folder and the
+        temporary folder is removed. Can be called from another thread.
+        '''
+        if self.closed:
+            return
+        self.closed = True
+        logging.error("force-closing driver of profile " + self.profileName)
+        mozprofile = self.driver.capabilities.get("moz:profile")
+        processIds = [self.driver.capabilities.get("moz:processID"), self.driverProcessId()]
+        for processId in processIds:
+            if not processId:
+                continue
+            try:
+                os.kill(processId, signal.SIGKILL)
+            except OSError:
+                pass
+
+        self.saveProfile()
+        if mozprofile:
+            shutil.rmtree(mozprofile, ignore_errors=True)
+        logging.info("driver force-closed")
+
     def __waitForElementByXpath(self, xpath, timeout=10):
         '''
         Helper method to automate waiting for a browser element. 
@@ -120,9 +223,7 @@ class personalizer:
         element = WebDriverWait(self.driver, timeout).until(
             EC.presence_of_element_located((By.XPATH, xpath)))
 
-        delay = randint(1, 3)
-
-        time.sleep(delay)
+        self.sleep.dwell(1, 3)
         return element
 
     def __waitForElementsByXpath(self, xpath, timeout=10):
@@ -145,8 +246,7 @@ class personalizer:
         elements = WebDriverWait(self.driver, timeout).until(
             EC.presence_of_all_elements_located((By.XPATH, xpath)))
 
-        delay = randint(1, 3)
-        time.sleep(delay)
+        self.sleep.dwell(1, 3)
         return elements
 
     def __openLinkOfElem(self, elem):
@@ -164,9 +264,9 @@ class personalizer:
         link = elem.find_element_by_tag_name("a").get_attribute('href')
         self.driver.get(link)
 
-        time.sleep(2)
+        self.sleep.sleep(2)
 
-    def performSession(self, session, shuffleSession=True):
+    def performSession(self, session, shuffleSession=True, deadlineInstance=None):
         '''
         Method to load the list of websites and xpaths stored in the config to:
         - confirm tracking, search Youtube, search Google, search
@@ -179,6 +279,10 @@ class personalizer:
             shuffleSession: 
                 Random order of the elements of a session.
 
+            deadlineInstance:
+                stageDeadline of the personalization. If it expires, the remaining elements
+                are skipped and the elements performed so far are returned.
+
         Returns:
             Array
                 All executed single elements. 
@@ -192,33 +296,56 @@ class personalizer:
         performedSession = []
 
         for entry in session:
-            if (entry["type"] == "website"):
-                performedSession.append(self.accessWebsite(
-                    entry["link"]))
+            try:
+                if deadlineInstance and deadlineInstance.expired():
+                    break
+                self.performSessionElement(entry, performedSession)
+            except Exception:
+                # after the browser was force-closed at the deadline every call fails
+                if deadlineInstance is None or not deadlineInstance.expired():
+                    raise
+                break
+        if deadlineInstance and deadlineInstance.expired():
+            logging.error("personalization stopped by deadline after %s of %s elements" %
+                          (len(performedSession), len(session)))
 
-            elif (entry["type"] == "youtubeSearch"):
-                performedSession.append(
-                    self.useYoutubeSearch(entry["searchTerm"]))
+        sessionLength = len(session)
+        logging.info(str(sessionLength) + " websites accessed")
+        return performedSession
 
-            elif entry["type"] == "googleSearch":
-                performedSession.append(
-                    self.useGoogleSearch(entry["searchTerm"]))
+    def performSessionElement(self, entry, performedSession):
+        '''
+        Method to perform a single element of a session and append its output to performedSession.
 
-            elif entry["type"] == "amazonSearch":
-                performedSession.append(
-                    self.useAmazonSearch(entry["searchTerm"]))
+        Parameters
+            entry:
+                session element, dict with type and link or searchTerm
+            performedSession:
+                list of the performed elements
+        '''
+        if (entry["type"] == "website"):
+            performedSession.append(self.accessWebsite(
+                entry["link"]))
 
-            elif entry["type"] == "ebaySearch":
-                performedSession.append(
-                    self.useEbaySearch(entry["searchTerm"]))
+        elif (entry["type"] == "youtubeSearch"):
+            performedSession.append(
+                self.useYoutubeSearch(entry["searchTerm"]))
 
-            elif entry["type"] == "instagramSearch":
-                performedSession.append(
-                    self.useInstagramSearch(entry["searchTerm"]))
+        elif entry["type"] == "googleSearch":
+            performedSession.append(
+                self.useGoogleSearch(entry["searchTerm"]))
 
-        sessionLength = len(session)
-        logging.info(str(sessionLength) + " websites accessed")
-        return performedSession
+        elif entry["type"] == "amazonSearch":
+            performedSession.append(
+                self.useAmazonSearch(entry["searchTerm"]))
+
+        elif entry["type"] == "ebaySearch":
+            performedSession.append(
+                self.useEbaySearch(entry["searchTerm"]))
+
+        elif entry["type"] == "instagramSearch":
+            performedSession.append(
+                self.useInstagramSearch(entry["searchTerm"]))
 
     def accessWebsite(self, url: str):
         '''
@@ -237,17 +364,17 @@ class personalizer:
                 The XPath to the element that confirms the banner.
 
         Returns:
-            output: Dict
+            output: sessionElementRecord
                 type, time, url, screenshot and (error)
 
         '''
-        output = {"type": "website", "time": datetime.utcnow()}
+        output = pageRecords.sessionElementRecord("website")
         try:
             logging.info("accessing website: "+url)
             self.driver.get(url)
 
-            timeOnWebsite = randint(5, 20)
-            time.sleep(timeOnWebsite)
+            timeOnWebsite = self.sleep.randint(5, 20)
+            self.sleep.sleep(timeOnWebsite)
             logging.info("accessed %s going to sleep for %s seconds" %
                          (url, timeOnWebsite))
 
@@ -256,7 +383,7 @@ class personalizer:
             logging.error(str(e))
             output["error"] = str(e)
         output["url"] = self.driver.current_url
-        output["screenshot"] = self.driver.get_screenshot_as_png()
+        output["screenshot"] = self.takeScreenshot(output["type"], "error" in output)
         return output
 
     def useYoutubeSearch(self, searchTerm: str):
@@ -271,17 +398,17 @@ class personalizer:
                 The string to be searched for
 
         Returns:
-            output: Dict
+            output: sessionElementRecord
                 type, time, url, screenshot and (error)
         '''
         logging.info("using youtubeSearch: "+searchTerm)
-        output = {"type": "youtubeSearch", "time": datetime.utcnow()}
+        output = pageRecords.sessionElementRecord("youtubeSearch")
         try:
-            self.driver.get("https://www.youtube.com/")
+            self.driver.get(self.siteUrls["youtube"])
 
             elem = self.__waitForElementByXpath('//input[@id="search"]')
             elem.click()
-            time.sleep(1)
+            self.sleep.sleep(1)
             enterkeyString = u'\ue007'
             elem.send_keys(
                 searchTerm + enterkeyString)
@@ -301,17 +428,17 @@ class personalizer:
             except:
                 pass
 
-            timeInVideo = randint(8*60, 12*60)
+            timeInVideo = self.sleep.randint(8*60, 12*60)
             logging.info(
                 "youtubeSearch successfull. going to sleep for %s" % str(timeInVideo))
-            time.sleep(timeInVideo)
+            self.sleep.sleep(timeInVideo)
 
         except Exception as e:
             logging.error("video search failed: "+str(e))
             output["error"] = str(e)
-            time.sleep(30)
+            self.sleep.sleep(30)
         output["url"] = self.driver.current_url
-        output["screenshot"] = self.driver.get_screenshot_as_png()
+        output["screenshot"] = self.takeScreenshot(output["type"], "error" in output)
         return output
 
     def useAmazonSearch(self, searchTerm: str):
@@ -326,14 +453,14 @@ class personalizer:
                 The string to be searched for
 
         Returns:
-            output: Dict
+            output: sessionElementRecord
                 type, time, url, screenshot and (error)
         '''
-        output = {"type": "amazonSearch", "time": datetime.utcnow()}
+        output = pageRecords.sessionElementRecord("amazonSearch")
         logging.info("using Amazon search: "+searchTerm)
         try:
 
-            self.driver.get("https://www.amazon.de/")
+            self.driver.get(self.siteUrls["amazon"])
 
             searchBox = self.__waitForElementByXpath(
                 '//input[@id="twotabsearchtextbox"]')
@@ -350,18 +477,18 @@ class personalizer:
 
             self.__openLinkOfElem(elem)
 
-            timeOnResult = randint(10, 30)
+            timeOnResult = self.sleep.randint(10, 30)
             logging.info(
                 "Amazon search result opened \n going to sleep for %s seconds" % str(timeOnResult))
 
-            time.sleep(timeOnResult)
+            self.sleep.sleep(timeOnResult)
 
         except Exception as e:
             logging.error("amazon search: "+str(e))
             output["error"] = str(e)
-            time.sleep(30)
+            self.sleep.sleep(30)
         output["url"] = self.driver.current_url
-        output["screenshot"] = self.driver.get_screenshot_as_png()
+        output["screenshot"] = self.takeScreenshot(output["type"], "error" in output)
         return output
 
     def useGoogleSearch(self, searchTerm: str):
@@ -376,19 +503,19 @@ class personalizer:
                 The string to be searched for
 
         Returns:
-            output: Dict
+            output: sessionElementRecord
                 type, time, url, screenshot and (error)
         '''
-        output = {"type": "googleSearch", "time": datetime.utcnow()}
+        output = pageRecords.sessionElementRecord("googleSearch")
         try:
             logging.info("performing googleSearch: "+searchTerm)
-            self.driver.get("https://www.google.de/")
+            self.driver.get(self.siteUrls["google"])
 
             searchBox = self.__waitForElementByXpath(
                 '//input[@name="q"]')
             enterkeyString = u'\ue007'
             searchBox.send_keys(searchTerm + enterkeyString)
-            time.sleep(2)
+            self.sleep.sleep(2)
 
             elems = self.__waitForElementsByXpath(
                 '//div[@class="g"]')
@@ -396,18 +523,18 @@ class personalizer:
             elem = elems[ranElemNr]
             self.__openLinkOfElem(elem)
 
-            timeOnResult = randint(10, 30)
+            timeOnResult = self.sleep.randint(10, 30)
             logging.info(
                 "Google search result opened \n going to sleep for %s seconds" % str(timeOnResult))
 
-            time.sleep(timeOnResult)
+            self.sleep.sleep(timeOnResult)
 
         except Exception as e:
             logging.error("search failed: "+str(e))
             output["error"] = str(e)
-            time.sleep(30)
+            self.sleep.sleep(30)
         output["url"] = self.driver.current_url
-        output["screenshot"] = self.driver.get_screenshot_as_png()
+        output["screenshot"] = self.takeScreenshot(output["type"], "error" in output)
         return output
 
     def useEbaySearch(self, searchTerm: str):
@@ -422,14 +549,14 @@ class personalizer:
                 The string to be searched for
 
         Returns:
-            output: Dict
+            output: sessionElementRecord
                 type, time, url, screenshot and (error)
         '''
-        output = {"type": "ebaySearch", "time": datetime.utcnow()}
+        output = pageRecords.sessionElementRecord("ebaySearch")
         try:
 
             logging.info("using eBaySearch: "+searchTerm)
-            self.driver.get("https://www.ebay.de/")
+            self.driver.get(self.siteUrls["ebay"])
 
             searchBox = self.__waitForElementByXpath(
                 '//input[contains(@class, "ui-autocomplete-input")]')
@@ -446,21 +573,21 @@ class personalizer:
 
             self.__openLinkOfElem(elem)
 
-            timeOnResult = randint(10, 30)
+            timeOnResult = self.sleep.randint(10, 30)
             logging.info(
                 "eBay search result opened \n going to sleep for %s seconds" % str(timeOnResult))
 
-            time.sleep(timeOnResult)
+            self.sleep.sleep(timeOnResult)
         except Exception as e:
             logging.error("search failed: "+str(e))
 
             output["error"] = str(e)
-            time.sleep(30)
+            self.sleep.sleep(30)
         output["url"] = self.driver.current_url
-        output["screenshot"] = self.driver.get_screenshot_as_png()
+        output["screenshot"] = self.takeScreenshot(output["type"], "error" in output)
         return output
 
-    def accessGoogleNews(self, scroll=True):
+    def accessGoogleNews(self, scroll=True, harvest=None):
         '''
         Method to open Google News. 
         After the call of Google News a time which is specified in config.py under delay is waited
@@ -468,46 +595,154 @@ class personalizer:
         Parameters:
             scroll:bool
                 scroll down on the website
+            harvest:dict
+                if given, the page is scrolled step by step and the tiles are harvested with
+                harvestScroll. Keys are the parameters of harvestScroll, e.g. {"maxSteps": 30}
 
         Returns:
             output: Dict
-                html, time, and screenshot
+                html, time, and screenshot (see takeScreenshot)
+                with harvest also items (tiles with html and scroll depth) and scroll (summary)
         '''
         try:
             logging.info("accessing google News")
-            url = "https://news.google.de/"
+            url = self.siteUrls["googleNews"]
             self.driver.get(url)
             logging.info("accessed "+url)
-            sleepTime = randint(5, 10)
-            time.sleep(sleepTime)
-            if scroll:
+            sleepTime = self.sleep.randint(5, 10)
+            self.sleep.sleep(sleepTime)
+            output = {}
+            if harvest is not None:
+                output = self.harvestScroll(
+                    harvestSelectors["googleNews"], **harvest)
+            elif scroll:
                 self.driver.execute_script(
                     "window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(5)
-            return {"html": self.getPageSource(), "time": datetime.utcnow(), "screenshot": self.driver.get_screenshot_as_png()}
+                self.sleep.sleep(5)
+            output.update({"html": self.getPageSource(), "time": datetime.utcnow(),
+                           "screenshot": self.takeScreenshot("googleNews")})
+            return output
         except Exception as e:
             logging.error("Google News could not be opened: " + str(e))
 
-    def accessFlipboard(self):
+    def accessFlipboard(self, harvest=None):
         '''
         Method to open Flipboard. 
         After calling Flipboard the program waits for a time defined in config.py under delay.
 
+        Parameters:
+            harvest:dict
+                if given, the page is scrolled step by step and the items are harvested with
+                harvestScroll instead of waiting 30 seconds
+
         Returns:
             output: Dict
-                html, time, and screenshot
+                html, time, and screenshot (see takeScreenshot)
+                with harvest also items (articles with html and scroll depth) and scroll (summary)
         '''
         try:
             logging.info("accessing flipboard")
-            url = "https://flipboard.com/"
+            url = self.siteUrls["flipboard"]
             self.driver.get(url)
             logging.info("accessed "+url)
-            time.sleep(30)
-
-            return {"html": self.getPageSource(), "time": datetime.utcnow(), "screenshot": self.driver.get_screenshot_as_png()}
+            output = {}
+            if harvest is not None:
+                self.sleep.sleep(5)
+                output = self.harvestScroll(
+                    harvestSelectors["flipboard"], **harvest)
+            else:
+                self.sleep.sleep(30)
+
+            output.update({"html": self.getPageSource(), "time": datetime.utcnow(),
+                           "screenshot": self.takeScreenshot("flipboard")})
+            return output
         except Exception as e:
             logging.error("Flipboard could not be opened: " + str(e))
 
+    def harvestScroll(self, itemSelector, maxSteps=30, maxSeconds=60, stepDelay=1):
+        '''
+        Method to scroll the current page step by step and collect the items which appear.
+        After every step of one window height the new items are taken from the DOM.
+        Scrolling stops when a step neither adds items nor makes the page longer,
+        or when maxSteps or maxSeconds is reached.
+
+        Parameters:
+            itemSelector: str
+                CSS selector of the items, e.g. harvestSelectors["googleNews"]
+            maxSteps: int
+                maximum number of scroll steps
+            maxSeconds: float
+                maximum time of the harvest in seconds
+            stepDelay: float
+                nominal seconds to wait for lazily loaded items after every step
+
+        Returns:
+            Dict
+                items: list of items from top to bottom, each a dict with
+                    key: link of the item, html: html of the item,
+                    depth: distance of the item from the top of the page in pixels,
+                    step: scroll step in which the item appeared (0 before scrolling)
+                scroll: steps, items, seconds and stopReason of the harvest
+        '''
+        start = time.time()
+        keys = []
+        items = []
+        height = 0
+        step = 0
+        stopReason = "maxSteps"
+        while True:
+            state = self.driver.execute_script(
+                harvestScript, itemSelector, keys)
+            for key, depth, html in state["items"]:
+                keys.append(key)
+                items.append({"key": key, "html": html,
+                              "depth": depth, "step": step})
+            grown = state["height"] > height
+            height = state["height"]
+
+            if step > 0 and not state["items"] and not grown and state["bottom"] >= height:
+                stopReason = "noNewItems"
+                break
+            if step >= maxSteps:
+                stopReason = "maxSteps"
+                break
+            if time.time() - start >= maxSeconds:
+                stopReason = "maxSeconds"
+                break
+
+            step += 1
+            self.driver.execute_script(
+                "window.scrollBy(0, window.innerHeight);")
+            self.sleep.sleep(stepDelay)
+
+        items.sort(key=lambda item: item["depth"])
+        summary = {"steps": step, "items": len(items),
+                   "seconds": time.time() - start, "stopReason": stopReason}
+        logging.info("harvested %s items in %s scroll steps (%s)" %
+                     (len(items), step, stopReason))
+        return {"items": items, "scroll": summary}
+
+    def takeScreenshot(self, context, error=False):
+        '''
+        Method to take a screenshot of the browser window.
+        With a screenshotStore the screenshot is only taken if the capture policy wants it
+        and it is stored in the background.
+
+        Parameters:
+            context: str
+                description of the screenshot, e.g. the type of the session element
+            error: bool
+                True if the action of the screenshot failed
+
+        Returns:
+            ID of the stored screenshot, PNG bytes without screenshotStore or None if it was not taken
+        '''
+        if self.screenshotStore is None:
+            return self.driver.get_screenshot_as_png()
+        if not self.screenshotStore.wanted(error):
+            return None
+        return self.screenshotStore.capture(self.driver.get_screenshot_as_png(), context, error)
+
     def getPageSource(self):
         '''
         Returns the current HTML DOM as a string.
@@ -528,11 +763,11 @@ class personalizer:
 
         '''
 
-        self.driver.get("https://adssettings.google.com/authenticated")
-        time.sleep(5)
+        self.driver.get(self.siteUrls["adsSettings"])
+        self.sleep.sleep(5)
         return {"time": datetime.utcnow(), "html": self.getPageSource(), "profil": self.profileName}
 
     def getLocation(self):
         # Für Debugging
-        self.driver.get("https://www.whatismyip-address.com/?check")
-        time.sleep(5)
+        self.driver.get(self.siteUrls["location"])
+        self.sleep.sleep(5)
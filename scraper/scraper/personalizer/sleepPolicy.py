@@ -0,0 +1,69 @@
+from random import Random
+import threading
+import time
+
+
+class sleepPolicy:
+    '''
+    Policy for all waiting times of the personalizer.
+    The nominal times (e.g. 8 to 12 minutes in a Youtube video) are divided by
+    the compression factor, so benchmarks and tests can run a session in seconds.
+    The collection uses compression 1, i.e. the real times.
+    '''
+
+    def __init__(self, compression=1.0, seed=None):
+        '''
+        Method to create a sleepPolicy.
+
+        Parameters:
+            (compression):
+                factor by which all waiting times are shortened
+            (seed):
+                seed of the random dwell times, None for a random seed
+        '''
+        if compression <= 0:
+            raise ValueError("compression must be greater than 0")
+        self.compression = compression
+        self.random = Random(seed)
+        self.lock = threading.Lock()
+        self.nominal = 0.0
+        self.slept = 0.0
+
+    def sleep(self, seconds):
+        '''
+        Method to wait a nominal number of seconds.
+
+        Parameters:
+            seconds:
+                nominal waiting time
+
+        Returns:
+            the nominal waiting time
+        '''
+        real = seconds / self.compression
+        with self.lock:
+            self.nominal += seconds
+            self.slept += real
+        time.sleep(real)
+        return seconds
+
+    def randint(self, minimum, maximum):
+        '''
+        Returns a random nominal waiting time in seconds between minimum and maximum
+        '''
+        return self.random.randint(minimum, maximum)
+
+    def dwell(self, minimum, maximum):
+        '''
+        Method to wait a random nominal number of seconds, e.g. the time spent on a website.
+
+        Parameters:
+            minimum:
+                minimum nominal waiting time in seconds
+            maximum:
+                maximum nominal waiting time in seconds
+
+        Returns:
+            the nominal waiting time
+        '''
+        return self.sleep(self.randint(minimum, maximum))
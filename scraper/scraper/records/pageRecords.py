@@ -0,0 +1,231 @@
+from datetime import datetime
+import time
+
+from scraper.fetching import rawPage
+
+class record:
+    '''
+    Base class of the records which are passed from the collection to the databaseInterface.
+    The fields are stored in __slots__, so a record has no per-instance dict.
+    Optional fields which were never set are left out by toDict().
+
+    Pages downloaded as rawPage are stored as their raw bytes in the field
+    and their charset in <field>Charset.
+
+    Records can be read and written like dicts (record["url"], record.get("extract")),
+    so the extraction pool and the personalizer can use them like the former dicts.
+    Only the fields in __slots__ can be set.
+    '''
+    __slots__ = ()
+
+    @classmethod
+    def fields(cls):
+        '''
+        Returns the names of the fields of the record, including those of the base classes
+        '''
+        names = []
+        for base in reversed(cls.__mro__):
+            names += base.__dict__.get("__slots__", ())
+        return names
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        try:
+            setattr(self, key, value)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.fields() and hasattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.fields() else default
+
+    def toDict(self):
+        '''
+        Method to convert the record to a BSON-ready dict.
+
+        Returns:
+            dict with all set fields
+        '''
+        document = {}
+        for field in self.fields():
+            try:
+                document[field] = getattr(self, field)
+            except AttributeError:
+                continue
+        return expandRawPages(document)
+
+    @classmethod
+    def fromDict(cls, document):
+        '''
+        Method to create a record from a dict of toDict, e.g. a checkpoint of a run.
+        Bytes with a <field>Charset are converted back to rawPages.
+
+        Parameters:
+            document:
+                dict with the fields of the record
+
+        Returns:
+            record
+        '''
+        instance = cls.__new__(cls)
+        for field in cls.fields():
+            if field not in document:
+                continue
+            value = document[field]
+            if isinstance(value, bytes) and field + "Charset" in document:
+                value = rawPage.rawPage(value, document[field + "Charset"])
+            setattr(instance, field, value)
+        return instance
+
+
+class googleNewsArticleRecord(record):
+    '''
+    Article of a Google News tile.
+        googleLink: Google referrer page
+        url: last url after redirection
+        timestamp: timestamp of the download
+        age: age of the article
+        referrerPage: rawPage of the referrer page, None if the url was decoded from googleLink
+        finalPage: rawPage of the last source code after redirection
+        (extract): headline, publisher, canonicalUrl, publishDate and text of the article
+        (urlSource): decoded if the url was decoded from googleLink, referrer if it was read from the referrer page
+    '''
+    __slots__ = ("googleLink", "url", "timestamp", "age",
+                 "referrerPage", "finalPage", "extract", "urlSource")
+
+    def __init__(self, googleLink, url, age, referrerPage, finalPage, timestamp=None, urlSource=None):
+        self.googleLink = googleLink
+        self.url = url
+        self.timestamp = timestamp or time.asctime()
+        self.age = age
+        self.referrerPage = referrerPage
+        self.finalPage = finalPage
+        if urlSource is not None:
+            self.urlSource = urlSource
+
+
+class panoramaArticleRecord(googleNewsArticleRecord):
+    '''
+    Article of the Google News "Panorama" area.
+    The age is stored as "alter", like in the documents collected so far.
+    '''
+    __slots__ = ()
+
+    def toDict(self):
+        document = super().toDict()
+        if "age" in document:
+            document["alter"] = document.pop("age")
+        return document
+
+
+class tileRecord(record):
+    '''
+    Tile of a Google News page.
+        tileType: einzelFeld, multifeld or Panorama
+        articles: list of googleNewsArticleRecord
+        (scrollDepth): distance of the tile from the top of the page in pixels
+    '''
+    __slots__ = ("tileType", "articles", "scrollDepth")
+
+    def __init__(self, tileType, articles):
+        self.tileType = tileType
+        self.articles = articles
+
+    def toDict(self):
+        document = super().toDict()
+        document["articles"] = [toDocument(article) for article in self.articles]
+        return document
+
+
+class flipboardArticleRecord(record):
+    '''
+    Article of a Flipboard page.
+        url: article url
+        timestamp: time of save
+        html: rawPage of the html sourcecode of the article
+        (extract): headline, publisher, canonicalUrl, publishDate and text of the article
+        (scrollDepth): distance of the article from the top of the page in pixels
+    '''
+    __slots__ = ("url", "timestamp", "html", "extract", "scrollDepth")
+
+    def __init__(self, url, html, timestamp=None):
+        self.url = url
+        self.timestamp = timestamp or datetime.utcnow()
+        self.html = html
+
+
+class rssEntryRecord(record):
+    '''
+    Article of an RSS feed.
+        age: publication date
+        timeStamp: timestamp of the download
+        url: url of the article
+        html: rawPage of the page source of the article
+        (extract): headline, publisher, canonicalUrl, publishDate and text of the article
+    '''
+    __slots__ = ("age", "timeStamp", "url", "html", "extract")
+
+    def __init__(self, age, url, html, timeStamp=None):
+        self.age = age
+        self.timeStamp = timeStamp or datetime.utcnow()
+        self.url = url
+        self.html = html
+
+
+class sessionElementRecord(record):
+    '''
+    Executed element of a personalization session.
+        type: website, youtubeSearch, googleSearch, amazonSearch, ebaySearch
+        time: time of execution
+        url: URL at the end of execution
+        screenshot: screenshot at the end of execution
+        (error): error of the execution
+    '''
+    __slots__ = ("type", "time", "url", "screenshot", "error")
+
+    def __init__(self, type, executionTime=None):
+        self.type = type
+        self.time = executionTime or datetime.utcnow()
+
+
+def expandRawPages(document):
+    '''
+    Function to replace the rawPages of a dict by their bytes and to add
+    their charsets as <field>Charset.
+
+    Parameters:
+        document:
+            dict
+
+    Returns:
+        the changed dict
+    '''
+    for field, value in list(document.items()):
+        if isinstance(value, rawPage.rawPage):
+            document[field] = value.body
+            document[field + "Charset"] = value.charset
+    return document
+
+
+def toDocument(item):
+    '''
+    Function to convert a record to a BSON-ready dict at the storage boundary.
+    rawPages of dicts are replaced by their bytes.
+
+    Parameters:
+        item:
+            record or dict
+
+    Returns:
+        dict
+    '''
+    if isinstance(item, record):
+        return item.toDict()
+    return expandRawPages(item)
@@ -0,0 +1,109 @@
+import xml.etree.ElementTree as ElementTree
+import feedparser
+import logging
+import io
+
+
+atomNamespace = "{http://www.w3.org/2005/Atom}"
+xmlBase = "{http://www.w3.org/XML/1998/namespace}base"
+
+# tags of the entry fields in RSS 2.0 and Atom, mapped to the keys of feedparser
+rssFields = {"title": "title", "link": "link", "guid": "id", "pubDate": "published"}
+atomFields = {atomNamespace + "title": "title", atomNamespace + "id": "id",
+              atomNamespace + "published": "published", atomNamespace + "issued": "published"}
+
+
+class unsupportedFeed(ValueError):
+    '''
+    Raised by parseFast for feeds which have to be parsed by feedparser
+    '''
+
+
+def text(element):
+    '''
+    Returns the stripped text of a field or raises unsupportedFeed if the field contains markup
+    '''
+    if len(element):
+        raise unsupportedFeed("markup in " + element.tag)
+    return (element.text or "").strip()
+
+
+def parseFast(body):
+    '''
+    Function to parse a standard RSS 2.0 or Atom feed with a streaming XML parser.
+    Only title, link, id (guid) and published of the entries are read, the entries are
+    released after they are read.
+
+    Parameters:
+        body:
+            bytes of the feed
+
+    Returns:
+        Dict
+            entries: list of dicts with title, link, id and published like the entries of feedparser.
+                Fields missing in the feed are missing in the entry.
+
+    Raises:
+        unsupportedFeed or xml.etree.ElementTree.ParseError
+            if the feed is not well formed, uses a DTD, xml:base, markup in fields,
+            entries without absolute link or is neither RSS 2.0 nor Atom
+    '''
+    if b"<!DOCTYPE" in body[:1024] or b"<!ENTITY" in body[:1024]:
+        raise unsupportedFeed("document type declaration")
+
+    entries = []
+    entry = None
+    root = None
+    for event, element in ElementTree.iterparse(io.BytesIO(body), events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+                if element.tag not in ("rss", atomNamespace + "feed"):
+                    raise unsupportedFeed("root element " + element.tag)
+            if xmlBase in element.attrib:
+                raise unsupportedFeed("xml:base")
+            if element.tag in ("item", atomNamespace + "entry"):
+                entry = {}
+            continue
+
+        if element.tag in ("item", atomNamespace + "entry"):
+            if not entry.get("link", "").startswith(("http://", "https://")):
+                raise unsupportedFeed("entry without absolute link")
+            entries.append(entry)
+            entry = None
+            element.clear()
+        elif entry is not None and root.tag == "rss":
+            if element.tag in rssFields:
+                entry.setdefault(rssFields[element.tag], text(element))
+        elif entry is not None:
+            if element.tag in atomFields:
+                entry.setdefault(atomFields[element.tag], text(element))
+            elif element.tag == atomNamespace + "link" and \
+                    element.get("rel", "alternate") == "alternate":
+                entry.setdefault("link", element.get("href", "").strip())
+    return {"entries": entries}
+
+
+def parse(body):
+    '''
+    Function to parse a feed. Standard RSS 2.0 and Atom feeds are parsed by parseFast,
+    all others (malformed feeds, RSS 1.0, unusual features) by feedparser.
+
+    Parameters:
+        body:
+            bytes of the feed
+
+    Returns:
+        Dict
+            entries: list of entries with (title), link, (id) and (published)
+            parser: fast or feedparser
+    '''
+    try:
+        feed = parseFast(body)
+        feed["parser"] = "fast"
+        return feed
+    except (unsupportedFeed, ElementTree.ParseError) as e:
+        logging.info("feed is parsed with feedparser: %s", e)
+    feed = feedparser.parse(body)
+    feed["parser"] = "feedparser"
+    return feed
@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import logging
+import time
+
+from scraper.rssFeeds import rssFeed
+from scraper.runs import runDeadline
+
+
+# Feeds collected if config.py does not contain rssFeeds.
+# name: name of the feed, url: URL of the RSS feed, database: database the feed is stored in
+defaultFeeds = [
+    {"name": "spiegel", "url": "https://www.spiegel.de/schlagzeilen/tops/index.rss",
+     "database": "spiegel"},
+    {"name": "wn", "url": "https://www.wn.de/rss/feed/wn_epaper",
+     "database": "westfaelischeNachrichten"}
+]
+
+
+class rssCollector:
+    '''
+    Class that collects several RSS feeds at the same time.
+    Every feed is downloaded in its own thread, at most maxParallel feeds at once.
+    The articles of a single feed are still downloaded one after another.
+    '''
+
+    def __init__(self, feeds, databaseInterfaceInstance, extractionPoolInstance=None, maxParallel=4,
+                 deadlineInstance=None):
+        '''
+        Method to create an rssCollector.
+
+        Parameters:
+            feeds:
+                list of feeds, each a dict with name, url and database
+            databaseInterfaceInstance:
+                The instance of the databaseinterface class to be used for storing the data.
+            (extractionPoolInstance):
+                extractionPool to extract text and metadata of the articles during the download.
+            (maxParallel):
+                maximum number of feeds collected at the same time
+            (deadlineInstance):
+                runDeadline of the run. The downloads of a feed stop at the deadline, the
+                articles downloaded so far are stored and the feed is marked as incomplete.
+        '''
+        self.feeds = feeds
+        self.databaseInterface = databaseInterfaceInstance
+        self.extractionPool = extractionPoolInstance
+        self.maxParallel = maxParallel
+        self.deadline = deadlineInstance or runDeadline.runDeadline()
+
+    def collectFeed(self, feed):
+        '''
+        Method to collect and store a single feed.
+
+        Parameters:
+            feed:
+                dict with name, url and database
+
+        Returns:
+            Dict
+                report of the feed: name, database, articles, failed, seconds, (error), (incomplete)
+        '''
+        report = {"name": feed["name"], "database": feed["database"],
+                  "articles": 0, "failed": 0}
+        start = time.time()
+        try:
+            rssInstance = rssFeed.rssFeed(
+                feed["name"], feed["url"], self.extractionPool, feed.get("delay", 1))
+            with self.deadline.stage("downloads") as downloads:
+                articles = rssInstance.getAllArticles(downloads)
+            with self.deadline.stage("save"):
+                self.databaseInterface.saveRss(
+                    articles, rssInstance.getRssData(), feed["database"])
+            report["articles"] = len(articles)
+            report["failed"] = rssInstance.failedEntries
+            if rssInstance.incomplete:
+                report["incomplete"] = True
+        except Exception as e:
+            logging.error("rss feed %s could not be collected: %s" %
+                          (feed["name"], str(e)))
+            report["error"] = str(e)
+        report["seconds"] = time.time() - start
+        return report
+
+    def collect(self):
+        '''
+        Method to collect all feeds.
+
+        Returns:
+            Dict
+                report of the run:
+                time: start of the run
+                seconds: duration of the run
+                articles: number of stored articles of all feeds
+                failed: number of articles which could not be downloaded
+                failedFeeds: number of feeds which could not be collected
+                feeds: reports of the single feeds
+        '''
+        logging.info("collecting %s rss feeds" % len(self.feeds))
+        runStart = datetime.utcnow()
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=self.maxParallel) as executor:
+            feedReports = list(executor.map(self.collectFeed, self.feeds))
+
+        report = {"time": runStart,
+                  "seconds": time.time() - start,
+                  "articles": sum(r["articles"] for r in feedReports),
+                  "failed": sum(r["failed"] for r in feedReports),
+                  "failedFeeds": sum(1 for r in feedReports if "error" in r),
+                  "feeds": feedReports}
+        logging.info("rss feeds collected: %s articles, %s failed, %s feeds failed in %.1f seconds" % (
+            report["articles"], report["failed"], report["failedFeeds"], report["seconds"]))
+        return report
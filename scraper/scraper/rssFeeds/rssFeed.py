@@ -0,0 +1,111 @@
+from datetime import datetime
+import logging
+import time
+
+from scraper.rssFeeds import feedParser
+from scraper.records import pageRecords
+from scraper.fetching import rawPage
+
+class rssFeed:
+    '''
+    Class that represents an RSS feed of a news outlet.
+    The feed is configured by its URL, so every outlet uses the same class.
+    '''
+
+    def __init__(self, name, url, extractionPoolInstance=None, delay=1, timeout=10):
+        '''
+        Method to create an rssFeed object
+        The RSS feed is loaded and the source code is stored in the object
+
+        Parameters:
+            name:
+                name of the feed, used in the log
+            url:
+                URL of the RSS feed
+            (extractionPoolInstance):
+                extractionPool to extract the text and metadata of the articles
+            (delay):
+                seconds to wait between the downloads of two articles of the feed
+            (timeout):
+                timeout of every download in seconds
+        '''
+        self.name = name
+        self.url = url
+        self.extractionPool = extractionPoolInstance
+        self.delay = delay
+        self.timeout = timeout
+        self.failedEntries = 0
+        self.incomplete = False
+        self.feed = {"entries": []}
+        self.rssContent = None
+        self.creationTime = datetime.utcnow()
+        try:
+            logging.info("loading and parsing rss feed %s", name)
+            self.rssContent = rawPage.fetch(url, timeout=timeout, headers={})
+            self.feed = feedParser.parse(self.rssContent.body)
+            logging.info("rss feed %s parsed with %s: %s entries" %
+                         (name, self.feed["parser"], len(self.feed["entries"])))
+            self.creationTime = datetime.utcnow()
+        except Exception as e:
+            logging.error("rss feed %s could not be loaded: %s" % (name, str(e)))
+            raise
+
+    def getAllArticles(self, deadlineInstance=None):
+        '''
+        Method to return all articles of the loaded RSS feed.
+        Each article is called with a delay between them.
+
+        Parameters:
+            (deadlineInstance):
+                stageDeadline of the downloads. If it expires, the remaining entries are
+                skipped and the feed is marked as incomplete.
+
+        Returns:
+            Array
+                All articles as rssEntryRecord with the following information:
+                    age: publication date
+                    timeStamp: timestamp
+                    url: Url of the article
+                    html: rawPage of the page source of the article
+                    (extract): headline, publisher, canonicalUrl, publishDate and text of the article
+        '''
+        articleList = []
+        for entry in self.feed["entries"]:
+            if deadlineInstance is not None and deadlineInstance.expired():
+                logging.error("downloads of rss feed %s stopped by deadline" % self.name)
+                self.incomplete = True
+                break
+            try:
+                logging.info("analyzing entry %s", entry["link"])
+                html = rawPage.fetch(
+                    entry["link"], timeout=self.timeout, headers={})
+                out = pageRecords.rssEntryRecord(
+                    entry["published"], entry["link"], html)
+                if self.extractionPool:
+                    out.extract = self.extractionPool.submit(
+                        html, entry["link"])
+                articleList.append(out)
+                time.sleep(self.delay)
+            except Exception as e:
+                self.failedEntries += 1
+                logging.error("Rss entry could not be analyzed: %s", e)
+
+        logging.info("entries of %s analyzed" % self.name)
+        if self.extractionPool:
+            self.extractionPool.resolve(articleList)
+        return articleList
+
+    def getRssData(self):
+        '''
+        Returns the source code of the RSS feed and the call time.
+        Returns:
+            Array
+                Array with content:
+                rss: rawPage of the rss source code
+                time: rss retrieval time
+                (incomplete): True if the downloads were stopped by a deadline
+        '''
+        rssData = {"rss": self.rssContent, "time": self.creationTime}
+        if self.incomplete:
+            rssData["incomplete"] = True
+        return rssData
@@ -0,0 +1,282 @@
+import threading
+import logging
+import time
+import os
+
+
+# root of the process information of Linux
+procPath = "/proc"
+
+# name of the driver process, its process tree is the browser of a profile
+driverName = "geckodriver"
+
+# groups of the processes of a sample
+groups = ["python", "browser", "otherBrowsers", "workers"]
+
+# units of the CPU times and the RSS in /proc/<pid>/stat
+try:
+    clockTicks = os.sysconf("SC_CLK_TCK")
+    pageSize = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    clockTicks, pageSize = 100, 4096
+
+
+def readStat(pid):
+    '''
+    Function to read /proc/<pid>/stat.
+
+    Parameters:
+        pid:
+            process ID
+
+    Returns:
+        Dict
+            name, ppid, start (clock ticks after boot), cpu (seconds of user and system time),
+            threads and rss (bytes), None if the process does not exist anymore
+    '''
+    try:
+        with open("%s/%s/stat" % (procPath, pid), "rb") as file:
+            stat = file.read().decode("utf-8", "replace")
+    except OSError:
+        return None
+    # the name may contain spaces and parentheses
+    name = stat[stat.index("(") + 1:stat.rindex(")")]
+    fields = stat[stat.rindex(")") + 2:].split()
+    return {"name": name, "ppid": int(fields[1]), "start": int(fields[19]),
+            "cpu": (int(fields[11]) + int(fields[12])) / clockTicks,
+            "threads": int(fields[17]), "rss": int(fields[21]) * pageSize}
+
+
+def countFds(pid):
+    '''
+    Returns the number of open file descriptors of a process, 0 if they can not be read
+    '''
+    try:
+        return len(os.listdir("%s/%s/fd" % (procPath, pid)))
+    except OSError:
+        return 0
+
+
+def processTable():
+    '''
+    Returns the stat of all processes as pid -> readStat
+    '''
+    table = {}
+    for entry in os.listdir(procPath):
+        if entry.isdigit():
+            stat = readStat(int(entry))
+            if stat is not None:
+                table[int(entry)] = stat
+    return table
+
+
+def descendants(table, pid):
+    '''
+    Returns the IDs of all descendants of a process in a process table
+    '''
+    children = {}
+    for childPid, stat in table.items():
+        children.setdefault(stat["ppid"], []).append(childPid)
+    found = []
+    stack = list(children.get(pid, []))
+    while stack:
+        childPid = stack.pop()
+        found.append(childPid)
+        stack.extend(children.get(childPid, []))
+    return found
+
+
+def hostMemory():
+    '''
+    Returns the memory of the machine in bytes from /proc/meminfo, None if it is not available
+    '''
+    try:
+        with open(procPath + "/meminfo") as file:
+            for line in file:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def capacity(summary, memory, cores, memoryShare=0.8):
+    '''
+    Function to estimate how many runs of a type fit on a machine at the same time.
+
+    Parameters:
+        summary:
+            row of databaseInterface.getResourceSummary
+        memory:
+            memory of the machine in bytes
+        cores:
+            number of CPU cores
+        (memoryShare):
+            part of the memory available for the runs
+
+    Returns:
+        Dict
+            byMemory: runs fitting into the memory with the highest RSS of a run
+            byCpu: runs keeping the cores busy with the mean CPU seconds per second of a run
+            concurrent: the smaller of both, at least 1
+    '''
+    byMemory = int(memory * memoryShare // summary["peakRss"]) if memory and summary.get("peakRss") else None
+    load = summary["cpuSeconds"] / summary["seconds"] if summary.get("seconds") else None
+    byCpu = int(cores // load) if cores and load else None
+    limits = [value for value in (byMemory, byCpu) if value is not None]
+    return {"byMemory": byMemory, "byCpu": byCpu,
+            "concurrent": max(min(limits), 1) if limits else None}
+
+
+class resourceSampler:
+    '''
+    Background thread which samples the resource usage of the scraper and its browser.
+    Every sample contains per group RSS, CPU time, open file descriptors, threads and
+    number of processes:
+        python: the process of main.py
+        browser: geckodriver of the profile of the run with Firefox and its content processes.
+            If the driver of the profile is not known, all geckodriver trees.
+        otherBrowsers: the open browsers of other profiles (daemon)
+        workers: other child processes, e.g. of the extractionPool
+    Samples are tagged with the stages running at the time of the sample.
+    The CPU seconds of a run are counted per process from the first to the last sample,
+    the CPU time of a process which ended between two samples is counted up to its last sample.
+
+    The process information is read from /proc, on other systems nothing is sampled.
+    '''
+
+    def __init__(self, interval=5, stagesFunction=None, profileName=None):
+        '''
+        Method to create a resourceSampler.
+
+        Parameters:
+            (interval):
+                seconds between two samples
+            (stagesFunction):
+                function() returning the names of the running stages, e.g. runDeadline.currentStages
+            (profileName):
+                profile of the run, stored with the samples
+        '''
+        self.interval = interval
+        self.stagesFunction = stagesFunction
+        self.profileName = profileName
+        self.pid = os.getpid()
+        self.browserPid = None
+        self.samples = []
+        self.baseline = {}
+        self.cpu = {}
+        self.start = time.monotonic()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.available = os.path.isdir("%s/%s" % (procPath, self.pid))
+        if not self.available:
+            logging.error("resources are not sampled, %s is not available" % procPath)
+
+    def setBrowser(self, pid):
+        '''
+        Method to set the process ID of the geckodriver of the profile of the run
+        '''
+        self.browserPid = pid
+
+    def group(self, table, pid):
+        '''
+        Returns the group of a direct child process of main.py
+        '''
+        if table[pid]["name"] != driverName:
+            return "workers"
+        if self.browserPid is None or pid == self.browserPid:
+            return "browser"
+        return "otherBrowsers"
+
+    def sample(self):
+        '''
+        Method to take a sample and append it to samples.
+
+        Returns:
+            Dict
+                t (seconds since the start), stages and per group rss, cpu, fds, threads and processes
+        '''
+        table = processTable()
+        members = {name: [] for name in groups}
+        if self.pid in table:
+            members["python"].append(self.pid)
+        for childPid, stat in table.items():
+            if stat["ppid"] == self.pid:
+                members[self.group(table, childPid)] += [childPid] + descendants(table, childPid)
+
+        sample = {"t": round(time.monotonic() - self.start, 3),
+                  "stages": list(self.stagesFunction()) if self.stagesFunction else []}
+        for name, pids in members.items():
+            usage = {"rss": 0, "cpu": 0.0, "fds": 0, "threads": 0, "processes": len(pids)}
+            for pid in pids:
+                stat = table[pid]
+                key = (pid, stat["start"])
+                # processes running at the first sample are counted from that sample on
+                if not self.samples and key not in self.baseline:
+                    self.baseline[key] = stat["cpu"]
+                self.cpu[key] = (name, stat["cpu"])
+                usage["rss"] += stat["rss"]
+                usage["cpu"] += stat["cpu"]
+                usage["fds"] += countFds(pid)
+                usage["threads"] += stat["threads"]
+            usage["cpu"] = round(usage["cpu"], 2)
+            sample[name] = usage
+        self.samples.append(sample)
+        return sample
+
+    def run(self):
+        '''
+        Loop of the sampling thread
+        '''
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                logging.error("resources could not be sampled: " + str(e))
+            if self.stopped.wait(self.interval):
+                break
+
+    def startSampling(self):
+        '''
+        Method to start the sampling thread
+        '''
+        if self.available and self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="resourceSampler", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        '''
+        Method to take a last sample and stop the sampling thread
+        '''
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+            self.sample()
+
+    def report(self):
+        '''
+        Returns the samples and their summary:
+            profile: profile of the run
+            interval: seconds between two samples
+            samples: list of samples
+            peakRss: highest RSS in bytes per group and of all groups together (total)
+            cpuSeconds: CPU seconds used during the run per group and total
+            peakFds: highest number of open file descriptors of all groups
+            peakProcesses: highest number of processes of all groups
+        '''
+        peakRss = {name: max((s[name]["rss"] for s in self.samples), default=0) for name in groups}
+        peakRss["total"] = max((sum(s[name]["rss"] for name in groups) for s in self.samples), default=0)
+        cpuSeconds = {name: 0.0 for name in groups}
+        for key, (name, cpu) in self.cpu.items():
+            cpuSeconds[name] += cpu - self.baseline.get(key, 0)
+        cpuSeconds = {name: round(seconds, 2) for name, seconds in cpuSeconds.items()}
+        cpuSeconds["total"] = round(sum(cpuSeconds.values()), 2)
+        return {"profile": self.profileName,
+                "interval": self.interval,
+                "samples": self.samples,
+                "peakRss": peakRss,
+                "cpuSeconds": cpuSeconds,
+                "peakFds": max((sum(s[name]["fds"] for name in groups) for s in self.samples), default=0),
+                "peakProcesses": max((sum(s[name]["processes"] for name in groups) for s in self.samples),
+                                     default=0)}
@@ -0,0 +1,298 @@
+from datetime import datetime
+import hashlib
+import logging
+
+from bson.objectid import ObjectId
+import pymongo
+
+from scraper.records import pageRecords
+
+
+# database and collections of the checkpoints
+checkpointDatabase = "runs"
+runCollection = "checkpoints"
+pageCollection = "checkpointPages"
+articleCollection = "checkpointArticles"
+
+# states of a run with checkpoints
+running, done, failed = "running", "done", "failed"
+
+# pages of the collection steps with browser: page -> database of the saved page
+pageDatabases = {"googleNews": "googleNews", "flipBoard": "flipBoard", "adProfile": "googleProfile"}
+
+
+def newRunId():
+    '''
+    Returns a new run ID, it is sortable by the start of the run
+    '''
+    return str(ObjectId())
+
+
+def articleKey(articleHtml):
+    '''
+    Returns the key of an article element of a captured page. The page is parsed again from
+    the same source on resume, so the element and its key are the same.
+    '''
+    return hashlib.sha1(articleHtml.encode("utf-8", "replace")).hexdigest()
+
+
+def loadRun(client, runId):
+    '''
+    Function to read the checkpoint document of a run.
+
+    Parameters:
+        client:
+            pymongo.MongoClient
+        runId:
+            ID of the run
+
+    Returns:
+        document of runs.checkpoints
+
+    Raises:
+        ValueError if no checkpoints of the run exist
+    '''
+    run = client[checkpointDatabase][runCollection].find_one({"_id": runId})
+    if run is None:
+        raise ValueError("no checkpoints of run " + runId)
+    return run
+
+
+class runCheckpoint:
+    '''
+    Progress of a run with browser, written to MongoDB while the run is executed, so a run
+    that died, e.g. because Firefox was killed, can be resumed with its run ID:
+
+    runs.checkpoints:
+        _id: run ID, type, session, profile, state (running, done or failed), created, updated
+        stages: per stage (session, googleNews, flipBoard, adProfile) the _id of the saved
+            document (saved) and its database, captured: True if the page source was captured
+    runs.checkpointPages:
+        runId, page, source: the captured page source as returned by the personalizer
+    runs.checkpointArticles:
+        runId, page, key (articleKey of the article element), article: the downloaded article
+
+    On resume, a stage whose saved document exists is skipped. A captured page is parsed from
+    its stored source and only the articles without checkpoint are downloaded.
+    A checkpoint that can not be written is logged, the run continues without it.
+    When the run is done, the stored pages and articles are deleted.
+    '''
+
+    def __init__(self, client, runId, execType=None, session=None, profileName=None, resume=False):
+        '''
+        Method to create the checkpoints of a new run or to load those of a run to resume.
+
+        Parameters:
+            client:
+                pymongo.MongoClient
+            runId:
+                ID of the run, see newRunId
+            (execType), (session), (profileName):
+                type of execution, session and profile of a new run
+            (resume):
+                if True, the checkpoints of the run are loaded
+
+        Raises:
+            ValueError if a run to resume has no checkpoints
+        '''
+        self.client = client
+        self.runId = runId
+        database = client[checkpointDatabase]
+        self.runs = database[runCollection]
+        self.pages = database[pageCollection]
+        self.articles = database[articleCollection]
+        if resume:
+            self.run = loadRun(client, runId)
+            self.update({"state": running, "resumed": datetime.utcnow()})
+        else:
+            now = datetime.utcnow()
+            self.run = {"_id": runId, "type": execType,
+                        "session": int(session) if session else None,
+                        "profile": profileName, "state": running,
+                        "created": now, "updated": now, "stages": {}}
+            try:
+                self.runs.insert_one(dict(self.run))
+            except pymongo.errors.PyMongoError as e:
+                logging.error("checkpoints of run %s could not be created: %s" % (runId, str(e)))
+
+    def update(self, fields):
+        '''
+        Method to set fields of the checkpoint document of the run
+        '''
+        fields = dict(fields, updated=datetime.utcnow())
+        try:
+            self.runs.update_one({"_id": self.runId}, {"$set": fields})
+        except pymongo.errors.PyMongoError as e:
+            logging.error("checkpoint of run %s could not be written: %s" % (self.runId, str(e)))
+
+    def stage(self, name):
+        '''
+        Returns the checkpoint of a stage of the loaded run, an empty dict if there is none
+        '''
+        return self.run.get("stages", {}).get(name, {})
+
+    def stageSaved(self, name):
+        '''
+        Returns True if the document saved by a stage exists in the database.
+        Documents of the background writer or the spool may have been lost with the run,
+        then the stage is executed again.
+        '''
+        checkpoint = self.stage(name)
+        if checkpoint.get("saved") is None:
+            return False
+        collection = self.client[checkpoint["database"]][checkpoint["collection"]]
+        if collection.find_one({"_id": checkpoint["saved"]}, {"_id": 1}) is None:
+            logging.error("document of stage %s of run %s was not written, the stage is executed again" %
+                          (name, self.runId))
+            return False
+        return True
+
+    def markSaved(self, name, documentId, database, collection):
+        '''
+        Method to record the document saved by a stage
+
+        Parameters:
+            name:
+                name of the stage, session or a page of pageDatabases
+            documentId:
+                _id of the saved document
+            database, collection:
+                where the document is saved
+        '''
+        checkpoint = {"saved": documentId, "database": database, "collection": collection}
+        self.run.setdefault("stages", {}).setdefault(name, {}).update(checkpoint)
+        self.update({"stages.%s.%s" % (name, key): value for key, value in checkpoint.items()})
+
+    def sessionDone(self):
+        '''
+        Returns True if the session of the run was performed and saved
+        '''
+        return self.stageSaved("session")
+
+    def markSession(self, sessionId):
+        '''
+        Method to record the saved session document
+        '''
+        self.markSaved("session", sessionId, "sessions", "session")
+
+    def page(self, name):
+        '''
+        Returns the pageCheckpoint of a page of pageDatabases
+        '''
+        return pageCheckpoint(self, name)
+
+    def finish(self, completed):
+        '''
+        Method to end the run. The stored pages and articles of a completed run are deleted,
+        those of a failed run are kept to resume it.
+
+        Parameters:
+            completed:
+                True if all steps of the run were executed
+        '''
+        self.update({"state": done if completed else failed})
+        if not completed:
+            logging.error("run %s did not complete, resume it with --resume %s" % (self.runId, self.runId))
+            return
+        try:
+            self.pages.delete_many({"runId": self.runId})
+            self.articles.delete_many({"runId": self.runId})
+        except pymongo.errors.PyMongoError as e:
+            logging.error("checkpoints of run %s could not be deleted: %s" % (self.runId, str(e)))
+
+
+class pageCheckpoint:
+    '''
+    Checkpoints of a page of a run: the captured source, the downloaded articles and the saved page
+    '''
+
+    def __init__(self, runCheckpointInstance, name):
+        '''
+        Method to create a pageCheckpoint. The article checkpoints of the page are read
+        when the first article is restored.
+
+        Parameters:
+            runCheckpointInstance:
+                runCheckpoint of the run
+            name:
+                name of the page, one of pageDatabases
+        '''
+        self.run = runCheckpointInstance
+        self.name = name
+        self.database = pageDatabases[name]
+        self.stored = None
+        self.restored = 0
+
+    def saved(self):
+        '''
+        Returns True if the page was saved, so it is skipped on resume
+        '''
+        return self.run.stageSaved(self.name)
+
+    def markSaved(self, sourceId):
+        '''
+        Method to record the saved source document of the page
+        '''
+        self.run.markSaved(self.name, sourceId, self.database, "source")
+        if self.restored:
+            logging.info("%s articles of %s restored from checkpoints" % (self.restored, self.name))
+
+    def captured(self):
+        '''
+        Returns the stored source of the page, None if the page was not captured
+        '''
+        if not self.run.stage(self.name).get("captured"):
+            return None
+        stored = self.run.pages.find_one({"_id": "%s:%s" % (self.run.runId, self.name)})
+        return stored["source"] if stored else None
+
+    def saveCapture(self, source):
+        '''
+        Method to store the source of the captured page
+        '''
+        try:
+            self.run.pages.replace_one({"_id": "%s:%s" % (self.run.runId, self.name)},
+                                       {"runId": self.run.runId, "page": self.name, "source": source},
+                                       upsert=True)
+        except (pymongo.errors.PyMongoError, pymongo.errors.InvalidDocument) as e:
+            logging.error("captured %s could not be stored: %s" % (self.name, str(e)))
+            return
+        self.run.run.setdefault("stages", {}).setdefault(self.name, {})["captured"] = True
+        self.run.update({"stages.%s.captured" % self.name: True})
+
+    def restore(self, articleHtml, recordClass):
+        '''
+        Method to get a downloaded article from its checkpoint.
+
+        Parameters:
+            articleHtml:
+                article element of the page
+            recordClass:
+                class of the record of the article, e.g. pageRecords.flipboardArticleRecord
+
+        Returns:
+            record of the article or None if it was not downloaded yet
+        '''
+        if self.stored is None:
+            self.stored = {}
+            for stored in self.run.articles.find({"runId": self.run.runId, "page": self.name}):
+                self.stored[stored["key"]] = stored["article"]
+        document = self.stored.get(articleKey(articleHtml))
+        if document is None:
+            return None
+        self.restored += 1
+        return recordClass.fromDict(document)
+
+    def put(self, articleHtml, articleRecord):
+        '''
+        Method to store a downloaded article. The extract is not stored, it is created again on resume.
+        '''
+        document = pageRecords.record.toDict(articleRecord)
+        document.pop("extract", None)
+        key = articleKey(articleHtml)
+        try:
+            self.run.articles.replace_one({"_id": "%s:%s:%s" % (self.run.runId, self.name, key)},
+                                          {"runId": self.run.runId, "page": self.name, "key": key,
+                                           "article": document}, upsert=True)
+        except pymongo.errors.PyMongoError as e:
+            logging.error("checkpoint of an article of %s could not be written: %s" % (self.name, str(e)))
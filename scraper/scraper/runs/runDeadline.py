@@ -0,0 +1,282 @@
+from datetime import datetime
+import threading
+import logging
+import time
+
+from scraper.runs import runLogging
+
+
+# stages of a run with a deadline
+stageNames = ["personalization", "capture", "downloads", "save"]
+
+# stages which wait for the browser. If one of them expires, the browser is force-closed,
+# as a hanging geckodriver call can not be cancelled otherwise.
+browserStages = ["personalization", "capture"]
+
+
+class deadlineExceeded(Exception):
+    '''
+    Raised when a stage can not start or produced no result because the run reached a deadline
+    '''
+
+
+class stageDeadline:
+    '''
+    Deadline of a running stage. It ends with the limit of the stage or the limit of the run,
+    whichever is earlier. Work of the stage checks expired() between its steps and stops early.
+    '''
+
+    def __init__(self, name, start, end, limit):
+        '''
+        Method to create a stageDeadline.
+
+        Parameters:
+            name:
+                name of the stage, one of stageNames
+            start:
+                start of the stage as time.monotonic()
+            end:
+                end of the stage as time.monotonic(), None without limit
+            limit:
+                "stage" or "run", which limit ends the stage
+        '''
+        self.name = name
+        self.start = start
+        self.end = end
+        self.limit = limit
+        self.hit = False
+
+    def expired(self):
+        '''
+        Returns True if the deadline of the stage has passed
+        '''
+        return self.hit or (self.end is not None and time.monotonic() >= self.end)
+
+    def remaining(self):
+        '''
+        Returns the seconds until the deadline of the stage, None without limit
+        '''
+        if self.end is None:
+            return None
+        return max(self.end - time.monotonic(), 0)
+
+
+class runDeadline:
+    '''
+    Deadlines of a run and of its stages personalization, capture, downloads and save.
+    A watchdog thread checks the open stages. When a stage expires, the hit is recorded
+    and, for the browser stages, onExpiry is called to force-close the browser.
+    The downloads stop between two articles and the save is finished, so partial results
+    are stored and marked as incomplete by the caller.
+
+    Without limits no watchdog is started and the deadlines never expire.
+    '''
+
+    def __init__(self, limits=None, onExpiry=None, pollInterval=1):
+        '''
+        Method to create a runDeadline. The run starts with the creation.
+
+        Parameters:
+            (limits):
+                dict of seconds per stage and for the whole run (key run), e.g.
+                {"run": 1800, "personalization": 900, "capture": 180, "downloads": 600, "save": 120}
+                Missing keys have no limit.
+            (onExpiry):
+                function() called once when a browser stage expires, e.g. personalizer.forceClose
+            (pollInterval):
+                seconds between two checks of the watchdog
+        '''
+        self.limits = dict(limits or {})
+        for name in self.limits:
+            if name != "run" and name not in stageNames:
+                logging.error("unknown stage in deadlines: " + name)
+        self.onExpiry = onExpiry
+        self.pollInterval = pollInterval
+        self.startTime = datetime.utcnow()
+        self.start = time.monotonic()
+        self.end = self.start + self.limits["run"] if self.limits.get("run") else None
+        self.stages = {}
+        self.openStages = []
+        self.hits = []
+        self.expiryCalled = False
+        self.aborted = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.watchdog = None
+        if self.limits:
+            self.watchdog = threading.Thread(target=self.watch, name="deadlineWatchdog", daemon=True)
+            self.watchdog.start()
+
+    def stage(self, name):
+        '''
+        Returns a context manager for a stage of the run:
+            with deadlineInstance.stage("downloads") as downloads:
+                ...
+        The duration of the stage is added to the report. Stages may run at the same time.
+        '''
+        return stageContext(self, name)
+
+    def openStage(self, name):
+        '''
+        Method to start a stage, returns its stageDeadline
+        '''
+        now = time.monotonic()
+        end, limit = self.end, "run"
+        if self.limits.get(name) and (end is None or now + self.limits[name] < end):
+            end, limit = now + self.limits[name], "stage"
+        stage = stageDeadline(name, now, end, limit)
+        with self.lock:
+            self.openStages.append(stage)
+        if stage.expired():
+            self.recordHit(stage)
+        return stage
+
+    def closeStage(self, stage):
+        '''
+        Method to end a stage and add its duration to the report
+        '''
+        with self.lock:
+            self.openStages.remove(stage)
+            self.stages[stage.name] = self.stages.get(stage.name, 0) + time.monotonic() - stage.start
+        if stage.expired():
+            self.recordHit(stage)
+
+    def recordHit(self, stage):
+        '''
+        Method to record that a stage reached its deadline. A stage is recorded once.
+        For a browser stage onExpiry is called, at most once per run.
+        '''
+        with self.lock:
+            if stage.hit:
+                return
+            stage.hit = True
+            self.hits.append({"stage": stage.name, "limit": stage.limit,
+                              "seconds": round(time.monotonic() - stage.start, 3),
+                              "runSeconds": round(time.monotonic() - self.start, 3)})
+            callExpiry = stage.name in browserStages and self.onExpiry and not self.expiryCalled
+            self.expiryCalled = self.expiryCalled or bool(callExpiry)
+        logging.error("deadline of stage %s reached (%s limit)" % (stage.name, stage.limit))
+        if callExpiry:
+            try:
+                self.onExpiry()
+            except Exception as e:
+                logging.error("browser could not be force-closed: " + str(e))
+
+    def watch(self):
+        '''
+        Loop of the watchdog thread
+        '''
+        while not self.stopped.wait(self.pollInterval):
+            with self.lock:
+                expired = [stage for stage in self.openStages if stage.expired() and not stage.hit]
+            for stage in expired:
+                self.recordHit(stage)
+
+    def abort(self, reason):
+        '''
+        Method to end the run at once, e.g. when the lease of its job was lost. The open stages
+        expire, onExpiry is called to force-close the browser and the remaining stages are skipped.
+        Can be called from another thread.
+
+        Parameters:
+            reason:
+                why the run is ended, added to the report as aborted
+        '''
+        now = time.monotonic()
+        with self.lock:
+            if self.aborted is not None:
+                return
+            self.aborted = reason
+            self.end = now
+            for stage in self.openStages:
+                if stage.end is None or stage.end > now:
+                    stage.end, stage.limit = now, "run"
+            openStages = [stage for stage in self.openStages if not stage.hit]
+            callExpiry = self.onExpiry and not self.expiryCalled
+            self.expiryCalled = self.expiryCalled or bool(callExpiry)
+        logging.error("run aborted: " + reason)
+        for stage in openStages:
+            self.recordHit(stage)
+        if callExpiry:
+            try:
+                self.onExpiry()
+            except Exception as e:
+                logging.error("browser could not be force-closed: " + str(e))
+
+    def expired(self):
+        '''
+        Returns True if the run has reached its deadline or the browser was force-closed,
+        the remaining stages should be skipped. A downloads or save stage which reached
+        its own limit only stops the work of that stage.
+        '''
+        return self.expiryCalled or (self.end is not None and time.monotonic() >= self.end)
+
+    def currentStages(self):
+        '''
+        Returns the names of the running stages
+        '''
+        with self.lock:
+            return [stage.name for stage in self.openStages]
+
+    def check(self, context):
+        '''
+        Method to raise deadlineExceeded if the run has reached a deadline
+
+        Parameters:
+            context:
+                description of the skipped work for the exception
+        '''
+        if self.expired():
+            raise deadlineExceeded(context + " skipped, deadline reached")
+
+    def close(self):
+        '''
+        Method to stop the watchdog
+        '''
+        self.stopped.set()
+        if self.watchdog:
+            self.watchdog.join()
+
+    def report(self):
+        '''
+        Returns the report of the run:
+            time: start of the run
+            seconds: duration of the run
+            limits: configured limits
+            stages: seconds per stage
+            hits: stage, limit (stage or run), seconds of the stage and runSeconds of every
+                stage which reached its deadline
+            incomplete: True if a stage reached its deadline or the run was aborted
+            (aborted): reason if the run was ended by abort
+        '''
+        with self.lock:
+            report = {"time": self.startTime,
+                      "seconds": round(time.monotonic() - self.start, 3),
+                      "limits": dict(self.limits),
+                      "stages": {name: round(seconds, 3) for name, seconds in self.stages.items()},
+                      "hits": list(self.hits),
+                      "incomplete": bool(self.hits) or self.aborted is not None}
+            if self.aborted is not None:
+                report["aborted"] = self.aborted
+            return report
+
+
+class stageContext:
+    '''
+    Context manager of runDeadline.stage, the log records of the thread are tagged with the stage
+    '''
+
+    def __init__(self, deadlineInstance, name):
+        self.deadline = deadlineInstance
+        self.name = name
+        self.stage = None
+
+    def __enter__(self):
+        self.stage = self.deadline.openStage(self.name)
+        runLogging.pushStage(self.name)
+        return self.stage
+
+    def __exit__(self, excType, excValue, traceback):
+        runLogging.popStage()
+        self.deadline.closeStage(self.stage)
+        return False
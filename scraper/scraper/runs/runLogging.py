@@ -0,0 +1,251 @@
+from datetime import datetime
+import logging.handlers
+import threading
+import logging
+import queue
+import json
+import copy
+import time
+import os
+
+
+# format of the log lines in text format
+textFormat = '%(module)s %(levelname)s %(asctime)s %(message)s'
+textDateFormat = '%m/%d/%Y %I:%M:%S %p'
+
+# fields of the running job added to every record, e.g. type, session and profile
+contextFields = {}
+
+# stages opened by the current thread, see pushStage
+threadState = threading.local()
+
+
+def setContext(**fields):
+    '''
+    Method to set fields of the running job, a field with value None is removed
+    '''
+    for name, value in fields.items():
+        if value is None:
+            contextFields.pop(name, None)
+        else:
+            contextFields[name] = value
+
+
+def clearContext():
+    '''
+    Method to remove all fields of the running job
+    '''
+    contextFields.clear()
+
+
+def pushStage(name):
+    '''
+    Method to mark the start of a stage in the current thread. Records of the thread are
+    tagged with the stage until popStage is called.
+    '''
+    if not hasattr(threadState, "stages"):
+        threadState.stages = []
+    threadState.stages.append(name)
+
+
+def popStage():
+    '''
+    Method to mark the end of the last stage started in the current thread
+    '''
+    stages = getattr(threadState, "stages", None)
+    if stages:
+        stages.pop()
+
+
+def currentStage():
+    '''
+    Returns the stage of the current thread, None outside of a stage
+    '''
+    stages = getattr(threadState, "stages", None)
+    return stages[-1] if stages else None
+
+
+class contextFilter(logging.Filter):
+    '''
+    Adds the fields of the running job (context) and the stage of the logging thread to every record
+    '''
+
+    def filter(self, record):
+        record.context = dict(contextFields)
+        record.stage = currentStage()
+        return True
+
+
+class samplingFilter(logging.Filter):
+    '''
+    Rate limit of repeated records, e.g. one record per downloaded article.
+    Records are grouped by stage and message template (the message before the arguments are
+    inserted). Every group may write burst records at once and rate records per second after
+    that, further records of the group are dropped before they are queued.
+    Records of level WARNING and above are never dropped.
+    The next record of a group written after dropped records carries their number in
+    the field suppressed.
+    '''
+
+    def __init__(self, rate=1, burst=20):
+        '''
+        Method to create a samplingFilter.
+
+        Parameters:
+            (rate):
+                records per second of a group after the burst, 0 drops all of them
+            (burst):
+                records of a group written before the rate limit applies
+        '''
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.suppressed = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (getattr(record, "stage", None), str(record.msg))
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self.buckets[key] = (tokens, now)
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                return False
+            self.buckets[key] = (tokens - 1, now)
+            dropped = self.suppressed.pop(key, 0)
+        if dropped:
+            record.suppressed = dropped
+        return True
+
+    def pending(self):
+        '''
+        Returns the number of dropped records per stage and message which were not
+        reported by a later record of their group and resets them
+        '''
+        with self.lock:
+            pending, self.suppressed = self.suppressed, {}
+        return pending
+
+
+class jsonFormatter(logging.Formatter):
+    '''
+    Formats a record as JSON line with the fields time (UTC), level, module, thread, message,
+    the fields of the running job, stage and, if present, suppressed and exception
+    '''
+
+    def format(self, record):
+        line = {"time": datetime.utcfromtimestamp(record.created).isoformat() + "Z",
+                "level": record.levelname,
+                "module": record.module,
+                "thread": record.threadName,
+                "message": record.getMessage()}
+        line.update(getattr(record, "context", {}))
+        if getattr(record, "stage", None):
+            line["stage"] = record.stage
+        if getattr(record, "suppressed", None):
+            line["suppressed"] = record.suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line["exception"] = record.exc_text
+        if record.stack_info:
+            line["stack"] = record.stack_info
+        return json.dumps(line, ensure_ascii=False, default=str)
+
+
+class queueHandler(logging.handlers.QueueHandler):
+    '''
+    QueueHandler which hands the records to the writer thread with the message and
+    the traceback already formatted, so the arguments of the record are not read by
+    another thread. The rest of the formatting is done by the writer thread.
+    '''
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class logWriter:
+    '''
+    Logging of the scraper without file access in the logging threads.
+    The records are put into an unbounded queue and written to the log file by a
+    background thread (QueueListener), so no record is dropped while the queue is
+    waiting for the disk. The log is written as text (format of logging.basicConfig
+    before) or as JSON lines.
+    Forked processes, e.g. of the extractionPool, have no writer thread, they write their
+    records directly to the log file.
+    '''
+
+    def __init__(self, logFile, jsonLines=False, sampling=None, level="INFO"):
+        '''
+        Method to create a logWriter and to install it as handler of the root logger.
+
+        Parameters:
+            logFile:
+                path and filename of the log file
+            (jsonLines):
+                if True, every record is written as JSON line with the fields of the running job and its stage
+            (sampling):
+                dict with rate and burst of the samplingFilter, None writes all records
+            (level):
+                level of the root logger
+        '''
+        self.queue = queue.SimpleQueue()
+        self.fileHandler = logging.FileHandler(logFile, encoding="utf-8")
+        if jsonLines:
+            self.fileHandler.setFormatter(jsonFormatter())
+        else:
+            self.fileHandler.setFormatter(logging.Formatter(textFormat, textDateFormat))
+        self.listener = logging.handlers.QueueListener(self.queue, self.fileHandler)
+        self.handler = queueHandler(self.queue)
+        self.handler.addFilter(contextFilter())
+        self.sampler = None
+        if sampling is not None:
+            self.sampler = samplingFilter(**sampling)
+            self.handler.addFilter(self.sampler)
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(level)
+        self.listener.start()
+        os.register_at_fork(after_in_child=self.afterFork)
+
+    def afterFork(self):
+        '''
+        Method to replace the queue handler by a file handler in a forked process
+        '''
+        root = logging.getLogger()
+        if self.handler not in root.handlers:
+            return
+        handler = logging.FileHandler(self.fileHandler.baseFilename, encoding="utf-8")
+        handler.setFormatter(self.fileHandler.formatter)
+        # new filters, the lock of the samplingFilter may have been held by another thread at the fork
+        handler.addFilter(contextFilter())
+        if self.sampler is not None:
+            handler.addFilter(samplingFilter(self.sampler.rate, self.sampler.burst))
+        root.removeHandler(self.handler)
+        root.addHandler(handler)
+
+    def close(self):
+        '''
+        Method to log the number of records dropped by the sampling, write the queued
+        records and close the log file
+        '''
+        if self.sampler is not None:
+            for (stage, message), count in self.sampler.pending().items():
+                logging.info("%s records suppressed in stage %s: %s" % (count, stage, message.strip()))
+        self.listener.stop()
+        logging.getLogger().removeHandler(self.handler)
+        self.fileHandler.close()
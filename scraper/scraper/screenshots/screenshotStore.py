@@ -0,0 +1,216 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from datetime import datetime
+from bson import ObjectId
+from PIL import Image
+import threading
+import logging
+import random
+import gridfs
+import io
+
+
+# capture policies
+#   always: every screenshot is stored
+#   onError: only screenshots of failed actions are stored
+#   sampled: screenshots of failed actions and a random sample of sampleRate of the others
+policies = ["always", "onError", "sampled"]
+
+# maximum number of different bits of the dHashes of two screenshots to be stored only once
+duplicateDistance = 4
+# number of recent hashes compared for near duplicates
+recentHashes = 1000
+
+
+def dHash(image):
+    '''
+    Returns the 64 bit difference hash of an image as int.
+    The image is reduced to 9x8 gray values, every bit tells if a pixel is brighter
+    than its right neighbour. Similar screenshots have hashes with few different bits.
+    '''
+    small = image.convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            left = pixels[row * 9 + column]
+            right = pixels[row * 9 + column + 1]
+            value = value << 1 | (left > right)
+    return value
+
+
+class screenshotStore:
+    '''
+    Stores the screenshots of the personalizer in GridFS.
+    Which screenshots are stored is decided by the policy before the screenshot is taken.
+    A compressed thumbnail and optionally the full PNG are encoded and written in a
+    background thread. Screenshots whose dHash is (nearly) equal to an already stored one
+    reference the stored images instead of storing them again.
+
+    The documents of sessions and pages only contain the ID of the screenshot, which is
+    created before the encoding. The screenshot is described in <database>.screenshots:
+        time: time of the capture
+        context: e.g. the type of the session element or googleNews
+        dhash: difference hash as hex string
+        thumbnail: GridFS ID of the thumbnail (JPEG)
+        full: GridFS ID of the full PNG or None
+        width, height: size of the full screenshot
+        (duplicateOf): ID of the screenshot whose images are reused
+        (error): error of the encoding
+    '''
+
+    def __init__(self, client, database="screenshots", policy="always", sampleRate=0.1,
+                 keepFull=False, thumbnailWidth=640, quality=70, workers=1):
+        '''
+        Method to create a screenshotStore.
+
+        Parameters:
+            client:
+                pymongo.MongoClient
+            (database):
+                database of the GridFS files and the screenshots collection
+            (policy):
+                always, onError or sampled
+            (sampleRate):
+                part of the screenshots stored by the sampled policy
+            (keepFull):
+                store the full PNG in addition to the thumbnail
+            (thumbnailWidth):
+                width of the thumbnail in pixels
+            (quality):
+                JPEG quality of the thumbnail
+            (workers):
+                number of encoding threads
+        '''
+        if policy not in policies:
+            raise ValueError("unknown screenshot policy %s, possible are %s" %
+                             (policy, policies))
+        self.collection = client[database]["screenshots"]
+        self.files = gridfs.GridFS(client[database])
+        self.policy = policy
+        self.sampleRate = sampleRate
+        self.keepFull = keepFull
+        self.thumbnailWidth = thumbnailWidth
+        self.quality = quality
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="screenshotStore")
+        self.lock = threading.Lock()
+        self.recent = deque(maxlen=recentHashes)
+        self.stored = 0
+        self.duplicates = 0
+
+    def wanted(self, error=False):
+        '''
+        Method to decide if a screenshot is taken.
+
+        Parameters:
+            (error):
+                True if the action of the screenshot failed
+
+        Returns:
+            bool
+        '''
+        if self.policy == "always" or error:
+            return True
+        if self.policy == "sampled":
+            return random.random() < self.sampleRate
+        return False
+
+    def capture(self, png, context, error=False):
+        '''
+        Method to store a screenshot. The screenshot is encoded and written in the background.
+
+        Parameters:
+            png:
+                screenshot as PNG bytes
+            context:
+                description of the screenshot, e.g. the type of the session element
+            (error):
+                True if the action of the screenshot failed
+
+        Returns:
+            ObjectId
+                ID of the screenshot in <database>.screenshots
+        '''
+        screenshotId = ObjectId()
+        self.executor.submit(self.__store, screenshotId, png, {
+            "time": datetime.utcnow(), "context": context, "actionFailed": error})
+        return screenshotId
+
+    def __findDuplicate(self, hashValue):
+        '''
+        Returns the screenshot document of a stored screenshot with a similar hash or None
+        '''
+        with self.lock:
+            for recentHash, document in self.recent:
+                if bin(recentHash ^ hashValue).count("1") <= duplicateDistance:
+                    return document
+        return self.collection.find_one({"dhash": "%016x" % hashValue, "duplicateOf": None},
+                                        {"thumbnail": 1, "full": 1})
+
+    def __store(self, screenshotId, png, document):
+        '''
+        Encodes the thumbnail, checks for duplicates and writes the images and the document.
+        '''
+        document["_id"] = screenshotId
+        try:
+            image = Image.open(io.BytesIO(png))
+            image.load()
+            hashValue = dHash(image)
+            document.update({"dhash": "%016x" % hashValue,
+                             "width": image.width, "height": image.height})
+
+            duplicate = self.__findDuplicate(hashValue)
+            if duplicate is not None:
+                document.update({"thumbnail": duplicate["thumbnail"], "full": duplicate.get("full"),
+                                 "duplicateOf": duplicate["_id"]})
+                with self.lock:
+                    self.duplicates += 1
+            else:
+                thumbnail = image.convert("RGB")
+                thumbnail.thumbnail(
+                    (self.thumbnailWidth, self.thumbnailWidth * image.height // max(image.width, 1)))
+                buffer = io.BytesIO()
+                thumbnail.save(buffer, "JPEG", quality=self.quality, optimize=True)
+                document["thumbnail"] = self.files.put(
+                    buffer.getvalue(), filename=str(screenshotId) + ".jpg", contentType="image/jpeg")
+                document["full"] = self.files.put(
+                    png, filename=str(screenshotId) + ".png", contentType="image/png") if self.keepFull else None
+                with self.lock:
+                    self.stored += 1
+                    self.recent.append((hashValue, {"_id": screenshotId, "thumbnail": document["thumbnail"],
+                                                    "full": document["full"]}))
+        except Exception as e:
+            logging.error("screenshot could not be stored: " + str(e))
+            document["error"] = str(e)
+        try:
+            self.collection.insert_one(document)
+        except Exception as e:
+            logging.error("screenshot document could not be inserted: " + str(e))
+
+    def load(self, screenshotId, full=False):
+        '''
+        Method to load the image of a screenshot.
+
+        Parameters:
+            screenshotId:
+                ID of the screenshot as stored in the session or page document
+            (full):
+                load the full PNG instead of the thumbnail
+
+        Returns:
+            bytes of the image or None if it was not stored
+        '''
+        document = self.collection.find_one({"_id": screenshotId})
+        fileId = document and document.get("full" if full else "thumbnail")
+        if fileId is None:
+            return None
+        return self.files.get(fileId).read()
+
+    def close(self):
+        '''
+        Method to wait until all screenshots are stored
+        '''
+        self.executor.shutdown(wait=True)
+        logging.info("screenshots stored: %s, duplicates: %s" %
+                     (self.stored, self.duplicates))
@@ -0,0 +1,163 @@
+import threading
+import logging
+import queue
+import time
+
+import pymongo
+
+from scraper.storageInterfaces import localSpool
+
+
+class backgroundWriter:
+    '''
+    Writes documents to MongoDB in background threads.
+    Documents are put on a bounded queue and written in batches with insert_many,
+    so the scraping thread does not wait for the database.
+    If the queue is full, put() blocks until the writers have caught up (backpressure).
+    If a spool is given, documents are spooled while the database is not reachable.
+    '''
+
+    def __init__(self, client, maxQueueSize=1000, batchSize=100, workers=1, spoolInstance=None):
+        '''
+        Method to create a backgroundWriter and start the writer threads.
+
+        Parameters:
+            client:
+                pymongo.MongoClient
+            (maxQueueSize):
+                maximum number of documents waiting to be written
+            (batchSize):
+                maximum number of documents written with one insert_many
+            (workers):
+                number of writer threads
+            (spoolInstance):
+                localSpool for documents which could not be written because the
+                database was not reachable
+        '''
+        self.client = client
+        self.spool = spoolInstance
+        self.databaseRetry = 0
+        self.batchSize = batchSize
+        self.queue = queue.Queue(maxsize=maxQueueSize)
+        self.failed = []
+        self.written = 0
+        self.lock = threading.Lock()
+        self.threads = [threading.Thread(target=self.__run, name="backgroundWriter-%s" % i, daemon=True)
+                        for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+        logging.info("background writer started with %s threads" % workers)
+
+    def put(self, database, collection, document):
+        '''
+        Method to queue a document. Blocks while the queue is full.
+
+        Parameters:
+            database:
+                name of the database
+            collection:
+                name of the collection
+            document:
+                document to insert, must not be changed afterwards
+        '''
+        if self.queue.full():
+            logging.info("write queue full, waiting for the background writer")
+        self.queue.put((database, collection, document))
+
+    def __nextBatch(self):
+        '''
+        Waits for the next document and takes further queued documents up to batchSize.
+
+        Returns:
+            list of (database, collection, document), None if the writer is stopped
+        '''
+        item = self.queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        while len(batch) < self.batchSize:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # keep the stop signal for the next call
+                self.queue.put(item)
+                break
+            batch.append(item)
+        return batch
+
+    def __run(self):
+        '''
+        Loop of a writer thread. Batches are grouped by collection and inserted unordered.
+        '''
+        while True:
+            batch = self.__nextBatch()
+            if batch is None:
+                return
+
+            groups = {}
+            for database, collection, document in batch:
+                groups.setdefault((database, collection), []).append(document)
+
+            for (database, collection), documents in groups.items():
+                self.__write(database, collection, documents)
+
+    def __write(self, database, collection, documents):
+        '''
+        Inserts documents into a collection. Documents that could not be written are
+        stored in self.failed with the error.
+        If the database is not reachable, the documents are spooled instead.
+        '''
+        if self.spool and time.time() < self.databaseRetry:
+            self.__spool(database, collection, documents)
+            return
+        try:
+            self.client[database][collection].insert_many(
+                documents, ordered=False)
+            failed = []
+        except pymongo.errors.ConnectionFailure as e:
+            if self.spool is None:
+                failed = [(document, str(e)) for document in documents]
+            else:
+                logging.error("database not reachable, spooling documents: " + str(e))
+                self.databaseRetry = time.time() + localSpool.retryInterval
+                self.__spool(database, collection, documents)
+                return
+        except pymongo.errors.BulkWriteError as e:
+            failed = [(documents[error["index"]], error["errmsg"])
+                      for error in e.details.get("writeErrors", [])]
+        except Exception as e:
+            failed = [(document, str(e)) for document in documents]
+
+        with self.lock:
+            self.written += len(documents) - len(failed)
+            for document, error in failed:
+                logging.error("document could not be inserted into %s.%s: %s" %
+                              (database, collection, error))
+                self.failed.append({"database": database, "collection": collection,
+                                    "document": document, "error": error})
+
+    def __spool(self, database, collection, documents):
+        '''
+        Appends documents to the spool.
+        '''
+        for document in documents:
+            self.spool.append(database, collection, document)
+
+    def close(self):
+        '''
+        Method to write all queued documents and stop the writer threads.
+
+        Returns:
+            list of the documents that could not be written, each a dict with
+            database, collection, document and error
+        '''
+        start = time.time()
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        logging.info("background writer closed: %s documents written, %s failed, %.1f seconds to flush" % (
+            self.written, len(self.failed), time.time() - start))
+        return self.failed
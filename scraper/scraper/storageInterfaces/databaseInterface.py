@@ -1,5 +1,215 @@
+from bson import ObjectId
 import pymongo
 import logging
+import copy
+import time
+
+from scraper.extraction import articleExtractor
+from scraper.records import pageRecords
+from scraper.fetching import rawPage
+from scraper.storageInterfaces import backgroundWriter, localSpool, rollups
+
+
+# Indexes of all collections written by the databaseInterface.
+# database -> collection -> list of index keys
+indexes = {
+    "googleNews": {
+        "source": [[("profil", 1), ("sessionNr", 1), ("time", -1)], [("time", -1)]],
+        "tiles": [[("sourceId", 1), ("tileNr", 1)]],
+        "articles": [[("tileId", 1), ("articleNr", 1)], [("profil", 1)], [("url", 1)],
+                     [("topic.confidence", 1)]]
+    },
+    "flipBoard": {
+        "source": [[("profil", 1), ("sessionNr", 1), ("time", -1)], [("time", -1)]],
+        "articles": [[("sourceID", 1), ("articleNr", 1)], [("profil", 1)], [("url", 1)],
+                     [("topic.confidence", 1)]]
+    },
+    "spiegel": {
+        "source": [[("time", -1)]],
+        "articles": [[("sourceID", 1), ("articleNr", 1)], [("url", 1)],
+                     [("topic.confidence", 1)]]
+    },
+    "westfaelischeNachrichten": {
+        "source": [[("time", -1)]],
+        "articles": [[("sourceID", 1), ("articleNr", 1)], [("url", 1)],
+                     [("topic.confidence", 1)]]
+    },
+    "googleProfile": {
+        "source": [[("profil", 1), ("sessionNr", 1), ("time", -1)]],
+        "interestChanges": [[("profil", 1), ("time", 1)], [("added", 1)], [("removed", 1)]]
+    },
+    "sessions": {
+        "session": [[("profilename", 1), ("sessionNr", 1), ("time", -1)]]
+    },
+    "screenshots": {
+        "screenshots": [[("dhash", 1)]]
+    },
+    "analysis": {
+        "overlap": [[("sourceType", 1), ("windowStart", -1)]]
+    },
+    "jobs": {
+        "queue": [[("state", 1), ("notBefore", 1)], [("state", 1), ("lease.expires", 1)]]
+    },
+    "runs": {
+        "report": [[("profile", 1), ("type", 1), ("time", -1)], [("incomplete", 1), ("time", -1)],
+                   [("type", 1), ("resources.peakRss.total", -1)]],
+        "checkpoints": [[("state", 1), ("updated", -1)]],
+        "checkpointArticles": [[("runId", 1), ("page", 1)]]
+    }
+}
+
+# Indexes of the databases of further RSS feeds
+rssIndexes = {
+    "source": [[("time", -1)]],
+    "articles": [[("sourceID", 1), ("articleNr", 1)], [("url", 1)], [("topic.confidence", 1)]]
+}
+
+# Large fields which are excluded by the read methods unless requested.
+# database -> collection -> list of fields
+# A nested field (elements.screenshot) is not loaded on access, see lazyDocument.
+htmlFields = {
+    "googleNews": {
+        "source": ["html", "screenshot"],
+        "articles": ["referrerPage", "finalPage"]
+    },
+    "flipBoard": {
+        "source": ["html", "screenshot"],
+        "articles": ["html"]
+    },
+    "spiegel": {
+        "source": ["rss"],
+        "articles": ["html"]
+    },
+    "westfaelischeNachrichten": {
+        "source": ["rss"],
+        "articles": ["html"]
+    },
+    "googleProfile": {
+        "source": ["html"]
+    },
+    "sessions": {
+        "session": ["elements.screenshot"]
+    }
+}
+
+# Large fields of the databases of further RSS feeds
+rssHtmlFields = {
+    "source": ["rss"],
+    "articles": ["html"]
+}
+
+
+class lazyDocument(dict):
+    '''
+    Document of a read cursor. Excluded top-level HTML fields are loaded from the database
+    when they are accessed with document[field].
+    Excluded nested fields, e.g. the screenshots of the elements of a session, are missing
+    from the document and are not loaded on access. They are read with
+    databaseInterface.loadHtml, e.g. loadHtml("sessions", "session", _id, ["elements"]).
+    '''
+
+    def __init__(self, document, collection, excludedFields):
+        '''
+        Parameters:
+            document:
+                document as returned by pymongo
+            collection:
+                pymongo collection of the document
+            excludedFields:
+                fields which were excluded by the projection
+        '''
+        super().__init__(document)
+        self.collection = collection
+        self.excludedFields = excludedFields
+
+    def __missing__(self, key):
+        '''
+        Loads an excluded field on access.
+        '''
+        if key not in self.excludedFields:
+            raise KeyError(key)
+        loaded = self.collection.find_one({"_id": self["_id"]}, {key: 1})
+        if loaded is None or key not in loaded:
+            raise KeyError(key)
+        self[key] = loaded[key]
+        return loaded[key]
+
+
+class readCursor:
+    '''
+    Lazy cursor over a collection. Documents are only requested from the database
+    while iterating, in batches of pageSize documents.
+    '''
+
+    def __init__(self, collection, query, excludedFields, pageSize=100, sort=None):
+        '''
+        Parameters:
+            collection:
+                pymongo collection
+            query:
+                MongoDB filter
+            excludedFields:
+                fields which are not loaded with the documents
+            (pageSize):
+                number of documents per page and per database round trip
+            (sort):
+                list of (field, direction), default is the insertion order
+        '''
+        self.collection = collection
+        self.query = query
+        self.excludedFields = excludedFields
+        self.pageSize = pageSize
+        self.sort = sort or [("_id", 1)]
+
+    def __find(self):
+        projection = {field: 0 for field in self.excludedFields} or None
+        return self.collection.find(self.query, projection).sort(self.sort)
+
+    def __iter__(self):
+        '''
+        Iterates over all documents.
+        '''
+        for document in self.__find().batch_size(self.pageSize):
+            yield lazyDocument(document, self.collection, self.excludedFields)
+
+    def pages(self):
+        '''
+        Iterates over all documents page by page.
+        Returns:
+            generator of lists with at most pageSize documents
+        '''
+        page = []
+        for document in self:
+            page.append(document)
+            if len(page) == self.pageSize:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def page(self, pageNr):
+        '''
+        Returns a single page.
+        Parameters:
+            pageNr:
+                number of the page starting with 0
+        Returns:
+            list with at most pageSize documents
+        '''
+        cursor = self.__find().skip(pageNr * self.pageSize).limit(self.pageSize)
+        return [lazyDocument(document, self.collection, self.excludedFields) for document in cursor]
+
+    def count(self):
+        '''
+        Returns the number of documents matching the query.
+        '''
+        return self.collection.count_documents(self.query)
+
+    def explain(self):
+        '''
+        Returns the query plan of the cursor. Used to check the use of the indexes.
+        '''
+        return self.__find().explain()
 
 
 class databaseInterface:
@@ -7,7 +217,8 @@ class databaseInterface:
     Interface with the MongoDB database of the survey
     '''
 
-    def __init__(self,  address, port, profileName=None, ):
+    def __init__(self,  address, port, profileName=None, storyClustererInstance=None,
+                 writerThreads=0, writeQueueSize=1000, spoolPath=None, timeout=5000, rollupsEnabled=True):
         '''
         Method to create a databaseInterface instance. 
         A connection to the database is established on the passed address
@@ -20,16 +231,351 @@ class databaseInterface:
                 Port released on the machine with the given address.
             (profilename):
                 Name of the profile, which is stored during some database operations
+            (storyClustererInstance):
+                storyClusterer which assigns each saved article to a story cluster
+            (writerThreads):
+                number of background writer threads. If > 0, the save methods only queue
+                the documents and return, close() must be called at the end of the run.
+            (writeQueueSize):
+                maximum number of queued documents of the background writer
+            (spoolPath):
+                folder of the local spool. If the database is not reachable, documents
+                are appended to the spool and can be loaded later with replaySpool().
+            (timeout):
+                milliseconds to wait for the database before a write fails
+            (rollupsEnabled):
+                update the rollup documents (see rollups.py) with every saved page
 
         '''
 
         self.profileName = profileName
-        self.client = pymongo.MongoClient(address, port)
+        self.storyClusterer = storyClustererInstance
+        self.client = pymongo.MongoClient(
+            address, port, serverSelectionTimeoutMS=timeout)
+        self.spoolPath = spoolPath
+        self.spool = localSpool.localSpool(spoolPath) if spoolPath else None
+        self.databaseRetry = 0
+        self.rollupsEnabled = rollupsEnabled
+        self.writer = None
+        if writerThreads > 0:
+            self.writer = backgroundWriter.backgroundWriter(
+                self.client, writeQueueSize, workers=writerThreads, spoolInstance=self.spool)
+
+    def forProfile(self, profileName):
+        '''
+        Method to get a databaseInterface of another profile which shares the connection,
+        the background writer, the spool and the story clusterer with this one.
+        Only the databaseInterface it was created from must be closed.
+
+        Parameters:
+            profileName:
+                name of the profile which is stored with the documents
+
+        Returns:
+            databaseInterface
+        '''
+        instance = copy.copy(self)
+        instance.profileName = profileName
+        return instance
+
+    def close(self):
+        '''
+        Method to finish all writes. Queued documents of the background writer are written.
+
+        Returns:
+            list of the documents that could not be written, each a dict with
+            database, collection, document and error
+        '''
+        failed = []
+        if self.writer is not None:
+            failed = self.writer.close()
+            self.writer = None
+        if self.spool is not None:
+            self.spool.close()
+        return failed
+
+    def replaySpool(self):
+        '''
+        Method to load all spooled documents into the database.
+        The replay is idempotent, the references between the documents are kept.
+
+        Returns:
+            Dict
+                segments: number of replayed segments, documents: number of replayed documents
+        '''
+        return localSpool.replay(self.spoolPath, self.client)
+
+    def __insert(self, database, collection, document):
+        '''
+        Helper method to insert a document. The _id is created here, so
+        documents can reference each other before they are written.
+        Records and rawPages are converted to their documents.
+        With a background writer the document is only queued.
+
+        Parameters:
+            database:
+                name of the database
+            collection:
+                name of the collection
+            document:
+                document to insert
+
+        Returns:
+            _id of the document
+        '''
+        document = pageRecords.toDocument(document)
+        document.setdefault("_id", ObjectId())
+        if self.writer:
+            self.writer.put(database, collection, document)
+        elif self.spool and time.time() < self.databaseRetry:
+            self.spool.append(database, collection, document)
+        else:
+            try:
+                self.client[database][collection].insert_one(document)
+            except pymongo.errors.ConnectionFailure as e:
+                if self.spool is None:
+                    raise
+                logging.error("database not reachable, spooling documents: " + str(e))
+                self.databaseRetry = time.time() + localSpool.retryInterval
+                self.spool.append(database, collection, document)
+        return document["_id"]
+
+    def __writeRollups(self, counter):
+        '''
+        Helper method to add the counts of a saved page to the rollup documents.
+        The rollups are derived data, so they are not spooled. If the database is not
+        reachable they are incomplete until rebuildRollups is called.
+        '''
+        if not self.rollupsEnabled:
+            return
+        if self.spool and time.time() < self.databaseRetry:
+            logging.error("rollups not updated while spooling, rebuild them with --type rebuildRollups")
+            return
+        try:
+            rollups.write(self.client, counter)
+        except pymongo.errors.PyMongoError as e:
+            logging.error("rollups could not be updated, rebuild them with --type rebuildRollups: " + str(e))
+
+    def rebuildRollups(self, rssDatabases=()):
+        '''
+        Method to regenerate the rollup documents from all stored pages and articles.
+
+        Parameters:
+            (rssDatabases):
+                databases of the RSS feeds
+
+        Returns:
+            Dict
+                number of rollup documents
+        '''
+        return rollups.rebuild(self.client, rssDatabases)
+
+    def getRollups(self, query=None):
+        '''
+        Method to read rollup documents. The documents are described in rollups.rollupCounter:
+            sourceType, profile, sessionNr, day, tileType: key of the rollup
+            pages: number of collected pages
+            tiles: number of tiles (Google News)
+            articles: number of stored articles
+            failures: number of articles whose page could not be downloaded
+            hosts: hosts of the articles
+            uniqueHosts: number of hosts
+
+        Parameters:
+            (query):
+                MongoDB filter, e.g. {"profile": "profil1", "day": {"$gte": "2020-05-01"}}
+
+        Returns:
+            list of rollup documents sorted by day
+        '''
+        return list(self.client[rollups.rollupDatabase][rollups.rollupCollection].aggregate([
+            {"$match": query or {}},
+            {"$addFields": {"uniqueHosts": {"$size": "$hosts"}}},
+            {"$sort": {"day": 1}}]))
+
+    def createIndexes(self, rssDatabases=()):
+        '''
+        Method to create the indexes of all collections written by this class.
+        Existing indexes are kept, so the method can be called before every run.
+
+        Parameters:
+            (rssDatabases):
+                databases of configured RSS feeds which are not in indexes
+        '''
+        logging.info("creating indexes")
+        allIndexes = dict(indexes)
+        for database in rssDatabases:
+            allIndexes.setdefault(database, rssIndexes)
+        for database, collections in allIndexes.items():
+            for collection, keys in collections.items():
+                for key in keys:
+                    self.client[database][collection].create_index(key)
+        rollups.createIndexes(self.client)
+        logging.info("indexes created")
+
+    def __read(self, database, collection, query, includeHtml, pageSize, sort=None):
+        '''
+        Helper method to create a read cursor. HTML fields are excluded unless includeHtml is set.
+        '''
+        excludedFields = [] if includeHtml else htmlFields.get(
+            database, rssHtmlFields).get(collection, [])
+        return readCursor(self.client[database][collection], query or {},
+                          excludedFields, pageSize, sort)
+
+    def getPages(self, database, query=None, includeHtml=False, pageSize=100):
+        '''
+        Method to read collected pages (source documents), e.g. Google News pages or RSS feeds.
+        The newest pages are returned first.
+
+        Parameters:
+            database:
+                googleNews, flipBoard, googleProfile or the database of an RSS feed
+            (query):
+                MongoDB filter, e.g. {"profil": "profil1", "sessionNr": 3}
+            (includeHtml):
+                load html, rss and screenshot with the documents
+            (pageSize):
+                number of documents per database round trip
+
+        Returns:
+            readCursor
+        '''
+        return self.__read(database, "source", query, includeHtml, pageSize, [("time", -1)])
+
+    def getSessions(self, query=None, includeHtml=False, pageSize=100):
+        '''
+        Method to read executed sessions (see saveSession). The newest sessions are returned first.
+        Without includeHtml the elements have no screenshot and element["screenshot"] raises
+        KeyError, the screenshots of a session are read with
+        loadHtml("sessions", "session", session["_id"], ["elements"]).
+
+        Parameters:
+            (query):
+                MongoDB filter, e.g. {"profilename": "profil1", "sessionNr": 3}
+            (includeHtml):
+                load the screenshots of the elements with the documents
+            (pageSize):
+                number of documents per database round trip
+
+        Returns:
+            readCursor
+        '''
+        return self.__read("sessions", "session", query, includeHtml, pageSize, [("time", -1)])
+
+    def getTiles(self, sourceId, pageSize=100):
+        '''
+        Method to read the tiles of a Google News page.
+
+        Parameters:
+            sourceId:
+                ID of the Google News page in googleNews.source
+
+        Returns:
+            readCursor
+        '''
+        return self.__read("googleNews", "tiles", {"sourceId": sourceId}, False,
+                           pageSize, [("tileNr", 1)])
+
+    def getArticles(self, database, query=None, includeHtml=False, pageSize=100):
+        '''
+        Method to read collected articles.
+
+        Parameters:
+            database:
+                googleNews, flipBoard or the database of an RSS feed
+            (query):
+                MongoDB filter, e.g. {"tileId": tileId} or {"sourceID": sourceId}
+            (includeHtml):
+                load the html of the articles with the documents
+            (pageSize):
+                number of documents per database round trip
+
+        Returns:
+            readCursor
+        '''
+        return self.__read(database, "articles", query, includeHtml, pageSize)
+
+    def getArticlesOfPage(self, database, sourceId, includeHtml=False, pageSize=100):
+        '''
+        Method to read all articles of a collected page.
+        For Google News the articles are joined via the tiles of the page.
+
+        Parameters:
+            database:
+                googleNews, flipBoard or the database of an RSS feed
+            sourceId:
+                ID of the page in the collection source
+
+        Returns:
+            readCursor
+        '''
+        if database == "googleNews":
+            tileIds = [tile["_id"] for tile in self.getTiles(sourceId)]
+            query = {"tileId": {"$in": tileIds}}
+            sort = [("tileId", 1), ("articleNr", 1)]
+        else:
+            query = {"sourceID": sourceId}
+            sort = [("sourceID", 1), ("articleNr", 1)]
+        return self.__read(database, "articles", query, includeHtml, pageSize, sort)
+
+    def loadHtml(self, database, collection, documentId, fields=None, asText=False):
+        '''
+        Method to load the HTML fields of a single document.
+
+        Parameters:
+            database:
+                name of the database
+            collection:
+                name of the collection
+            documentId:
+                _id of the document
+            (fields):
+                fields to load, default are all HTML fields of the collection
+            (asText):
+                decode fields stored as raw bytes with their charset
+
+        Returns:
+            dict with the loaded fields and their charsets
+        '''
+        fields = fields or htmlFields.get(database, rssHtmlFields)[collection]
+        projection = {field: 1 for field in fields}
+        projection.update({field + "Charset": 1 for field in fields})
+        document = self.client[database][collection].find_one(
+            {"_id": documentId}, projection)
+        if document is not None and asText:
+            for field in fields:
+                if field in document:
+                    document[field] = rawPage.documentText(document, field)
+        return document
+
+    def __assignStory(self, article, htmlField):
+        '''
+        Helper method to store the story cluster of an article in article["storyCluster"].
+        The text of the extraction stage is used, if it is missing the main text is extracted
+        from the HTML of the article.
+
+        Parameters:
+            article:
+                article dict
+            htmlField:
+                field with the HTML of the article
+        '''
+        if self.storyClusterer is None:
+            return
+        try:
+            text = (article.get("extract") or {}).get("text")
+            if not text and article.get(htmlField):
+                text = articleExtractor.extractArticle(
+                    rawPage.documentText(article, htmlField))["text"]
+            article["storyCluster"] = self.storyClusterer.assign(text)
+        except Exception as e:
+            logging.error("story cluster could not be assigned: " + str(e))
 
     def saveGoogleNewsPage(self, tiles, source, sessionNr=None):
         '''
         Method to store a collected Google News website in MongoDB database.
         All tiles for each source and each article for each tile are stored.
+        The counts of the page are added to the rollups (see getRollups).
         The data is stored according to the following scheme:
 
         googleNews.source:
@@ -38,55 +584,77 @@ class databaseInterface:
             html: HTML code of the website
             time: time of the survey
             screenshot: Screenshot of the website in BASE64
+            (scroll): steps, items, seconds and stopReason of the harvest while scrolling
+            (incomplete): True if the article downloads were stopped by a deadline
+            (linkDecoding): decoded, referrer, failed, reasons and hitRate of the links of the articles (googleNewsLinks.decoderStats)
 
         googleNews.tiles:
             sourceId: ID of the document in source, to be able to assign tiles to sources
             tileNr: number of tiles from top to bottom
             tileType: either "single field", "multifield" or "panorama", type of field in HTML code
+            (scrollDepth): distance of the tile from the top of the page in pixels, if the page was harvested while scrolling
 
         googleNews.articles:
             googleLink: Google referrer URL 
             url: last URL after redirection
-            referrerPage: html of the referrer page
-            finalPage: html of the website after redirection
+            referrerPage: html of the referrer page as received (bytes), None if the URL was decoded from googleLink
+            referrerPageCharset: charset of referrerPage
+            finalPage: html of the website after redirection as received (bytes)
+            finalPageCharset: charset of finalPage
             profile: profile name of the collected profile
             articleNr: number of the article within a tile
             tileId: Number of the related tile
             timestamp: time of saving
+            (extract): headline, publisher, canonicalUrl, publishDate and text of the article
+            (storyCluster): ID of the story cluster of the article
+            (urlSource): decoded if the URL was decoded from googleLink, referrer if it was read from the referrer page
 
         parameters:
             tiles: 
-                structured tile data
+                list of tileRecord or structured tile data
             source:
                 structured data to source file
             (sessionNr):
                 session that was executed directly before execution
 
-
+        Returns:
+            _id of the source document
         '''
         logging.info("saving Google News Page")
-        db = self.client["googleNews"]
         source["profil"] = self.profileName
         source["sessionNr"] = sessionNr
-        sourceId = db.source.insert_one(source).inserted_id
+        sourceId = self.__insert("googleNews", "source", source)
+        rollupKey = ("googleNews", self.profileName, sessionNr, rollups.day(source.get("time")))
+        counter = rollups.rollupCounter()
+        counter.add(rollupKey + (None,), pages=1)
 
         for i, tile in enumerate(tiles):
+            tile = pageRecords.toDocument(tile)
             tile["profil"] = self.profileName
             tileData = {"sourceId": sourceId,
                         "tileNr": i, "tileType": tile['tileType']}
-            tileId = db.tiles.insert_one(tileData).inserted_id
+            if "scrollDepth" in tile:
+                tileData["scrollDepth"] = tile["scrollDepth"]
+            tileId = self.__insert("googleNews", "tiles", tileData)
+            counter.add(rollupKey + (tile['tileType'],), tiles=1)
 
             for i, article in enumerate(tile["articles"]):
                 article["profil"] = self.profileName
                 article["articleNr"] = i
                 article["tileId"] = tileId
-                db.articles.insert_one(article)
+                self.__assignStory(article, "finalPage")
+                self.__insert("googleNews", "articles", article)
+                counter.addArticle(rollupKey + (tile['tileType'],),
+                                   article.get("url"), article.get("finalPage") is None)
+        self.__writeRollups(counter)
         logging.info("Google News Page saved")
+        return sourceId
 
     def saveFlipboardPage(self, articles, source, sessionNr=None):
         '''
         Method to store a collected Flipboard website in MongoDB database.
         All tiles for each source and each article for each tile are stored.
+        The counts of the page are added to the rollups (see getRollups).
         The data is stored according to the following scheme:
 
         flipBoard.source:
@@ -95,92 +663,123 @@ class databaseInterface:
             html: HTML code of the website
             time: time of the survey
             screenshot: Screenshot of the website in BASE64
+            (scroll): steps, items, seconds and stopReason of the harvest while scrolling
+            (incomplete): True if the article downloads were stopped by a deadline
 
         flipBoard.articles:
             url: url of the article
-            html: html of the article
+            html: html of the article as received (bytes)
+            htmlCharset: charset of html
             profile: profile name of the raised profile
             articleNr: number of the article within a tile
             sourceID: number of the corresponding tile
+            (scrollDepth): distance of the article from the top of the page in pixels, if the page was harvested while scrolling
+            (extract): headline, publisher, canonicalUrl, publishDate and text of the article
+            (storyCluster): ID of the story cluster of the article
 
         parameters:
             tiles: 
-                structured tile data
+                list of flipboardArticleRecord or structured article data
             source:
                 structured data to source file
             (sessionNr):
                 session that was executed directly before execution
+
+        Returns:
+            _id of the source document
         '''
 
         logging.info("saving Flipboard Page")
-        db = self.client["flipBoard"]
         source["profil"] = self.profileName
         source["sessionNr"] = sessionNr
-        sourceId = db.source.insert_one(source).inserted_id
+        sourceId = self.__insert("flipBoard", "source", source)
+        rollupKey = ("flipBoard", self.profileName, sessionNr, rollups.day(source.get("time")), None)
+        counter = rollups.rollupCounter()
+        counter.add(rollupKey, pages=1)
 
         for i, article in enumerate(articles):
+            article = pageRecords.toDocument(article)
             article["profil"] = self.profileName
             article["articleNr"] = i
             article["sourceID"] = sourceId
+            self.__assignStory(article, "html")
             try:
-                db.articles.insert_one(article)
+                self.__insert("flipBoard", "articles", article)
+                counter.addArticle(rollupKey, article.get("url"), article.get("html") is None)
             except Exception as e:
                 logging.error("document could not be inserted: "+str(e))
 
+        self.__writeRollups(counter)
         logging.info("Flipboard Page saved")
+        return sourceId
 
-    def saveSpiegelRss(self, articles, source):
+    def saveRss(self, articles, source, database):
         '''
-        Method to store a collected Spiegel Online RSS feed in the MongoDB database.
+        Method to store a collected RSS feed in the MongoDB database.
+        Every feed is stored in its own database.
         For each source Rss feed all articles are stored.
+        The counts of the page are added to the rollups (see getRollups).
         The data is stored according to the following scheme:
 
-        spiegel.source:
-            rss: pure RSS document
+        <database>.source:
+            rss: pure RSS document as received (bytes)
+            rssCharset: charset of rss
             time: time of collection
+            (incomplete): True if the article downloads were stopped by a deadline
 
-        spiegel.articles:
+        <database>.articles:
             age: creation date of the article
             timeStamp: time of the download
             link: url of the article
-            html: html code of the article's website
+            html: html code of the article's website as received (bytes)
+            htmlCharset: charset of html
             sourceID: ID of the source of the article
             articleNr: number of the article per feed from first in the feed to last
+            (extract): headline, publisher, canonicalUrl, publishDate and text of the article
+            (storyCluster): ID of the story cluster of the article
 
         Parameters:
             articles: 
-                structured data of articles
+                list of rssEntryRecord or structured data of articles
             source:
                 structured data to source file
-
+            database:
+                name of the database of the feed, e.g. spiegel
         '''
-        logging.info("saving spiegelRss")
-        db = self.client["spiegel"]
-        sourceID = db.source.insert_one(source).inserted_id
+        logging.info("saving rss feed in " + database)
+        sourceID = self.__insert(database, "source", source)
+        rollupKey = (database, None, None, rollups.day(source.get("time")), None)
+        counter = rollups.rollupCounter()
+        counter.add(rollupKey, pages=1)
 
         for i, article in enumerate(articles):
+            article = pageRecords.toDocument(article)
             article["sourceID"] = sourceID
             article["articleNr"] = i
-            db.articles.insert_one(article)
-        logging.info("SpiegelRss saved")
+            self.__assignStory(article, "html")
+            self.__insert(database, "articles", article)
+            counter.addArticle(rollupKey, article.get("url"), article.get("html") is None)
+        self.__writeRollups(counter)
+        logging.info("rss feed saved in " + database)
 
-    def saveWNRss(self, articles, source):
+    def saveSpiegelRss(self, articles, source):
         '''
-        Method to store a collected Spiegel Online RSS feed in the MongoDB database.
-        For each source Rss feed all articles are stored.
-        The data is stored according to the following scheme:
+        Method to store a collected Spiegel Online RSS feed in the database spiegel.
+        The scheme is described in saveRss.
 
-        westfaelischeNachrichten.source:
-            rss: pure RSS document
-            time: time of collection
+        Parameters:
+            articles: 
+                structured data of articles
+            source:
+                structured data to source file
 
-        westfaelischeNachrichten.articles:
-            age: creation date of the article
-            timeStamp: time of the download
-            link: url of the article
-            html: html code of the article's website
-            sourceID: ID of the source of the article
-            articleNr: number of the article per feed from first in the feed to last
+        '''
+        self.saveRss(articles, source, "spiegel")
+
+    def saveWNRss(self, articles, source):
+        '''
+        Method to store a collected Westfaelische Nachrichten RSS feed in the database
+        westfaelischeNachrichten. The scheme is described in saveRss.
 
         Parameters:
             articles: 
@@ -188,15 +787,143 @@ class databaseInterface:
             source:
                 structured data to source file
         '''
-        logging.info("saving WnRss")
-        db = self.client["westfaelischeNachrichten"]
-        sourceID = db.source.insert_one(source).inserted_id
+        self.saveRss(articles, source, "westfaelischeNachrichten")
 
-        for i, article in enumerate(articles):
-            article["sourceID"] = sourceID
-            article["articleNr"] = i
-            db.articles.insert_one(article)
-        logging.info("WnRss saved")
+    def saveRssReport(self, report):
+        '''
+        Method to store the report of a run of the rssCollector.
+        The data is stored according to the following scheme:
+
+        rssRuns.report:
+            time: start of the run
+            seconds: duration of the run
+            articles: number of stored articles of all feeds
+            failed: number of articles which could not be downloaded
+            failedFeeds: number of feeds which could not be collected
+            feeds: name, database, articles, failed, seconds and (error) of every feed
+
+        Parameters:
+            report:
+                report returned by rssCollector.collect
+        '''
+        self.__insert("rssRuns", "report", report)
+
+    def saveRunReport(self, report):
+        '''
+        Method to store the record of a run with its durations, deadline hits and resource usage.
+        The data is stored according to the following scheme:
+
+        runs.report:
+            (runId): ID of the run, its checkpoints are in runs.checkpoints (see runCheckpoint)
+            type: type of execution
+            profile: profile name, None for runs without browser
+            sessionNr: number of the executed session
+            time: start of the run
+            seconds: duration of the run
+            limits: configured deadlines in seconds
+            stages: seconds of the stages personalization, capture, downloads and save
+            hits: stage, limit (stage or run), seconds of the stage and runSeconds of every
+                stage which reached its deadline
+            incomplete: True if a stage reached its deadline
+            (resources): samples and summary of the resourceSampler (see resourceSampler.report):
+                profile, interval
+                samples: t, stages and rss, cpu, fds, threads and processes of the groups
+                    python, browser, otherBrowsers and workers
+                peakRss, cpuSeconds: per group and total
+                peakFds, peakProcesses
+
+        Parameters:
+            report:
+                report of runDeadline.report with type, profile, sessionNr and (resources)
+        '''
+        self.__insert("runs", "report", report)
+
+    def getResourceSummary(self, query=None):
+        '''
+        Method to summarize the resource usage of the sampled runs per type of execution.
+
+        Parameters:
+            (query):
+                MongoDB filter of the runs, e.g. {"time": {"$gte": datetime(2020, 5, 1)}}
+
+        Returns:
+            list sorted by type, each with
+                type: type of execution
+                runs: number of sampled runs
+                peakRss: highest RSS of all processes of a run in bytes
+                meanPeakRss: mean of the highest RSS of the runs
+                peakBrowserRss: highest RSS of the browser of a run
+                cpuSeconds: mean CPU seconds of a run
+                maxCpuSeconds: highest CPU seconds of a run
+                seconds: mean duration of a run
+                peakProcesses: highest number of processes of a run
+        '''
+        match = dict(query or {}, resources={"$exists": True})
+        summary = self.client["runs"]["report"].aggregate([
+            {"$match": match},
+            {"$group": {"_id": "$type",
+                        "runs": {"$sum": 1},
+                        "peakRss": {"$max": "$resources.peakRss.total"},
+                        "meanPeakRss": {"$avg": "$resources.peakRss.total"},
+                        "peakBrowserRss": {"$max": "$resources.peakRss.browser"},
+                        "cpuSeconds": {"$avg": "$resources.cpuSeconds.total"},
+                        "maxCpuSeconds": {"$max": "$resources.cpuSeconds.total"},
+                        "seconds": {"$avg": "$seconds"},
+                        "peakProcesses": {"$max": "$resources.peakProcesses"}}},
+            {"$sort": {"_id": 1}}])
+        return [{"type": row.pop("_id"), **row} for row in summary]
+
+    def saveTopics(self, database, articleIds, predictions):
+        '''
+        Method to store the predicted topics of articles in the field topic of the articles.
+        The data is stored according to the following scheme:
+
+        <database>.articles:
+            topic:
+                oberthema, unterthema, form, place: label and confidence of the prediction
+                confidence: lowest confidence of all predicted columns
+                model: training time of the classifier
+
+        Parameters:
+            database:
+                database of the articles
+            articleIds:
+                _id of the articles
+            predictions:
+                predictions of topicClassifier.predict in the order of articleIds
+        '''
+        updates = [pymongo.UpdateOne({"_id": articleId}, {"$set": {"topic": prediction}})
+                   for articleId, prediction in zip(articleIds, predictions)]
+        if updates:
+            self.client[database]["articles"].bulk_write(updates, ordered=False)
+
+    def saveOverlap(self, results):
+        '''
+        Method to store the overlap matrices of the overlapEngine.
+        The results are derived data, a result of the same window replaces the stored one.
+        The data is stored according to the following scheme:
+
+        analysis.overlap:
+            sourceType: googleNews or flipBoard
+            windowStart: start of the collection window
+            windowMinutes: length of the collection window
+            persistence: persistence of the rank-biased overlap
+            profiles: compared profiles
+            pages: IDs of the compared pages in the order of profiles
+            sizes: number of distinct articles per page
+            jaccard: Jaccard similarity of the article sets, profiles x profiles
+            rbo: rank-biased overlap of the article rankings, profiles x profiles
+
+        Parameters:
+            results:
+                results of overlapEngine.compute
+        '''
+        collection = self.client["analysis"]["overlap"]
+        for result in results:
+            key = {"sourceType": result["sourceType"], "windowStart": result["windowStart"],
+                   "windowMinutes": result["windowMinutes"]}
+            collection.replace_one(key, result, upsert=True)
+        logging.info("%s overlap results saved" % len(results))
 
     def savePersonalizationProfile(self, personalizationDict, sessionNr):
         '''
@@ -214,15 +941,117 @@ class databaseInterface:
                 structured data of articles
             (sessionNo:)
                 Session number directly before call
+
+        Returns:
+            _id of the document
         '''
 
         logging.info("saving personalization profile")
-        db = self.client["googleProfile"]
         personalizationDict["sessionNr"] = sessionNr
-        db.source.insert_one(personalizationDict)
+        profileId = self.__insert("googleProfile", "source", personalizationDict)
         logging.info("personalization profile saved")
+        return profileId
+
+    def saveInterests(self, interests, snapshotTime, sessionNr=None, sourceId=None):
+        '''
+        Method to store a snapshot of the ad interests of the profile as change against the
+        previous snapshot and to update the current interests of the profile.
+        The data is stored according to the following scheme:
+
+        googleProfile.interestChanges:
+            profil: profile name
+            time: time of the snapshot
+            sessionNr: session executed before the snapshot
+            sourceId: _id of the page in googleProfile.source
+            added: sorted labels which are new since the previous snapshot
+            removed: sorted labels which are gone since the previous snapshot
+            count: number of interests of the snapshot
+
+        googleProfile.interests:
+            _id: profile name
+            interests: sorted labels of the last snapshot
+            time, sessionNr, sourceId: of the last snapshot
+            snapshots: number of snapshots
+
+        The interests are derived from the stored page, so they are not spooled. They are
+        written directly, so the next snapshot is compared with them. If the database is not
+        reachable they are incomplete until rebuildInterests is called.
+
+        Parameters:
+            interests:
+                sorted labels of adInterests.parseInterests
+            snapshotTime:
+                time of the snapshot
+            (sessionNr):
+                session executed before the snapshot
+            (sourceId):
+                _id of the page in googleProfile.source
+
+        Returns:
+            the stored change, None if it could not be stored
+        '''
+        if self.spool and time.time() < self.databaseRetry:
+            logging.error("interests not saved while spooling, rebuild them with --type rebuildInterests")
+            return None
+        try:
+            current = self.client["googleProfile"]["interests"].find_one({"_id": self.profileName}) or {}
+            previous = set(current.get("interests") or [])
+            change = {"profil": self.profileName, "time": snapshotTime, "sessionNr": sessionNr, "sourceId": sourceId,
+                      "added": sorted(set(interests) - previous), "removed": sorted(previous - set(interests)),
+                      "count": len(interests)}
+            self.client["googleProfile"]["interestChanges"].insert_one(change)
+            self.client["googleProfile"]["interests"].replace_one(
+                {"_id": self.profileName},
+                {"interests": interests, "time": snapshotTime, "sessionNr": sessionNr, "sourceId": sourceId,
+                 "snapshots": current.get("snapshots", 0) + 1},
+                upsert=True)
+        except pymongo.errors.PyMongoError as e:
+            logging.error("interests could not be saved, rebuild them with --type rebuildInterests: " + str(e))
+            return None
+        logging.info("interests saved: %s added, %s removed" % (len(change["added"]), len(change["removed"])))
+        return change
+
+    def getInterests(self, profileName=None):
+        '''
+        Method to read the current interests of a profile (googleProfile.interests, see saveInterests).
+
+        Parameters:
+            (profileName):
+                profile name, default is the profile of this instance
+
+        Returns:
+            document of the current interests, None if no snapshot was stored
+        '''
+        return self.client["googleProfile"]["interests"].find_one({"_id": profileName or self.profileName})
+
+    def getInterestChanges(self, profileName=None, end=None):
+        '''
+        Method to read the changes of the interests of a profile (googleProfile.interestChanges,
+        see saveInterests), e.g. to replay them with adInterests.trajectory.
+
+        Parameters:
+            (profileName):
+                profile name, default is the profile of this instance
+            (end):
+                time of the last change, None for all changes
+
+        Returns:
+            cursor of time, added and removed of the changes sorted by time
+        '''
+        query = {"profil": profileName or self.profileName}
+        if end is not None:
+            query["time"] = {"$lte": end}
+        return self.client["googleProfile"]["interestChanges"].find(
+            query, {"time": 1, "added": 1, "removed": 1}).sort("time", 1)
+
+    def clearInterests(self):
+        '''
+        Method to delete the changes and current interests of all profiles before they are rebuilt
+        '''
+        self.client["googleProfile"]["interestChanges"].delete_many({})
+        self.client["googleProfile"]["interests"].delete_many({})
 
-    def saveSession(self, session, time,  sessionNr):
+    def saveSession(self, session, time,  sessionNr, incomplete=False):
         '''
         Method for saving an executed session
         The data is stored according to the following scheme:
@@ -237,21 +1066,28 @@ class databaseInterface:
                     time: time of execution
                     url: URL at the end of execution
                     screenshot: Screenshot at the end of execution
+            (incomplete): True if the session was stopped by a deadline
         parameters:
             session: 
-                executed session
+                executed session, list of sessionElementRecord
             time:
                 Time of the start of the execution
             (sessionNr:)
                 number of the executed session 
+            (incomplete):
+                True if the remaining elements were skipped at the deadline of the personalization
 
+        Returns:
+            _id of the session document
         '''
         logging.info("saving session")
-        db = self.client["sessions"]
         sessionDict = {}
         sessionDict["time"] = time
-        sessionDict["profilename"] = self.profilename
+        sessionDict["profilename"] = self.profileName
         sessionDict["sessionNr"] = sessionNr
-        sessionDict["elements"] = session
-        db.session.insert_one(sessionDict)
+        sessionDict["elements"] = [pageRecords.toDocument(element) for element in session]
+        if incomplete:
+            sessionDict["incomplete"] = True
+        sessionId = self.__insert("sessions", "session", sessionDict)
         logging.info("session saved")
+        return sessionId
@@ -0,0 +1,195 @@
+from pymongo import ReplaceOne
+from bson import ObjectId
+from datetime import datetime
+import threading
+import logging
+import struct
+import fcntl
+import bson
+import zlib
+import glob
+import os
+
+
+# header of every record: magic, length of the compressed data, crc32 of the compressed data
+recordHeader = struct.Struct("<4sII")
+recordMagic = b"NSP1"
+
+# seconds after which the database is tried again once a write has failed
+retryInterval = 60
+
+
+class localSpool:
+    '''
+    Append-only local storage for documents that could not be written to MongoDB.
+    Every document is stored as a record with database, collection and document,
+    BSON encoded, zlib compressed and secured with a CRC32 checksum.
+    Records are written to segment files of at most segmentSize bytes.
+
+    The segment that is currently written ends with .open and is locked.
+    Closed segments end with .seg and can be replayed into MongoDB with replay().
+    '''
+
+    def __init__(self, path, segmentSize=64 * 1024 * 1024):
+        '''
+        Method to create a localSpool. The folder is created if it does not exist.
+        No file is created until the first document is appended.
+
+        Parameters:
+            path:
+                folder of the segment files
+            (segmentSize):
+                size in bytes after which a new segment is started
+        '''
+        self.path = path
+        self.segmentSize = segmentSize
+        self.lock = threading.Lock()
+        self.segment = None
+        self.segmentPath = None
+        self.appended = 0
+        os.makedirs(path, exist_ok=True)
+
+    def __openSegment(self):
+        '''
+        Opens a new segment and locks it, so replay() does not read it while it is written.
+        '''
+        name = "spool-%s-%s" % (datetime.utcnow().strftime("%Y%m%d%H%M%S"), ObjectId())
+        self.segmentPath = os.path.join(self.path, name + ".open")
+        self.segment = open(self.segmentPath, "ab")
+        fcntl.flock(self.segment, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        logging.info("spool segment opened: " + self.segmentPath)
+
+    def __closeSegment(self):
+        '''
+        Writes the current segment to disk and renames it to .seg
+        '''
+        self.segment.flush()
+        os.fsync(self.segment.fileno())
+        closedPath = self.segmentPath[:-len(".open")] + ".seg"
+        os.rename(self.segmentPath, closedPath)
+        fcntl.flock(self.segment, fcntl.LOCK_UN)
+        self.segment.close()
+        self.segment = None
+        logging.info("spool segment closed: " + closedPath)
+
+    def append(self, database, collection, document):
+        '''
+        Method to append a document to the spool.
+
+        Parameters:
+            database:
+                name of the database
+            collection:
+                name of the collection
+            document:
+                document with _id
+        '''
+        data = zlib.compress(bson.encode(
+            {"database": database, "collection": collection, "document": document}))
+        record = recordHeader.pack(
+            recordMagic, len(data), zlib.crc32(data)) + data
+
+        with self.lock:
+            if self.segment is None:
+                self.__openSegment()
+            self.segment.write(record)
+            self.segment.flush()
+            self.appended += 1
+            if self.segment.tell() >= self.segmentSize:
+                self.__closeSegment()
+
+    def close(self):
+        '''
+        Method to close the current segment, so it can be replayed.
+        '''
+        with self.lock:
+            if self.segment is not None:
+                self.__closeSegment()
+        if self.appended:
+            logging.info("%s documents spooled in %s" %
+                         (self.appended, self.path))
+
+
+def readSegment(path):
+    '''
+    Reads the records of a segment file. Reading stops at the first record with an invalid
+    header or checksum, e.g. the last record of a segment of a crashed process.
+
+    Parameters:
+        path:
+            path of the segment file
+
+    Returns:
+        generator of dicts with database, collection and document
+    '''
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(recordHeader.size)
+            if not header:
+                return
+            if len(header) < recordHeader.size:
+                logging.error("truncated record in spool segment " + path)
+                return
+            magic, length, checksum = recordHeader.unpack(header)
+            data = f.read(length)
+            if magic != recordMagic or len(data) < length or zlib.crc32(data) != checksum:
+                logging.error("invalid record in spool segment " + path)
+                return
+            yield bson.decode(zlib.decompress(data))
+
+
+def replay(path, client, batchSize=500):
+    '''
+    Function to load all closed segments of a spool into MongoDB.
+    Documents are written with upserts on their _id, so a segment can be replayed
+    multiple times without creating duplicates and the references between
+    sources, tiles and articles stay valid.
+    Segments of crashed processes (.open and not locked) are replayed as well.
+    Replayed segments are renamed to .done.
+
+    Parameters:
+        path:
+            folder of the segment files
+        client:
+            pymongo.MongoClient
+        (batchSize):
+            number of documents per bulk write
+
+    Returns:
+        Dict
+            segments: number of replayed segments, documents: number of replayed documents
+    '''
+    segments = sorted(glob.glob(os.path.join(path, "*.seg")) +
+                      glob.glob(os.path.join(path, "*.open")))
+    report = {"segments": 0, "documents": 0}
+
+    for segmentPath in segments:
+        with open(segmentPath, "rb") as lockFile:
+            if segmentPath.endswith(".open"):
+                try:
+                    fcntl.flock(lockFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    # the segment is still written by a running process
+                    continue
+
+            logging.info("replaying spool segment " + segmentPath)
+            batches = {}
+            for record in readSegment(segmentPath):
+                key = (record["database"], record["collection"])
+                document = record["document"]
+                batches.setdefault(key, []).append(
+                    ReplaceOne({"_id": document["_id"]}, document, upsert=True))
+                if len(batches[key]) >= batchSize:
+                    client[key[0]][key[1]].bulk_write(
+                        batches.pop(key), ordered=False)
+                report["documents"] += 1
+            for (database, collection), requests in batches.items():
+                client[database][collection].bulk_write(
+                    requests, ordered=False)
+
+        os.rename(segmentPath, segmentPath.rsplit(".", 1)[0] + ".done")
+        report["segments"] += 1
+
+    logging.info("spool replayed: %s segments, %s documents" %
+                 (report["segments"], report["documents"]))
+    return report
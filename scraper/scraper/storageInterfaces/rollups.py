@@ -0,0 +1,223 @@
+from urllib.parse import urlparse
+from datetime import datetime
+import logging
+
+import pymongo
+
+
+# database and collection of the rollups
+rollupDatabase = "rollups"
+rollupCollection = "daily"
+
+# fields of the key of a rollup document
+keyFields = ["sourceType", "profile", "sessionNr", "day", "tileType"]
+
+# field with the html of an article per database, an article without it failed
+pageFields = {"googleNews": "finalPage", "flipBoard": "html"}
+
+
+def host(url):
+    '''
+    Returns the host of a URL without www., None if the URL is missing
+    '''
+    if not url:
+        return None
+    name = urlparse(url).hostname or ""
+    return name[4:] if name.startswith("www.") else name or None
+
+
+def day(value):
+    '''
+    Returns the day of a time of collection as YYYY-MM-DD (UTC), today if the time is missing
+    '''
+    return (value or datetime.utcnow()).strftime("%Y-%m-%d")
+
+
+class rollupCounter:
+    '''
+    Counts collected articles per rollup key:
+        sourceType: database of the page, e.g. googleNews, flipBoard or spiegel
+        profile: profile name, None for RSS feeds
+        sessionNr: session executed before the collection, None for RSS feeds
+        day: day of the collection as YYYY-MM-DD (UTC)
+        tileType: type of the tile on Google News, None for the other sources.
+            The pages of Google News are counted with tileType None, their tiles and articles
+            with the type of the tile.
+
+    The same counter is used at write time (one page) and by rebuild (all pages).
+    '''
+
+    def __init__(self):
+        self.counts = {}
+
+    def add(self, key, tiles=0, pages=0):
+        '''
+        Method to count tiles or pages.
+
+        Parameters:
+            key:
+                tuple of the values of keyFields
+            (tiles):
+                number of tiles to count
+            (pages):
+                number of pages to count
+        '''
+        counts = self.counts.setdefault(key, {"pages": 0, "tiles": 0, "articles": 0,
+                                              "failures": 0, "hosts": set()})
+        counts["pages"] += pages
+        counts["tiles"] += tiles
+        return counts
+
+    def addArticle(self, key, url, failed):
+        '''
+        Method to count an article.
+
+        Parameters:
+            key:
+                tuple of the values of keyFields
+            url:
+                url of the article
+            failed:
+                True if the page of the article could not be downloaded
+        '''
+        counts = self.add(key)
+        counts["articles"] += 1
+        counts["failures"] += int(failed)
+        articleHost = host(url)
+        if articleHost:
+            counts["hosts"].add(articleHost)
+
+    def updates(self):
+        '''
+        Returns the counts as upserts with $inc, which add them to the rollup documents
+        '''
+        return [pymongo.UpdateOne(
+            dict(zip(keyFields, key)),
+            {"$inc": {"pages": c["pages"], "tiles": c["tiles"],
+                      "articles": c["articles"], "failures": c["failures"]},
+             "$addToSet": {"hosts": {"$each": sorted(c["hosts"])}}},
+            upsert=True) for key, c in self.counts.items()]
+
+    def documents(self):
+        '''
+        Returns the counts as rollup documents
+        '''
+        return [dict(zip(keyFields, key), pages=c["pages"], tiles=c["tiles"], articles=c["articles"],
+                     failures=c["failures"], hosts=sorted(c["hosts"]))
+                for key, c in self.counts.items()]
+
+
+def write(client, counter):
+    '''
+    Function to add the counts of a rollupCounter to the rollup documents.
+    Upserts that collide with a concurrent upsert of the same key are repeated once.
+
+    Parameters:
+        client:
+            pymongo.MongoClient
+        counter:
+            rollupCounter
+    '''
+    updates = counter.updates()
+    if not updates:
+        return
+    collection = client[rollupDatabase][rollupCollection]
+    try:
+        collection.bulk_write(updates, ordered=False)
+    except pymongo.errors.BulkWriteError as e:
+        duplicates = [updates[error["index"]] for error in e.details["writeErrors"]
+                      if error["code"] == 11000]
+        if len(duplicates) < len(e.details["writeErrors"]):
+            raise
+        collection.bulk_write(duplicates, ordered=False)
+
+
+def createIndexes(client):
+    '''
+    Function to create the unique index of the rollup keys
+    '''
+    client[rollupDatabase][rollupCollection].create_index(
+        [(field, 1) for field in keyFields], unique=True)
+
+
+def countGoogleNews(client, counter):
+    '''
+    Function to count all stored Google News pages, tiles and articles
+    '''
+    database = client["googleNews"]
+    sources = {}
+    for source in database["source"].find({}, {"profil": 1, "sessionNr": 1, "time": 1}):
+        sources[source["_id"]] = (source.get("profil"), source.get("sessionNr"), day(source.get("time")))
+        counter.add(("googleNews",) + sources[source["_id"]] + (None,), pages=1)
+
+    tiles = {}
+    for tile in database["tiles"].find({}, {"sourceId": 1, "tileType": 1}):
+        if tile.get("sourceId") not in sources:
+            continue
+        tiles[tile["_id"]] = ("googleNews",) + sources[tile["sourceId"]] + (tile.get("tileType"),)
+        counter.add(tiles[tile["_id"]], tiles=1)
+
+    for article in articlePages(database, "tileId", "finalPage"):
+        if article.get("tileId") in tiles:
+            counter.addArticle(tiles[article["tileId"]], article.get("url"), article["failed"])
+
+
+def countPages(client, counter, database, withProfile=True):
+    '''
+    Function to count all stored pages and articles of Flipboard or an RSS feed
+    '''
+    sources = {}
+    for source in client[database]["source"].find({}, {"profil": 1, "sessionNr": 1, "time": 1}):
+        profile = (source.get("profil"), source.get("sessionNr")) if withProfile else (None, None)
+        sources[source["_id"]] = (database,) + profile + (day(source.get("time")), None)
+        counter.add(sources[source["_id"]], pages=1)
+
+    for article in articlePages(client[database], "sourceID", pageFields.get(database, "html")):
+        if article.get("sourceID") in sources:
+            counter.addArticle(sources[article["sourceID"]], article.get("url"), article["failed"])
+
+
+def articlePages(database, sourceField, pageField):
+    '''
+    Returns the articles of a database with the source field, the url and if the download failed,
+    without loading the html
+    '''
+    return database["articles"].aggregate([
+        {"$project": {sourceField: 1, "url": 1,
+                      "failed": {"$eq": [{"$ifNull": ["$" + pageField, None]}, None]}}}])
+
+
+def rebuild(client, rssDatabases=()):
+    '''
+    Function to regenerate all rollup documents from the stored pages and articles.
+    The rollups are built in a temporary collection which then replaces the rollup collection.
+    Pages collected during the rebuild are missing in the rollups, so no collection should run.
+
+    Parameters:
+        client:
+            pymongo.MongoClient
+        (rssDatabases):
+            databases of the RSS feeds
+
+    Returns:
+        Dict
+            number of rollup documents
+    '''
+    logging.info("rebuilding rollups")
+    counter = rollupCounter()
+    countGoogleNews(client, counter)
+    countPages(client, counter, "flipBoard")
+    for database in rssDatabases:
+        countPages(client, counter, database, withProfile=False)
+
+    documents = counter.documents()
+    temporary = client[rollupDatabase][rollupCollection + "Rebuild"]
+    temporary.drop()
+    if documents:
+        temporary.insert_many(documents)
+        temporary.rename(rollupCollection, dropTarget=True)
+    else:
+        client[rollupDatabase][rollupCollection].drop()
+    createIndexes(client)
+    logging.info("rollups rebuilt: %s documents" % len(documents))
+    return {"documents": len(documents)}
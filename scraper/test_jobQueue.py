@@ -0,0 +1,172 @@
+'''
+Tests of the job queue in MongoDB (jobQueue) and of the profile of queued jobs.
+The queue is tested with mongomock, the profile of the browser additionally needs selenium.
+
+Usage:
+    python -m pytest test_jobQueue.py
+'''
+from datetime import datetime, timedelta
+import sys
+import types
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from scraper.daemon import jobQueue
+
+
+def expire(collection, query, field):
+    collection.update_one(query, {"$set": {field: datetime.utcnow() - timedelta(seconds=1)}})
+
+
+@pytest.fixture
+def client():
+    return mongomock.MongoClient()
+
+
+def test_claimSkipsLockedProfileAndTakesOverExpiredLock(client):
+    queue = jobQueue.jobQueue(client, owner="A")
+    locked = jobQueue.enqueue(client, "googleNews", profileName="locked")
+    free = jobQueue.enqueue(client, "googleNews", profileName="free")
+    locks = client[jobQueue.queueDatabase][jobQueue.lockCollection]
+    locks.insert_one({"_id": "locked", "owner": "B", "expires": datetime.utcnow() + timedelta(minutes=5)})
+
+    assert queue.claim()["_id"] == free
+    assert queue.claim() is None
+    assert locks.find_one({"_id": "locked"})["owner"] == "B"
+
+    expire(locks, {"_id": "locked"}, "expires")
+    assert queue.claim()["_id"] == locked
+    assert locks.find_one({"_id": "locked"})["owner"] == "A"
+
+
+def test_expiredLeaseIsClaimedAgain(client):
+    jobId = jobQueue.enqueue(client, "googleNews", profileName="p")
+    first = jobQueue.jobQueue(client, owner="A")
+    second = jobQueue.jobQueue(client, owner="B")
+    jobs = client[jobQueue.queueDatabase][jobQueue.queueCollection]
+    locks = client[jobQueue.queueDatabase][jobQueue.lockCollection]
+
+    assert first.claim()["attempts"] == 1
+    assert second.claim() is None
+
+    # the worker A died: its lease and the lock of the profile expire
+    expire(jobs, {"_id": jobId}, "lease.expires")
+    expire(locks, {"_id": "p"}, "expires")
+    job = second.claim()
+    assert job["_id"] == jobId
+    assert job["attempts"] == 2
+    assert job["lease"]["owner"] == "B"
+
+
+def test_failExhausted(client):
+    jobId = jobQueue.enqueue(client, "googleNews", profileName="p", maxAttempts=1)
+    queue = jobQueue.jobQueue(client, owner="A")
+    jobs = client[jobQueue.queueDatabase][jobQueue.queueCollection]
+
+    assert queue.claim()["_id"] == jobId
+    queue.failExhausted()
+    assert jobs.find_one({"_id": jobId})["state"] == jobQueue.running
+
+    expire(jobs, {"_id": jobId}, "lease.expires")
+    queue.failExhausted()
+    job = jobs.find_one({"_id": jobId})
+    assert job["state"] == jobQueue.failed
+    assert job["error"] == "lease expired"
+    assert queue.claim() is None
+
+
+def test_completeAfterLostLease(client):
+    jobId = jobQueue.enqueue(client, "googleNews", profileName="p")
+    first = jobQueue.jobQueue(client, owner="A")
+    second = jobQueue.jobQueue(client, owner="B")
+    jobs = client[jobQueue.queueDatabase][jobQueue.queueCollection]
+    locks = client[jobQueue.queueDatabase][jobQueue.lockCollection]
+
+    job = first.claim()
+    expire(jobs, {"_id": jobId}, "lease.expires")
+    expire(locks, {"_id": "p"}, "expires")
+    assert second.claim()["_id"] == jobId
+    before = jobs.find_one({"_id": jobId})
+
+    assert first.complete(job) is False
+    assert jobs.find_one({"_id": jobId}) == before
+    assert locks.find_one({"_id": "p"})["owner"] == "B"
+
+
+def test_failedJobIsQueuedAgainAfterRetrySeconds(client):
+    jobId = jobQueue.enqueue(client, "googleNews", profileName="p", maxAttempts=3)
+    queue = jobQueue.jobQueue(client, owner="A", retrySeconds=600)
+    jobs = client[jobQueue.queueDatabase][jobQueue.queueCollection]
+    locks = client[jobQueue.queueDatabase][jobQueue.lockCollection]
+
+    job = queue.claim()
+    start = datetime.utcnow()
+    assert queue.complete(job, "browser crashed") is True
+    end = datetime.utcnow()
+
+    stored = jobs.find_one({"_id": jobId})
+    assert stored["state"] == jobQueue.queued
+    assert stored["error"] == "browser crashed"
+    assert "lease" not in stored
+    # mongomock stores datetimes with millisecond precision
+    assert start + timedelta(seconds=600, milliseconds=-1) <= stored["notBefore"] <= end + timedelta(seconds=600)
+    assert locks.find_one({"_id": "p"}) is None
+    # the job is not due before retrySeconds have passed
+    assert queue.claim() is None
+
+
+def test_queuedJobUsesProfileOfJob(client, monkeypatch):
+    pytest.importorskip("selenium")
+    # config.py is created per installation, a minimal one is enough for main
+    configPackage = types.ModuleType("config")
+    configModule = types.ModuleType("config.config")
+    configModule.config = {"profilePath": "profiles", "userAgent": "agent", "profileName": "configured"}
+    websiteList = types.ModuleType("config.websiteList")
+    websiteList.sessions = []
+    monkeypatch.setitem(sys.modules, "config", configPackage)
+    monkeypatch.setitem(sys.modules, "config.config", configModule)
+    monkeypatch.setitem(sys.modules, "config.websiteList", websiteList)
+    monkeypatch.delitem(sys.modules, "main", raising=False)
+    import main
+
+    browsers = []
+
+    class personalizer:
+        def __init__(self, profilePath, userAgent, profileName, screenshotStoreInstance=None):
+            browsers.append(profileName)
+            self.closed = False
+
+        def forceClose(self):
+            self.closed = True
+
+        def closeDriver(self):
+            self.closed = True
+
+        def saveProfile(self):
+            pass
+
+        def getGoogleAdProfile(self):
+            return {"time": datetime.utcnow(), "html": "<p></p>", "profil": browsers[-1]}
+
+    class databaseInterface:
+        profileName = "configured"
+
+        def forProfile(self, profileName):
+            instance = databaseInterface()
+            instance.profileName = profileName
+            return instance
+
+        def savePersonalizationProfile(self, adProfileHtml, sessionNr):
+            return None
+
+    databaseInterface.client = client
+    monkeypatch.setattr(main.personalizer, "personalizer", personalizer)
+    # the worker executes one job instead of serving until it is stopped
+    monkeypatch.setattr(jobQueue.queueWorker, "serve", lambda self: self.runJob(self.queue.claim()))
+    jobId = jobQueue.enqueue(client, "testPersonalization", profileName="other")
+
+    main.queueWorker(databaseInterface())
+    assert browsers == ["other"]
+    assert client[jobQueue.queueDatabase][jobQueue.queueCollection].find_one({"_id": jobId})["state"] == jobQueue.done